@@ -1,10 +1,13 @@
-from typing import Dict, Any, List
-from sqlmodel import Session, select
-from app.oauth_models import Area, Service
-from app.action import Action
-from app.reaction import Reaction
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Tuple
+from sqlmodel import Session
+from app.oauth_models import Area
 from app.db import engine
 from app.executors.base import execute_reaction
+from app.concurrency import execution_limiter
+from app.trigger_index import trigger_index, IndexedArea
+from app.area_loader import load_area_relations_map
+from app.area_templates import compile_params, compile_path, compile_template, render_params, render_template, resolve_path
 import asyncio
 import re
 
@@ -25,98 +28,101 @@ def action_name_to_key(name: str) -> str:
     return key
 
 
-async def trigger_areas_with_handlers(service: str, event_type: str, payload: Dict[str, Any]):
+@dataclass
+class AreaOutcome:
+    area_id: int
+    status: str
+    error: Optional[str] = None
+    job_id: Optional[int] = None
+
+
+async def enqueue_areas_with_handlers(service: str, event_type: str, payload: Dict[str, Any]) -> List[AreaOutcome]:
+    from app.reaction_queue import enqueue_jobs
+
     with Session(engine) as session:
-        service_obj = session.exec(select(Service).where(Service.name == service)).first()
-        
-        if not service_obj:
-            print(f"Service {service} not found")
-            return
-
-        all_actions = session.exec(
-            select(Action).where(Action.service_id == service_obj.id)
-        ).all()
-
-        matching_actions = [
-            action for action in all_actions 
-            if action_name_to_key(action.name) == event_type
-        ]
-        
-        if not matching_actions:
-            print(f"No actions found for {service}.{event_type}")
-            return
+        areas = trigger_index.lookup(session, service, event_type, payload)
+        matched = [area for area in areas if check_action_conditions(area.params_action, payload)]
 
-        for action in matching_actions:
-            areas = session.exec(
-                select(Area).where(
-                    Area.action_id == action.id, 
-                    Area.is_active == True
-                )
-            ).all()
+        if not matched:
+            print(f"No matching areas for {service}.{event_type}")
+            return []
 
-            for area in areas:
-                await execute_area(session, area, payload)
+        jobs = enqueue_jobs(session, [(area, payload) for area in matched])
 
+    print(f"Queued {len(jobs)} reaction jobs for {service}.{event_type}")
+    return [AreaOutcome(area_id=job.area_id, status="queued", job_id=job.id) for job in jobs]
 
-async def trigger_areas(service: str, event_type: str, payload: Dict[str, Any]):
-    with Session(engine) as session:
-        service_obj = session.exec(select(Service).where(Service.name == service)).first()
-        
-        if not service_obj:
-            return
 
-        actions = session.exec(select(Action).where(Action.service_id == service_obj.id, Action.name == event_type)).all()
-        
-        for action in actions:
-            areas = session.exec(select(Area).where(Area.action_id == action.id, Area.is_active == True)).all()
+async def execute_areas_concurrently(executions: List[Tuple[IndexedArea, Dict[str, Any]]]) -> List[AreaOutcome]:
+    async def run(area: IndexedArea, trigger_data: Dict[str, Any]) -> AreaOutcome:
+        try:
+            async with execution_limiter.slot(area.reaction_service_name):
+                # Executors load their account, then token_manager releases
+                # the connection before the provider call.
+                with Session(engine, expire_on_commit=False) as session:
+                    return await execute_indexed_area(session, area, trigger_data)
+        except Exception as e:
+            print(f"Error executing AREA {area.id}: {str(e)}")
+            return AreaOutcome(area_id=area.id, status="failed", error=str(e))
 
-            for area in areas:
-                await execute_area(session, area, payload)
+    if not executions:
+        return []
+    return list(await asyncio.gather(*(run(area, trigger_data) for area, trigger_data in executions)))
 
-async def execute_area(session: Session, area: Area, trigger_data: Dict[str, Any]):
-    try:
-        reaction = session.get(Reaction, area.reaction_id)
-        if not reaction:
-            print(f"Reaction not found for AREA {area.id}")
-            return
 
-        reaction_service = session.get(Service, area.reaction_service_id)
-        if not reaction_service:
-            print(f"Service not found for AREA {area.id}")
-            return
+def index_areas(session: Session, area_ids: List[int], active_only: bool = False) -> Dict[int, IndexedArea]:
+    return {
+        area_id: IndexedArea.from_models(relations.area, relations.reaction, relations.reaction_service)
+        for area_id, relations in load_area_relations_map(session, area_ids, active_only=active_only).items()
+    }
+
+
+def index_area(session: Session, area: Area) -> Optional[IndexedArea]:
+    indexed_area = index_areas(session, [area.id]).get(area.id)
+    if not indexed_area:
+        print(f"Reaction or service not found for AREA {area.id}")
+    return indexed_area
+
+
+async def execute_area(session: Session, area: Area, trigger_data: Dict[str, Any]) -> AreaOutcome:
+    indexed_area = index_area(session, area)
+    if not indexed_area:
+        return AreaOutcome(area_id=area.id, status="failed", error="Reaction or service not found")
+
+    return await execute_indexed_area(session, indexed_area, trigger_data)
+
 
+async def execute_indexed_area(session: Session, area: IndexedArea, trigger_data: Dict[str, Any]) -> AreaOutcome:
+    try:
         print(f"Checking conditions for AREA {area.id}: {area.name}")
         if not check_action_conditions(area.params_action, trigger_data):
             print(f"Conditions not met, skipping AREA {area.id}")
-            return
+            return AreaOutcome(area_id=area.id, status="skipped")
 
         print(f"Conditions met, interpolating parameters")
-        reaction_params = interpolate_parameters(
-            area.params_reaction,
-            trigger_data
-        )
+        reaction_params = render_params(area.reaction_templates, trigger_data)
 
         print(f"Executing AREA {area.id}: {area.name}")
-        print(f"Reaction: {reaction_service.name}.{reaction.name}")
+        print(f"Reaction: {area.reaction_service_name}.{area.reaction_name}")
         print(f"Parameters: {reaction_params}")
-
-        reaction_key = reaction_name_to_key(reaction.name)
-        print(f"Executor key: {reaction_key}")
+        print(f"Executor key: {area.reaction_key}")
 
         await execute_reaction(
-            service_name=reaction_service.name,
-            reaction_key=reaction_key,
+            service_name=area.reaction_service_name,
+            reaction_key=area.reaction_key,
             user_id=area.user_id,
             parameters=reaction_params,
             session=session
         )
 
         print(f"AREA {area.id} executed successfully !!!!!!")
+        return AreaOutcome(area_id=area.id, status="executed")
         
     except Exception as e:
         print(f"Error executing AREA {area.id}: {str(e)}")
         import traceback
         traceback.print_exc()
+        return AreaOutcome(area_id=area.id, status="failed", error=str(e))
 
 def check_action_conditions(params: Dict[str, Any], data: Dict[str, Any]) -> bool:
     for key, expected_value in params.items():
@@ -135,70 +141,13 @@ def check_action_conditions(params: Dict[str, Any], data: Dict[str, Any]) -> boo
     return True
 
 def interpolate_parameters(params: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
-    # print("ABOUT TO BE INTERPOLATED : ", data)
-
-    import re
-    
-    result = {}
-    for key, value in params.items():
-        if isinstance(value, str):
-            if "{{" in value and "}}" in value:
-                def replace_var(match):
-                    var_path = match.group(1).strip()
-                    var_value = get_nested_value(data, var_path)
-                    return str(var_value) if var_value is not None else ""
-                
-                result[key] = re.sub(r'\{\{([^}]+)\}\}', replace_var, value)
-            else:
-                result[key] = value
-        elif isinstance(value, list):
-            result[key] = [
-                interpolate_single_value(item, data) if isinstance(item, str) else item
-                for item in value
-            ]
-        else:
-            result[key] = value
-    
-    return result
+    return render_params(compile_params(params), data)
 
 def interpolate_single_value(value: str, data: Dict[str, Any]) -> str:
-    import re
-    
-    if "{{" not in value or "}}" not in value:
-        return value
-    
-    def replace_var(match):
-        var_path = match.group(1).strip()
-        var_value = get_nested_value(data, var_path)
-        return str(var_value) if var_value is not None else ""
-    
-    return re.sub(r'\{\{([^}]+)\}\}', replace_var, value)
+    return render_template(compile_template(value), data)
 
 def get_nested_value(data: Dict, path: str) -> Any:
-    import re
-
     if path in data:
         return data[path]
 
-    components = re.split(r'[\.\[]', path)
-    value = data
-    
-    for component in components:
-        if not component:
-            continue
-
-        if component.endswith(']'):
-            index = int(component[:-1])
-            if isinstance(value, list) and 0 <= index < len(value):
-                value = value[index]
-            else:
-                return None
-        elif isinstance(value, dict):
-            value = value.get(component)
-        else:
-            return None
-        
-        if value is None:
-            return None
-    
-    return value
\ No newline at end of file
+    return resolve_path(data, path, compile_path(path))
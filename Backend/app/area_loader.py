@@ -0,0 +1,62 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, select
+
+from app.oauth_models import Area, Service
+from app.action import Action
+from app.reaction import Reaction
+
+
+@dataclass
+class AreaRelations:
+    area: Area
+    action: Action
+    action_service: Service
+    reaction: Reaction
+    reaction_service: Service
+
+
+# One joined query for the Action/Reaction/Service rows of a set of areas.
+# Areas whose action, reaction or services are missing are left out.
+def load_area_relations(
+    session: Session,
+    area_ids: Optional[Iterable[int]] = None,
+    user_id: Optional[int] = None,
+    active_only: bool = False,
+    updated_since: Optional[datetime] = None,
+) -> List[AreaRelations]:
+    action_service = aliased(Service)
+    reaction_service = aliased(Service)
+    statement = (
+        select(Area, Action, action_service, Reaction, reaction_service)
+        .join(Action, Action.id == Area.action_id)
+        .join(action_service, action_service.id == Area.action_service_id)
+        .join(Reaction, Reaction.id == Area.reaction_id)
+        .join(reaction_service, reaction_service.id == Area.reaction_service_id)
+        .order_by(Area.id)
+    )
+    if area_ids is not None:
+        area_ids = list(area_ids)
+        if not area_ids:
+            return []
+        statement = statement.where(Area.id.in_(area_ids))
+    if user_id is not None:
+        statement = statement.where(Area.user_id == user_id)
+    if active_only:
+        statement = statement.where(Area.is_active == True)
+    if updated_since is not None:
+        statement = statement.where(Area.updated_at >= updated_since)
+
+    return [
+        AreaRelations(area, action, a_service, reaction, r_service)
+        for area, action, a_service, reaction, r_service in session.exec(statement).all()
+    ]
+
+
+def load_area_relations_map(session: Session, area_ids: Iterable[int], active_only: bool = False) -> Dict[int, AreaRelations]:
+    return {
+        relations.area.id: relations
+        for relations in load_area_relations(session, area_ids=area_ids, active_only=active_only)
+    }
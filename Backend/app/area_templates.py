@@ -0,0 +1,145 @@
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple, Union
+import os
+import re
+import threading
+
+TEMPLATE_PATTERN = re.compile(r'\{\{([^}]+)\}\}')
+PATH_SEPARATOR = re.compile(r'[\.\[]')
+
+Path = Tuple[Union[str, int], ...]
+Variable = Tuple[str, Optional[Path]]
+Segments = Tuple[Union[str, Variable], ...]
+
+PATH_CACHE_SIZE = int(os.getenv("AREA_PATH_CACHE_SIZE", "1024"))
+
+
+# "commits[0].author.name" -> ("commits", 0, "author", "name"), None if an index is not an int
+@lru_cache(maxsize=PATH_CACHE_SIZE)
+def compile_path(path: str) -> Optional[Path]:
+    steps: List[Union[str, int]] = []
+    for component in PATH_SEPARATOR.split(path):
+        if not component:
+            continue
+        if component.endswith(']'):
+            try:
+                steps.append(int(component[:-1]))
+            except ValueError:
+                return None
+        else:
+            steps.append(component)
+    return tuple(steps)
+
+
+def resolve_path(data: Dict, path: str, steps: Optional[Path]) -> Any:
+    if path in data:
+        return data[path]
+    if steps is None:
+        return None
+
+    value = data
+    for step in steps:
+        if type(step) is int:
+            if isinstance(value, list) and 0 <= step < len(value):
+                value = value[step]
+            else:
+                return None
+        elif isinstance(value, dict):
+            value = value.get(step)
+        else:
+            return None
+
+        if value is None:
+            return None
+
+    return value
+
+
+@lru_cache(maxsize=4096)
+def compile_template(value: str) -> Segments:
+    if "{{" not in value or "}}" not in value:
+        return (value,)
+
+    segments: List[Union[str, Variable]] = []
+    position = 0
+    for match in TEMPLATE_PATTERN.finditer(value):
+        if match.start() > position:
+            segments.append(value[position:match.start()])
+        var_path = match.group(1).strip()
+        segments.append((var_path, compile_path(var_path)))
+        position = match.end()
+    if position < len(value):
+        segments.append(value[position:])
+    return tuple(segments)
+
+
+def render_template(segments: Segments, data: Dict[str, Any]) -> str:
+    if len(segments) == 1 and type(segments[0]) is str:
+        return segments[0]
+
+    parts = []
+    for segment in segments:
+        if type(segment) is str:
+            parts.append(segment)
+        else:
+            var_value = resolve_path(data, segment[0], segment[1])
+            if var_value is not None:
+                parts.append(str(var_value))
+    return "".join(parts)
+
+
+# (key, kind, compiled) where kind is "template", "list" or "raw"
+CompiledParams = Tuple[Tuple[str, str, Any], ...]
+
+
+def compile_params(params: Dict[str, Any]) -> CompiledParams:
+    compiled = []
+    for key, value in (params or {}).items():
+        if isinstance(value, str):
+            compiled.append((key, "template", compile_template(value)))
+        elif isinstance(value, list):
+            compiled.append((key, "list", [
+                compile_template(item) if isinstance(item, str) else item
+                for item in value
+            ]))
+        else:
+            compiled.append((key, "raw", value))
+    return tuple(compiled)
+
+
+def render_params(compiled: CompiledParams, data: Dict[str, Any]) -> Dict[str, Any]:
+    result = {}
+    for key, kind, value in compiled:
+        if kind == "template":
+            result[key] = render_template(value, data)
+        elif kind == "list":
+            result[key] = [
+                render_template(item, data) if type(item) is tuple else item
+                for item in value
+            ]
+        else:
+            result[key] = value
+    return result
+
+
+_area_templates: Dict[int, Tuple[Dict[str, Any], CompiledParams]] = {}
+_area_templates_lock = threading.Lock()
+
+
+def get_area_templates(area_id: Optional[int], params: Dict[str, Any]) -> CompiledParams:
+    if area_id is None:
+        return compile_params(params)
+
+    cached = _area_templates.get(area_id)
+    if cached is not None and cached[0] == params:
+        return cached[1]
+
+    compiled = compile_params(params)
+    with _area_templates_lock:
+        _area_templates[area_id] = (dict(params), compiled)
+    return compiled
+
+
+def invalidate_area_templates(area_id: int) -> None:
+    with _area_templates_lock:
+        _area_templates.pop(area_id, None)
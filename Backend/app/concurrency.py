@@ -0,0 +1,73 @@
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+import asyncio
+import os
+
+
+def parse_limits(raw: Optional[str]) -> Dict[str, int]:
+    limits = {}
+    for item in (raw or "").split(","):
+        if "=" not in item:
+            continue
+        key, value = item.split("=", 1)
+        try:
+            limits[key.strip().lower()] = int(value)
+        except ValueError:
+            print(f"Ignoring invalid concurrency limit: {item}")
+    return limits
+
+
+# Global limit plus one limit per key (usually a provider name).
+# Semaphores are created lazily so they bind to the loop that uses them.
+class ConcurrencyLimiter:
+    def __init__(self, global_limit: int, default_key_limit: int, key_limits: Optional[Dict[str, int]] = None):
+        self.global_limit = global_limit
+        self.default_key_limit = default_key_limit
+        self.key_limits = key_limits or {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._global: Optional[asyncio.Semaphore] = None
+        self._per_key: Dict[str, asyncio.Semaphore] = {}
+        self.in_flight = 0
+        self.waiting = 0
+
+    def _semaphores(self, key: str):
+        loop = asyncio.get_event_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._global = asyncio.Semaphore(self.global_limit)
+            self._per_key = {}
+
+        semaphore = self._per_key.get(key)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.key_limits.get(key, self.default_key_limit))
+            self._per_key[key] = semaphore
+        return self._global, semaphore
+
+    @asynccontextmanager
+    async def slot(self, key: str):
+        global_semaphore, key_semaphore = self._semaphores(key.lower())
+        self.waiting += 1
+        try:
+            await key_semaphore.acquire()
+            try:
+                await global_semaphore.acquire()
+            except BaseException:
+                key_semaphore.release()
+                raise
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            global_semaphore.release()
+            key_semaphore.release()
+
+
+execution_limiter = ConcurrencyLimiter(
+    global_limit=int(os.getenv("AREA_EXECUTION_CONCURRENCY", "32")),
+    default_key_limit=int(os.getenv("AREA_PROVIDER_CONCURRENCY", "8")),
+    key_limits=parse_limits(os.getenv("AREA_PROVIDER_CONCURRENCY_LIMITS")),
+)
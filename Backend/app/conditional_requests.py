@@ -0,0 +1,75 @@
+from typing import Dict, Any, Optional
+from urllib.parse import urlencode
+from sqlmodel import Session
+import hashlib
+import httpx
+
+from app.poll_state import poll_state_store
+
+
+class ConditionalStats:
+    def __init__(self):
+        self.requests: Dict[str, int] = {}
+        self.not_modified: Dict[str, int] = {}
+
+    def record(self, handler_key: str, not_modified: bool) -> None:
+        self.requests[handler_key] = self.requests.get(handler_key, 0) + 1
+        if not_modified:
+            self.not_modified[handler_key] = self.not_modified.get(handler_key, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            handler_key: {
+                "requests": total,
+                "not_modified": self.not_modified.get(handler_key, 0),
+                "hit_ratio": self.not_modified.get(handler_key, 0) / total,
+            }
+            for handler_key, total in self.requests.items()
+        }
+
+
+conditional_stats = ConditionalStats()
+
+
+def validator_key(handler_key: str, account_id: Any, url: str, params: Optional[Dict[str, Any]] = None) -> str:
+    query = urlencode(sorted((params or {}).items()), doseq=True)
+    digest = hashlib.sha1(f"{url}?{query}".encode("utf-8")).hexdigest()
+    return f"validators:{handler_key}:{account_id}:{digest}"
+
+
+# GET with If-None-Match / If-Modified-Since built from the validators of the
+# last 200 for the same (handler, account, URL). Validators live in the poll
+# state store, so they are persisted and handed over with the poll cursors.
+# Callers treat a 304 as "nothing changed since the last poll".
+async def conditional_get(
+    session: Session,
+    client: httpx.AsyncClient,
+    handler_key: str,
+    account_id: Any,
+    url: str,
+    params: Optional[Dict[str, Any]] = None,
+    headers: Optional[Dict[str, str]] = None,
+    timeout: Any = httpx.USE_CLIENT_DEFAULT,
+) -> httpx.Response:
+    key = validator_key(handler_key, account_id, url, params)
+    validators = poll_state_store.get(session, key) or {}
+
+    request_headers = dict(headers or {})
+    if validators.get("etag"):
+        request_headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        request_headers["If-Modified-Since"] = validators["last_modified"]
+
+    response = await client.get(url, headers=request_headers, params=params, timeout=timeout)
+    conditional_stats.record(handler_key, response.status_code == 304)
+
+    if response.status_code == 200:
+        current = {
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+        }
+        if any(current.values()) and current != validators:
+            poll_state_store.put(key, current)
+        elif validators and not any(current.values()):
+            poll_state_store.put(key, {})
+    return response
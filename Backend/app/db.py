@@ -4,12 +4,14 @@ from fastapi import Depends, FastAPI, HTTPException, Query
 from sqlmodel import Field, Session, SQLModel, create_engine, select
 
 POSTGRESQL_URI = str(os.environ.get("POSTGRESQL_URI"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
 
 engine = create_engine(
     POSTGRESQL_URI,
     pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
     pool_recycle=3600,
     connect_args={
         "connect_timeout": 10,
@@ -23,6 +25,15 @@ def get_session():
 
 SessionDep = Annotated[Session, Depends(get_session)]
 
+
+# Pollers and executors await provider calls with a session in hand. They
+# open it with expire_on_commit=False and release it before each call, so
+# the connection goes back to the pool while the rows already loaded stay
+# usable; the next query checks a connection out again.
+def release_connection(session: Session) -> None:
+    if session.in_transaction():
+        session.commit()
+
 import yaml
 
 def scan_yaml_files(base_dir):
@@ -178,6 +189,10 @@ def create_db_tables():
     )
     from app.action import Action
     from app.reaction import Reaction
+    from app.reaction_queue import ReactionJob
+    from app.delivery_dedup import WebhookDelivery
+    from app.poll_state import PollState
+    from app.poll_partitions import PollPartition, PollWorker
     
     SQLModel.metadata.create_all(engine)
     with Session(engine) as session:
@@ -0,0 +1,166 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Any
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Field, Session, SQLModel, delete
+import hashlib
+import os
+import threading
+import time
+
+WEBHOOK_DEDUP_TTL = int(os.getenv("WEBHOOK_DEDUP_TTL", "86400"))
+WEBHOOK_DEDUP_MEMORY_SIZE = int(os.getenv("WEBHOOK_DEDUP_MEMORY_SIZE", "50000"))
+WEBHOOK_DEDUP_PURGE_INTERVAL = int(os.getenv("WEBHOOK_DEDUP_PURGE_INTERVAL", "3600"))
+
+
+class WebhookDelivery(SQLModel, table=True):
+    __tablename__ = "webhook_deliveries"
+
+    delivery_key: str = Field(primary_key=True)
+    provider: str = Field(index=True)
+    received_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: datetime = Field(index=True)
+
+
+def body_delivery_id(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+
+# INSERT ... ON CONFLICT DO UPDATE ... WHERE expires_at < now RETURNING key:
+# a row comes back only when the key was new or had expired, so accepting a
+# delivery is a single atomic statement across processes.
+def claim_statement(dialect: str, row: Dict[str, Any], now: datetime):
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    table = WebhookDelivery.__table__
+    statement = insert(table).values(row)
+    return statement.on_conflict_do_update(
+        index_elements=["delivery_key"],
+        set_={"received_at": statement.excluded.received_at, "expires_at": statement.excluded.expires_at},
+        where=table.c.expires_at < now,
+    ).returning(table.c.delivery_key)
+
+
+# Two tiers: an in-process TTL set answers replays without any I/O, the
+# webhook_deliveries table catches replays that land on another process or
+# after a restart. Keys are "<provider>:<delivery id>".
+class DeliveryDeduplicator:
+    def __init__(self, ttl: int = WEBHOOK_DEDUP_TTL, memory_size: int = WEBHOOK_DEDUP_MEMORY_SIZE):
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def _remember(self, key: str) -> None:
+        with self._lock:
+            self._seen[key] = time.monotonic() + self.ttl
+            self._seen.move_to_end(key)
+            while len(self._seen) > self.memory_size:
+                self._seen.popitem(last=False)
+
+    def _in_memory(self, key: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            while self._seen:
+                if next(iter(self._seen.values())) > now:
+                    break
+                self._seen.popitem(last=False)
+            return key in self._seen
+
+    def is_duplicate(self, session: Session, provider: str, delivery_id: str) -> bool:
+        key = f"{provider}:{delivery_id}"
+        if self._in_memory(key):
+            self.memory_hits += 1
+            return True
+
+        now = datetime.utcnow()
+        row = {
+            "delivery_key": key,
+            "provider": provider,
+            "received_at": now,
+            "expires_at": now + timedelta(seconds=self.ttl),
+        }
+        try:
+            statement = claim_statement(session.get_bind().dialect.name, row, now)
+            if statement is not None:
+                accepted = session.execute(statement).first() is not None
+                session.commit()
+            else:
+                accepted = self._claim_without_upsert(session, row, now)
+            if not accepted:
+                self.db_hits += 1
+                self._remember(key)
+                return True
+        except Exception as e:
+            session.rollback()
+            print(f"Webhook dedup store unavailable, accepting delivery {key}: {e}")
+
+        self.misses += 1
+        self._remember(key)
+        self._purge_expired(session)
+        return False
+
+    def _claim_without_upsert(self, session: Session, row: Dict[str, Any], now: datetime) -> bool:
+        try:
+            session.add(WebhookDelivery(**row))
+            session.commit()
+            return True
+        except IntegrityError:
+            session.rollback()
+        existing = session.get(WebhookDelivery, row["delivery_key"], populate_existing=True)
+        if existing is not None and existing.expires_at > now:
+            return False
+        if existing is not None:
+            existing.received_at = row["received_at"]
+            existing.expires_at = row["expires_at"]
+            session.add(existing)
+            session.commit()
+        return True
+
+    def forget(self, session: Session, provider: str, delivery_id: str) -> None:
+        key = f"{provider}:{delivery_id}"
+        with self._lock:
+            self._seen.pop(key, None)
+        try:
+            session.exec(delete(WebhookDelivery).where(WebhookDelivery.delivery_key == key))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            print(f"Could not forget webhook delivery {key}: {e}")
+
+    def _purge_expired(self, session: Session) -> None:
+        if time.monotonic() - self._last_purge < WEBHOOK_DEDUP_PURGE_INTERVAL:
+            return
+        self._last_purge = time.monotonic()
+        try:
+            session.exec(delete(WebhookDelivery).where(WebhookDelivery.expires_at < datetime.utcnow()))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            print(f"Webhook dedup purge failed: {e}")
+
+    def clear_memory(self) -> None:
+        with self._lock:
+            self._seen.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.memory_hits + self.db_hits
+        total = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "memory_entries": len(self._seen),
+        }
+
+
+delivery_deduplicator = DeliveryDeduplicator()
@@ -1,6 +1,7 @@
 from typing import Any, Dict, Optional
 from app.executors.base import BaseExecutor
 from app.oauth_models import ServiceAccount, Service
+from app.http_clients import provider_client
 from sqlmodel import Session, select
 import httpx
 from fastapi import HTTPException
@@ -31,12 +32,11 @@ class DiscordSendWebhookMessageExecutor(BaseExecutor):
         if avatar_url:
             payload["avatar_url"] = avatar_url
 
-        async with httpx.AsyncClient() as client:
+        async with provider_client("discord") as client:
             try:
                 response = await client.post(
                     webhook_url,
                     json=payload,
-                    timeout=30.0
                 )
                 
                 if response.status_code in [200, 204]:
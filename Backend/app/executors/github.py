@@ -1,6 +1,8 @@
 from typing import Any, Dict, Optional
 from app.executors.base import BaseExecutor
 from app.oauth_models import ServiceAccount, Service
+from app.http_clients import provider_client
+from app.token_manager import token_manager
 from sqlmodel import Session, select
 import httpx
 from fastapi import HTTPException
@@ -28,6 +30,7 @@ class BaseGitHubExecutor(BaseExecutor):
                 detail="User not connected to GitHub"
             )
         
+        await token_manager.ensure_valid(session, service_account)
         return service_account
     
     async def _make_github_request(self, method: str, url: str, access_token: str, json_data: Optional[Dict] = None) -> Dict[str, Any]:
@@ -38,14 +41,13 @@ class BaseGitHubExecutor(BaseExecutor):
             "X-GitHub-Api-Version": "2022-11-28"
         }
         
-        async with httpx.AsyncClient() as client:
+        async with provider_client("github") as client:
             try:
                 response = await client.request(
                     method=method,
                     url=url,
                     headers=headers,
                     json=json_data,
-                    timeout=30.0
                 )
                 
                 if response.status_code in [200, 201]:
@@ -1,6 +1,8 @@
 from typing import Any, Dict, Optional
 from app.executors.base import BaseExecutor
 from app.oauth_models import ServiceAccount, Service
+from app.http_clients import provider_client
+from app.token_manager import token_manager
 from sqlmodel import Session, select
 import httpx
 from fastapi import HTTPException
@@ -30,6 +32,7 @@ class BaseGoogleExecutor(BaseExecutor):
                 detail="User not connected to Google"
             )
         
+        await token_manager.ensure_valid(session, service_account)
         return service_account
     
     async def _make_google_request(self, method: str, url: str, access_token: str, json_data: Optional[Dict] = None, params: Optional[Dict] = None) -> Dict[str, Any]:
@@ -38,7 +41,7 @@ class BaseGoogleExecutor(BaseExecutor):
             "Content-Type": "application/json",
         }
         
-        async with httpx.AsyncClient() as client:
+        async with provider_client("google") as client:
             try:
                 response = await client.request(
                     method=method,
@@ -46,7 +49,6 @@ class BaseGoogleExecutor(BaseExecutor):
                     headers=headers,
                     json=json_data,
                     params=params,
-                    timeout=30.0
                 )
                 
                 if response.status_code in [200, 201, 204]:
@@ -1,6 +1,8 @@
 from typing import Any, Dict
 from app.executors.base import BaseExecutor
 from app.oauth_models import ServiceAccount, Service
+from app.http_clients import provider_client
+from app.token_manager import token_manager
 from sqlmodel import Session, select
 import httpx
 from fastapi import HTTPException
@@ -41,14 +43,14 @@ class SpotifyCreatePlaylistExecutor(BaseExecutor):
                 detail="Spotify account not connected"
             )
 
-        async with httpx.AsyncClient() as client:
+        await token_manager.ensure_valid(session, service_account)
+        async with provider_client("spotify") as client:
             try:
                 user_response = await client.get(
                     "https://api.spotify.com/v1/me",
                     headers={
                         "Authorization": f"Bearer {service_account.access_token}",
                     },
-                    timeout=30.0
                 )
                 
                 if user_response.status_code != 200:
@@ -70,7 +72,6 @@ class SpotifyCreatePlaylistExecutor(BaseExecutor):
                         "description": description,
                         "public": public,
                     },
-                    timeout=30.0
                 )
                 
                 if response.status_code in [200, 201]:
@@ -142,7 +143,8 @@ class SpotifyAddTrackToPlaylistExecutor(BaseExecutor):
                 detail="Spotify account not connected"
             )
         
-        async with httpx.AsyncClient() as client:
+        await token_manager.ensure_valid(session, service_account)
+        async with provider_client("spotify") as client:
             try:
                 response = await client.post(
                     f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks",
@@ -153,7 +155,6 @@ class SpotifyAddTrackToPlaylistExecutor(BaseExecutor):
                     json={
                         "uris": [track_uri],
                     },
-                    timeout=30.0
                 )
                 
                 if response.status_code == 201:
@@ -1,6 +1,8 @@
 from typing import Any, Dict, Optional
 from app.executors.base import BaseExecutor
 from app.oauth_models import ServiceAccount, Service
+from app.http_clients import provider_client
+from app.token_manager import token_manager
 from sqlmodel import Session, select
 import httpx
 from fastapi import HTTPException
@@ -36,6 +38,7 @@ class BaseTrelloExecutor(BaseExecutor):
                 detail="User not connected to Trello"
             )
         
+        await token_manager.ensure_valid(session, service_account)
         return api_key, service_account
     
     async def _make_trello_request(self, method: str,  url: str, api_key: str, token: str, json_data: Optional[Dict] = None, extra_params: Optional[Dict] = None) -> Dict[str, Any]:
@@ -43,14 +46,13 @@ class BaseTrelloExecutor(BaseExecutor):
         if extra_params:
             params.update(extra_params)
         
-        async with httpx.AsyncClient() as client:
+        async with provider_client("trello") as client:
             try:
                 response = await client.request(
                     method=method,
                     url=url,
                     params=params,
                     json=json_data,
-                    timeout=30.0
                 )
                 
                 if response.status_code in [200, 201]:
@@ -1,7 +1,8 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Union
 from sqlmodel import Session
 from dataclasses import dataclass
+import json
 
 @dataclass
 class ActionResult:
@@ -10,6 +11,32 @@ class ActionResult:
     payload: Dict[str, Any]
     error: Optional[str] = None
 
+
+def poll_results(result: Union[ActionResult, List[ActionResult], None]) -> List[ActionResult]:
+    if result is None:
+        return []
+    if isinstance(result, ActionResult):
+        result = [result]
+    return [item for item in result if item.triggered]
+
+# Scheduling hints stored next to the action params; they never change what
+# is fetched upstream.
+SCHEDULING_PARAMS = ("poll_min_interval", "poll_max_interval")
+
+
+def normalize_params(params: Optional[Dict[str, Any]]) -> str:
+    normalized = {}
+    for key, value in (params or {}).items():
+        if key in SCHEDULING_PARAMS:
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+        if value is None or value == "":
+            continue
+        normalized[key] = value
+    return json.dumps(normalized, sort_keys=True, default=str)
+
+
 class BaseActionHandler(ABC):
     @property
     @abstractmethod
@@ -32,6 +59,11 @@ class BaseActionHandler(ABC):
     async def matches_conditions(self, params: Dict[str, Any], payload: Dict[str, Any]) -> bool:
         return True
 
+    # Lets a handler whose feed serves areas with different params tailor
+    # the shared payload to each area before it is executed.
+    def payload_for_area(self, params: Dict[str, Any], payload: Dict[str, Any]) -> Dict[str, Any]:
+        return payload
+
     def extract_trigger_data(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         return payload
 
@@ -54,12 +86,26 @@ class BasePollingHandler(BaseActionHandler):
     def polling_interval(self) -> int:
         return 60
     
+    # Returns every new item since the last poll, oldest first.
     @abstractmethod
-    async def poll(self, session: Session, user_id: int, params: Dict[str, Any]) -> Optional[ActionResult]:
+    async def poll(self, session: Session, user_id: int, params: Dict[str, Any]) -> List[ActionResult]:
         pass
 
-    async def get_last_state(self, session: Session, area_id: int) -> Optional[Dict[str, Any]]:
-        return None
+    # Areas with the same key share one upstream poll per interval. The
+    # default only merges areas of one user whose params are equivalent;
+    # handlers whose request ignores some params should narrow it.
+    def coalescing_key(self, user_id: int, params: Dict[str, Any]) -> str:
+        return f"{self.service_name}:{self.action_type}:{user_id}:{normalize_params(params)}"
 
-    async def save_state(self, session: Session, area_id: int, state: Dict[str, Any]) -> None:
-        pass
+    # State is stored per scope, usually the coalescing key or a narrower id
+    # such as (user, playlist), and namespaced by service and action.
+    def state_key(self, scope: Any) -> str:
+        return f"{self.service_name}:{self.action_type}:{scope}"
+
+    async def get_last_state(self, session: Session, scope: Any) -> Optional[Dict[str, Any]]:
+        from app.poll_state import poll_state_store
+        return poll_state_store.get(session, self.state_key(scope))
+
+    async def save_state(self, session: Session, scope: Any, state: Dict[str, Any]) -> None:
+        from app.poll_state import poll_state_store
+        poll_state_store.put(self.state_key(scope), state)
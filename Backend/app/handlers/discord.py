@@ -1,16 +1,17 @@
 from typing import Dict, Any, Optional, List
 from sqlmodel import Session, select
-import httpx
 import hmac
 import hashlib
 import os
 
 from app.handlers.base import BaseWebhookHandler, ActionResult, BasePollingHandler
+from app.poll_feedback import observe_response
+from app.conditional_requests import conditional_get
 from app.oauth_models import ServiceAccount, Service
+from app.http_clients import provider_client
+from app.token_manager import token_manager
 
 class DiscordUserProfileChangeHandler(BasePollingHandler):
-    _user_profile_cache: Dict[int, Dict[str, str]] = {}
-    
     @property
     def service_name(self) -> str:
         return "discord"
@@ -30,13 +31,16 @@ class DiscordUserProfileChangeHandler(BasePollingHandler):
             payload=raw_payload
         )
 
-    async def poll(self, session: Session, user_id: int, params: Dict[str, Any]) -> Optional[ActionResult]:
+    def coalescing_key(self, user_id: int, params: Dict[str, Any]) -> str:
+        return f"{self.service_name}:{self.action_type}:{user_id}"
+
+    async def poll(self, session: Session, user_id: int, params: Dict[str, Any]) -> List[ActionResult]:
         discord_service = session.exec(
             select(Service).where(Service.name == "discord")
         ).first()
         
         if not discord_service:
-            return None
+            return []
 
         service_account = session.exec(
             select(ServiceAccount).where(
@@ -47,21 +51,29 @@ class DiscordUserProfileChangeHandler(BasePollingHandler):
         ).first()
         
         if not service_account:
-            return None
+            return []
+        await token_manager.ensure_valid(session, service_account)
         
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
+            async with provider_client("discord") as client:
+                response = await conditional_get(
+                    session,
+                    client,
+                    f"{self.service_name}.{self.action_type}",
+                    service_account.id,
                     "https://discord.com/api/v10/users/@me",
                     headers={
                         "Authorization": f"Bearer {service_account.access_token}",
                     },
-                    timeout=30.0
                 )
+                observe_response(response)
+                
+                if response.status_code == 304:
+                    return []
                 
                 if response.status_code != 200:
                     print(f"Discord API error getting user profile: {response.status_code} - {response.text}")
-                    return None
+                    return []
                 
                 user_data = response.json()
                 # print("USER DATA : ", user_data)
@@ -72,13 +84,14 @@ class DiscordUserProfileChangeHandler(BasePollingHandler):
                     "global_name": user_data.get("global_name", ""),
                 }
                 
-                cache_key = user_id
-                previous_profile = self._user_profile_cache.get(cache_key)
+                last_state = await self.get_last_state(session, user_id)
+                previous_profile = (last_state or {}).get("profile")
                 
-                self._user_profile_cache[cache_key] = current_profile
+                if previous_profile != current_profile:
+                    await self.save_state(session, user_id, {"profile": current_profile})
                 
                 if previous_profile is None:
-                    return None
+                    return []
 
                 changes = []
                 if previous_profile["username"] != current_profile["username"]:
@@ -89,7 +102,7 @@ class DiscordUserProfileChangeHandler(BasePollingHandler):
                     changes.append("avatar changed")
                 
                 if changes:
-                    return ActionResult(
+                    return [ActionResult(
                         triggered=True,
                         event_type="user_profile_change",
                         payload={
@@ -100,13 +113,13 @@ class DiscordUserProfileChangeHandler(BasePollingHandler):
                             "user.avatar": current_profile["avatar"],
                             "changes": ", ".join(changes),
                         }
-                    )
+                    )]
                 
-                return None
+                return []
                     
         except Exception as e:
             print(f"Error polling Discord user profile: {str(e)}")
-            return None
+            return []
 
 
 DISCORD_HANDLERS = {
@@ -1,12 +1,12 @@
 from typing import Dict, Any, Optional, List
 from sqlmodel import Session, select
-import httpx
 import hmac
 import hashlib
 import os
 
 from app.handlers.base import BaseWebhookHandler, ActionResult
 from app.oauth_models import ServiceAccount
+from app.http_clients import provider_client
 
 class GitHubWebhookHandler(BaseWebhookHandler):
     @property
@@ -35,11 +35,10 @@ class GitHubWebhookHandler(BaseWebhookHandler):
         webhook_url = f"{os.getenv('API_BASE_URL', 'http://localhost:8080')}/webhooks/github"
         
         try:
-            async with httpx.AsyncClient() as client:
+            async with provider_client("github") as client:
                 repo_response = await client.get(
                     f"https://api.github.com/repos/{repository}",
                     headers=self._get_headers(service_account.access_token),
-                    timeout=30.0
                 )
                 
                 if repo_response.status_code != 200:
@@ -54,7 +53,6 @@ class GitHubWebhookHandler(BaseWebhookHandler):
                 list_response = await client.get(
                     f"https://api.github.com/repos/{repository}/hooks",
                     headers=self._get_headers(service_account.access_token),
-                    timeout=30.0
                 )
 
                 if list_response.status_code == 200:
@@ -78,7 +76,6 @@ class GitHubWebhookHandler(BaseWebhookHandler):
                     f"https://api.github.com/repos/{repository}/hooks",
                     headers=self._get_headers(service_account.access_token),
                     json=webhook_data,
-                    timeout=30.0
                 )
                 
                 if response.status_code == 201:
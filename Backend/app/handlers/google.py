@@ -1,11 +1,23 @@
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 from sqlmodel import Session, select
+from urllib.parse import urlencode
 import httpx
+import json
 import os
+import re
 from datetime import datetime, timezone
 
 from app.handlers.base import BaseWebhookHandler, ActionResult, BasePollingHandler
+from app.poll_feedback import observe_response
+from app.conditional_requests import conditional_get
 from app.oauth_models import ServiceAccount, Service
+from app.http_clients import provider_client
+from app.token_manager import token_manager
+
+DRIVE_API_URL = "https://www.googleapis.com/drive/v3"
+DRIVE_CHANGE_FIELDS = "nextPageToken,newStartPageToken,changes(fileId,removed,file(id,name,mimeType,createdTime,webViewLink,owners,size,parents,trashed))"
+DRIVE_EMITTED_LIMIT = int(os.getenv("DRIVE_EMITTED_LIMIT", "5000"))
+
 
 class GoogleDriveNewFileHandler(BasePollingHandler):
     @property
@@ -27,15 +39,47 @@ class GoogleDriveNewFileHandler(BasePollingHandler):
             payload=raw_payload
         )
 
-    async def poll(self, session: Session, user_id: int, params: Dict[str, Any]) -> Optional[ActionResult]:
-        # print("STARTING DRIVE POLL")
-
+    # One changes cursor per account serves every Drive area of the user;
+    # folder and type filters are applied per area on our side.
+    def coalescing_key(self, user_id: int, params: Dict[str, Any]) -> str:
+        return f"{self.service_name}:{self.action_type}:{user_id}"
+
+    async def matches_conditions(self, params: Dict[str, Any], payload: Dict[str, Any]) -> bool:
+        folder_id = (params.get("folder_id") or "root").strip()
+        file_type = (params.get("file_type") or "").strip()
+        if folder_id not in payload.get("file.parents", []):
+            return False
+        return not file_type or file_type in (payload.get("file.mimeType") or "")
+
+    def payload_for_area(self, params: Dict[str, Any], payload: Dict[str, Any]) -> Dict[str, Any]:
+        return {**payload, "folder_id": (params.get("folder_id") or "root").strip()}
+
+    async def _start_state(self, client: httpx.AsyncClient, access_token: str) -> Optional[Dict[str, Any]]:
+        headers = {"Authorization": f"Bearer {access_token}"}
+        token_response = await client.get(f"{DRIVE_API_URL}/changes/startPageToken", headers=headers)
+        observe_response(token_response)
+        root_response = await client.get(f"{DRIVE_API_URL}/files/root", headers=headers, params={"fields": "id"})
+        observe_response(root_response)
+        if token_response.status_code != 200 or root_response.status_code != 200:
+            print(f"Drive API error: {token_response.status_code} / {root_response.status_code}")
+            return None
+        return {
+            "page_token": token_response.json().get("startPageToken"),
+            "root_id": root_response.json().get("id"),
+            "created_after": datetime.now(timezone.utc).isoformat(),
+        }
+
+    # Reads the changes feed from the stored page token. A change is a new
+    # file when the file was created after the cursor was first taken and
+    # has not been emitted yet; edits of older files are ignored. The floor
+    # stays put so a file whose change arrives late is still emitted.
+    async def poll(self, session: Session, user_id: int, params: Dict[str, Any]) -> List[ActionResult]:
         google_service = session.exec(
             select(Service).where(Service.name == "google")
         ).first()
         
         if not google_service:
-            return None
+            return []
 
         service_account = session.exec(
             select(ServiceAccount).where(
@@ -46,74 +90,174 @@ class GoogleDriveNewFileHandler(BasePollingHandler):
         ).first()
         
         if not service_account:
-            return None
+            return []
+        await token_manager.ensure_valid(session, service_account)
 
-        folder_id = params.get("folder_id", "root")
-        file_type = params.get("file_type", "") or ""
-        
         try:
-            async with httpx.AsyncClient() as client:
-                query_parts = [f"'{folder_id}' in parents", "trashed = false"]
-                if file_type:
-                    query_parts.append(f"mimeType contains '{file_type}'")
-                
-                query = " and ".join(query_parts)
-                
-                response = await client.get(
-                    "https://www.googleapis.com/drive/v3/files",
-                    headers={
-                        "Authorization": f"Bearer {service_account.access_token}",
-                    },
-                    params={
-                        "q": query,
-                        "orderBy": "createdTime desc",
-                        "pageSize": 10,
-                        "fields": "files(id,name,mimeType,createdTime,webViewLink,owners,size)"
-                    },
-                    timeout=30.0
-                )
-                
-                if response.status_code != 200:
-                    print(f"Drive API error: {response.status_code} - {response.text}")
-                    return None
-
-                data = response.json()
-                # print("DRIVE DATA : ", data)
-
-                files = data.get("files", [])
-                
-                if not files:
-                    return None
-
-                latest_file = files[0]
-                created_time = datetime.fromisoformat(latest_file["createdTime"].replace("Z", "+00:00"))
-
-                now = datetime.now(timezone.utc)
-                if (now - created_time).total_seconds() <= self.polling_interval:
-                    owners = latest_file.get("owners", [{}])
+            async with provider_client("google") as client:
+                last_state = await self.get_last_state(session, user_id)
+                if not last_state or not last_state.get("page_token"):
+                    state = await self._start_state(client, service_account.access_token)
+                    if state:
+                        await self.save_state(session, user_id, state)
+                    return []
+
+                changed_files = []
+                page_token = last_state["page_token"]
+                while True:
+                    response = await client.get(
+                        f"{DRIVE_API_URL}/changes",
+                        headers={
+                            "Authorization": f"Bearer {service_account.access_token}",
+                        },
+                        params={
+                            "pageToken": page_token,
+                            "pageSize": 100,
+                            "spaces": "drive",
+                            "includeRemoved": "false",
+                            "fields": DRIVE_CHANGE_FIELDS,
+                        },
+                    )
+                    observe_response(response)
+
+                    if response.status_code != 200:
+                        print(f"Drive API error: {response.status_code} - {response.text}")
+                        return []
+
+                    data = response.json()
+                    for change in data.get("changes", []):
+                        file = change.get("file")
+                        if file and not change.get("removed") and not file.get("trashed"):
+                            changed_files.append(file)
+                    if data.get("newStartPageToken"):
+                        page_token = data["newStartPageToken"]
+                        break
+                    page_token = data.get("nextPageToken")
+                    if not page_token:
+                        break
+
+                created_after = datetime.fromisoformat(last_state["created_after"].replace("Z", "+00:00"))
+                root_id = last_state.get("root_id")
+                emitted = dict(last_state.get("emitted", {}))
+                results = []
+                for file in sorted(changed_files, key=lambda item: item.get("createdTime", "")):
+                    if not file.get("createdTime") or file.get("id") in emitted:
+                        continue
+                    created_time = datetime.fromisoformat(file["createdTime"].replace("Z", "+00:00"))
+                    if created_time <= created_after:
+                        continue
+                    emitted[file.get("id")] = file["createdTime"]
+
+                    parents = list(file.get("parents", []))
+                    if root_id and root_id in parents:
+                        parents.append("root")
+                    owners = file.get("owners", [{}])
                     owner = owners[0] if owners else {}
-                    
-                    return ActionResult(
+                    results.append(ActionResult(
                         triggered=True,
                         event_type="drive__new_file",
                         payload={
-                            "file.id": latest_file.get("id"),
-                            "file.name": latest_file.get("name"),
-                            "file.mimeType": latest_file.get("mimeType"),
-                            "file.createdTime": latest_file.get("createdTime"),
-                            "file.webViewLink": latest_file.get("webViewLink"),
-                            "file.size": latest_file.get("size"),
+                            "file.id": file.get("id"),
+                            "file.name": file.get("name"),
+                            "file.mimeType": file.get("mimeType"),
+                            "file.createdTime": file.get("createdTime"),
+                            "file.webViewLink": file.get("webViewLink"),
+                            "file.size": file.get("size"),
                             "file.owner.displayName": owner.get("displayName"),
                             "file.owner.emailAddress": owner.get("emailAddress"),
-                            "folder_id": folder_id,
+                            "file.parents": parents,
                         }
-                    )
-                
-                return None
+                    ))
+
+                # Only the oldest emitted ids are dropped once there are too
+                # many, and the floor moves up to them so they cannot return.
+                if len(emitted) > DRIVE_EMITTED_LIMIT:
+                    ordered = sorted(emitted.items(), key=lambda item: item[1])
+                    dropped = ordered[:len(ordered) - DRIVE_EMITTED_LIMIT]
+                    created_after = max(created_after, datetime.fromisoformat(dropped[-1][1].replace("Z", "+00:00")))
+                    emitted = dict(ordered[len(dropped):])
+
+                if page_token != last_state["page_token"] or emitted != last_state.get("emitted", {}):
+                    await self.save_state(session, user_id, {
+                        **last_state,
+                        "page_token": page_token,
+                        "created_after": created_after.isoformat(),
+                        "emitted": emitted,
+                    })
+                return results
                     
         except Exception as e:
             print(f"Error polling Google Drive: {str(e)}")
-            return None
+            return []
+
+
+GMAIL_API_URL = "https://gmail.googleapis.com/gmail/v1/users/me"
+GMAIL_BATCH_URL = "https://gmail.googleapis.com/batch/gmail/v1"
+GMAIL_BATCH_SIZE = int(os.getenv("GMAIL_BATCH_SIZE", "50"))
+GMAIL_METADATA_HEADERS = ("From", "To", "Subject", "Date")
+
+
+def build_batch_body(paths: List[str], boundary: str) -> str:
+    parts = [
+        f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <item{index}>\r\n\r\nGET {path}\r\n\r\n"
+        for index, path in enumerate(paths)
+    ]
+    return "".join(parts) + f"--{boundary}--\r\n"
+
+
+# Maps each part of a multipart/mixed batch response back to the index of
+# its request: {index: (status, json body or None)}.
+def parse_batch_response(content_type: str, body: str) -> Dict[int, Tuple[int, Any]]:
+    match = re.search(r'boundary="?([^";]+)"?', content_type or "")
+    if not match:
+        return {}
+    responses = {}
+    for part in body.split(f"--{match.group(1)}"):
+        content_id = re.search(r"Content-ID:\s*<response-item(\d+)>", part, re.IGNORECASE)
+        status = re.search(r"HTTP/[\d.]+\s+(\d{3})", part)
+        if not content_id or not status:
+            continue
+        data = None
+        if "{" in part:
+            try:
+                data = json.loads(part[part.index("{"):part.rindex("}") + 1])
+            except ValueError:
+                pass
+        responses[int(content_id.group(1))] = (int(status.group(1)), data)
+    return responses
+
+
+async def fetch_message_metadata(client: httpx.AsyncClient, access_token: str, message_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    query = urlencode([("format", "metadata")] + [("metadataHeaders", header) for header in GMAIL_METADATA_HEADERS])
+    boundary = "batch_area_gmail"
+    messages = {}
+    for start in range(0, len(message_ids), GMAIL_BATCH_SIZE):
+        chunk = message_ids[start:start + GMAIL_BATCH_SIZE]
+        response = await client.post(
+            GMAIL_BATCH_URL,
+            headers={
+                "Authorization": f"Bearer {access_token}",
+                "Content-Type": f"multipart/mixed; boundary={boundary}",
+            },
+            content=build_batch_body([f"/gmail/v1/users/me/messages/{message_id}?{query}" for message_id in chunk], boundary),
+        )
+        observe_response(response)
+        if response.status_code != 200:
+            raise RuntimeError(f"Gmail batch error: {response.status_code} - {response.text}")
+
+        parts = parse_batch_response(response.headers.get("content-type", ""), response.text)
+        for index, message_id in enumerate(chunk):
+            status, data = parts.get(index, (0, None))
+            if status == 200 and data:
+                messages[message_id] = data
+            elif status != 404:
+                # Anything but "deleted since" is retried with the same cursor.
+                raise RuntimeError(f"Gmail batch item {message_id} failed: {status}")
+    return messages
+
+
+def gmail_label(params: Dict[str, Any]) -> str:
+    return (params.get("label", "") or "").strip() or "INBOX"
 
 
 class GoogleGmailNewEmailHandler(BasePollingHandler):
@@ -136,13 +280,40 @@ class GoogleGmailNewEmailHandler(BasePollingHandler):
             payload=raw_payload
         )
 
-    async def poll(self, session: Session, user_id: int, params: Dict[str, Any]) -> Optional[ActionResult]:
+    async def _current_history_id(self, client: httpx.AsyncClient, access_token: str) -> Optional[str]:
+        response = await client.get(
+            f"{GMAIL_API_URL}/profile",
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+        observe_response(response)
+        if response.status_code != 200:
+            print(f"Gmail API error: {response.status_code} - {response.text}")
+            return None
+        return response.json().get("historyId")
+
+    # One history cursor per (user, label) serves every Gmail area on that
+    # inbox; the sender and subject filters are applied per area on our side.
+    def coalescing_key(self, user_id: int, params: Dict[str, Any]) -> str:
+        return f"{self.service_name}:{self.action_type}:{user_id}:{gmail_label(params)}"
+
+    async def matches_conditions(self, params: Dict[str, Any], payload: Dict[str, Any]) -> bool:
+        from_address = (params.get("from_address", "") or "").strip().lower()
+        subject_contains = (params.get("subject_contains", "") or "").strip().lower()
+        if from_address and from_address not in (payload.get("email.from") or "").lower():
+            return False
+        return not subject_contains or subject_contains in (payload.get("email.subject") or "").lower()
+
+    # The cursor is the mailbox historyId of the last poll; each poll reads
+    # only the messageAdded records after it, then fetches the metadata of
+    # those messages in batch requests. The cursor moves only once every new
+    # message has been fetched.
+    async def poll(self, session: Session, user_id: int, params: Dict[str, Any]) -> List[ActionResult]:
         google_service = session.exec(
             select(Service).where(Service.name == "google")
         ).first()
         
         if not google_service:
-            return None
+            return []
 
         service_account = session.exec(
             select(ServiceAccount).where(
@@ -153,79 +324,80 @@ class GoogleGmailNewEmailHandler(BasePollingHandler):
         ).first()
         
         if not service_account:
-            return None
+            return []
+        await token_manager.ensure_valid(session, service_account)
 
-        from_address = params.get("from_address", "")
-        subject_contains = params.get("subject_contains", "")
-        label = params.get("label", "")
-        if not label:
-            label = "INBOX"
+        label = gmail_label(params)
+        scope = f"{user_id}:{label}"
         
         try:
-            async with httpx.AsyncClient() as client:
-                query_parts = ["is:unread"]
-                if from_address:
-                    query_parts.append(f"from:{from_address}")
-                if subject_contains:
-                    query_parts.append(f"subject:{subject_contains}")
-                
-                query = " ".join(query_parts)
-                
-                api_params = {
-                    "q": query,
-                    "maxResults": 5
-                }
-                if label:
-                    api_params["labelIds"] = label
-                
-                response = await client.get(
-                    "https://gmail.googleapis.com/gmail/v1/users/me/messages",
-                    headers={
-                        "Authorization": f"Bearer {service_account.access_token}",
-                    },
-                    params=api_params,
-                    timeout=30.0
-                )
-                
-                if response.status_code != 200:
-                    print(f"Gmail API error: {response.status_code} - {response.text}")
-                    return None
-
-                data = response.json()
-                # print("GMAIL DATA : ", data)
-                messages = data.get("messages", [])
-                
-                if not messages:
-                    return None
-
-                message_id = messages[0]["id"]
-                msg_response = await client.get(
-                    f"https://gmail.googleapis.com/gmail/v1/users/me/messages/{message_id}",
-                    headers={
-                        "Authorization": f"Bearer {service_account.access_token}",
-                    },
-                    params={
-                        "format": "metadata",
-                        "metadataHeaders": ["From", "To", "Subject", "Date"]
-                    },
-                    timeout=30.0
-                )
-                
-                if msg_response.status_code != 200:
-                    return None
-
-                msg_data = msg_response.json()
-
-                headers_dict = {}
-                for header in msg_data.get("payload", {}).get("headers", []):
-                    headers_dict[header["name"]] = header["value"]
-
-                internal_date = int(msg_data.get("internalDate", 0)) / 1000
-                msg_time = datetime.fromtimestamp(internal_date, tz=timezone.utc)
-                now = datetime.now(timezone.utc)
-                
-                if (now - msg_time).total_seconds() <= self.polling_interval:
-                    return ActionResult(
+            async with provider_client("google") as client:
+                last_state = await self.get_last_state(session, scope)
+                start_history_id = (last_state or {}).get("history_id")
+                if not start_history_id:
+                    history_id = await self._current_history_id(client, service_account.access_token)
+                    if history_id:
+                        await self.save_state(session, scope, {"history_id": history_id})
+                    return []
+
+                message_ids = []
+                history_id = start_history_id
+                page_token = None
+                while True:
+                    api_params = {
+                        "startHistoryId": start_history_id,
+                        "historyTypes": "messageAdded",
+                        "labelId": label,
+                        "maxResults": 500,
+                    }
+                    if page_token:
+                        api_params["pageToken"] = page_token
+                    response = await client.get(
+                        f"{GMAIL_API_URL}/history",
+                        headers={
+                            "Authorization": f"Bearer {service_account.access_token}",
+                        },
+                        params=api_params,
+                    )
+                    observe_response(response)
+
+                    if response.status_code == 404:
+                        # History is only kept for a limited time; restart
+                        # from the current mailbox state.
+                        print(f"Gmail history {start_history_id} expired for user {user_id}, resyncing")
+                        history_id = await self._current_history_id(client, service_account.access_token)
+                        if history_id:
+                            await self.save_state(session, scope, {"history_id": history_id})
+                        return []
+
+                    if response.status_code != 200:
+                        print(f"Gmail API error: {response.status_code} - {response.text}")
+                        return []
+
+                    data = response.json()
+                    for record in data.get("history", []):
+                        for added in record.get("messagesAdded", []):
+                            message_id = added.get("message", {}).get("id")
+                            if message_id and message_id not in message_ids:
+                                message_ids.append(message_id)
+                    history_id = data.get("historyId", history_id)
+                    page_token = data.get("nextPageToken")
+                    if not page_token:
+                        break
+
+                messages = await fetch_message_metadata(client, service_account.access_token, message_ids) if message_ids else {}
+
+                results = []
+                for message_id in message_ids:
+                    msg_data = messages.get(message_id)
+                    if not msg_data or "UNREAD" not in msg_data.get("labelIds", []):
+                        continue
+
+                    headers_dict = {}
+                    for header in msg_data.get("payload", {}).get("headers", []):
+                        headers_dict[header["name"]] = header["value"]
+
+                    results.append(ActionResult(
                         triggered=True,
                         event_type="gmail__new_email",
                         payload={
@@ -238,13 +410,25 @@ class GoogleGmailNewEmailHandler(BasePollingHandler):
                             "email.snippet": msg_data.get("snippet", ""),
                             "email.labelIds": msg_data.get("labelIds", []),
                         }
-                    )
-                
-                return None
+                    ))
+
+                if history_id != start_history_id:
+                    await self.save_state(session, scope, {"history_id": history_id})
+                return results
                     
         except Exception as e:
             print(f"Error polling Gmail: {str(e)}")
-            return None
+            return []
+
+
+YOUTUBE_API_URL = "https://www.googleapis.com/youtube/v3"
+YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
+
+
+def uploads_playlist_id(channel_id: str) -> Optional[str]:
+    if channel_id.startswith("UC") and len(channel_id) > 2:
+        return "UU" + channel_id[2:]
+    return None
 
 
 class GoogleYoutubeNewUploadHandler(BasePollingHandler):
@@ -268,67 +452,154 @@ class GoogleYoutubeNewUploadHandler(BasePollingHandler):
             payload=raw_payload
         )
 
-    async def poll(self, session: Session, user_id: int, params: Dict[str, Any]) -> Optional[ActionResult]:
+    # Uploads are public, so every area watching a channel shares one feed,
+    # whoever owns it. The poll runs with YOUTUBE_API_KEY when set, else with
+    # the token of one of the users watching the channel.
+    def coalescing_key(self, user_id: int, params: Dict[str, Any]) -> str:
+        return f"{self.service_name}:{self.action_type}:channel:{(params.get('channel_id') or '').strip()}"
+
+    # Without an API key the feed borrows a Google account: its own user's
+    # if still connected, else the one of another user watching the channel,
+    # so one user disconnecting does not silence everyone else's areas.
+    def _account_for_channel(self, session: Session, user_id: int, channel_id: str) -> Optional[ServiceAccount]:
+        from app.action import Action
+        from app.area_engine import action_name_to_key
+        from app.oauth_models import Area
+
         google_service = session.exec(
             select(Service).where(Service.name == "google")
         ).first()
-        
+
         if not google_service:
             return None
 
-        service_account = session.exec(
-            select(ServiceAccount).where(
-                ServiceAccount.user_id == user_id,
-                ServiceAccount.service_id == google_service.id,
-                ServiceAccount.is_active == True
+        accounts = select(ServiceAccount).where(
+            ServiceAccount.service_id == google_service.id,
+            ServiceAccount.is_active == True
+        )
+        service_account = session.exec(accounts.where(ServiceAccount.user_id == user_id)).first()
+        if service_account:
+            return service_account
+
+        rows = session.exec(
+            select(Area.user_id, Area.params_action, Action.name).where(
+                Area.action_id == Action.id,
+                Area.action_service_id == google_service.id,
+                Area.is_active == True
             )
-        ).first()
-        
-        if not service_account:
+        ).all()
+        watchers = {
+            area_user_id
+            for area_user_id, params_action, action_name in rows
+            if action_name_to_key(action_name) == self.action_type
+            and ((params_action or {}).get("channel_id") or "").strip() == channel_id
+        }
+        if not watchers:
             return None
+        return session.exec(accounts.where(ServiceAccount.user_id.in_(watchers)).order_by(ServiceAccount.user_id)).first()
 
-        channel_id = params.get("channel_id")
-        if not channel_id:
+    async def _channel_uploads_playlist(self, client: httpx.AsyncClient, auth: Dict[str, Any], channel_id: str) -> Optional[str]:
+        response = await client.get(
+            f"{YOUTUBE_API_URL}/channels",
+            params={"part": "contentDetails", "id": channel_id, **auth["params"]},
+            headers=auth["headers"],
+        )
+        observe_response(response)
+        if response.status_code != 200:
+            print(f"YouTube API error: {response.status_code} - {response.text}")
             return None
+        items = response.json().get("items", [])
+        if not items:
+            return None
+        return items[0].get("contentDetails", {}).get("relatedPlaylists", {}).get("uploads")
+
+    # playlistItems on the uploads playlist costs 1 quota unit against 100
+    # for search, and with its ETag an idle channel answers 304. The cursor
+    # is the newest video id seen; everything above it on the first page is
+    # new.
+    async def poll(self, session: Session, user_id: int, params: Dict[str, Any]) -> List[ActionResult]:
+        channel_id = (params.get("channel_id") or "").strip()
+        if not channel_id:
+            return []
+
+        if YOUTUBE_API_KEY:
+            auth = {"params": {"key": YOUTUBE_API_KEY}, "headers": {}}
+        else:
+            service_account = self._account_for_channel(session, user_id, channel_id)
+            if not service_account:
+                return []
+            await token_manager.ensure_valid(session, service_account)
+            auth = {"params": {}, "headers": {"Authorization": f"Bearer {service_account.access_token}"}}
         
+        scope = f"channel:{channel_id}"
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    "https://www.googleapis.com/youtube/v3/search",
-                    headers={
-                        "Authorization": f"Bearer {service_account.access_token}",
-                    },
+            async with provider_client("google") as client:
+                last_state = await self.get_last_state(session, scope) or {}
+                playlist_id = last_state.get("playlist_id") or uploads_playlist_id(channel_id)
+                if not playlist_id:
+                    playlist_id = await self._channel_uploads_playlist(client, auth, channel_id)
+                    if not playlist_id:
+                        return []
+
+                response = await conditional_get(
+                    session,
+                    client,
+                    f"{self.service_name}.{self.action_type}",
+                    scope,
+                    f"{YOUTUBE_API_URL}/playlistItems",
+                    headers=auth["headers"],
                     params={
-                        "part": "snippet",
-                        "channelId": channel_id,
-                        "order": "date",
-                        "type": "video",
-                        "maxResults": 1
+                        "part": "snippet,contentDetails",
+                        "playlistId": playlist_id,
+                        "maxResults": 50,
+                        **auth["params"],
                     },
-                    timeout=30.0
                 )
+                observe_response(response)
+                
+                if response.status_code == 304:
+                    return []
                 
                 if response.status_code != 200:
                     print(f"YouTube API error: {response.status_code} - {response.text}")
-                    return None
+                    return []
 
-                data = response.json()
-                # print("YOUTUBE DATA : ", data)
-                items = data.get("items", [])
-                
+                items = sorted(
+                    response.json().get("items", []),
+                    key=lambda item: item.get("contentDetails", {}).get("videoPublishedAt") or item.get("snippet", {}).get("publishedAt", ""),
+                    reverse=True,
+                )
                 if not items:
-                    return None
-
-                latest_video = items[0]
-                snippet = latest_video.get("snippet", {})
-                video_id = latest_video.get("id", {}).get("videoId")
-                published_at = snippet.get("publishedAt", "")
-                
-                published_time = datetime.fromisoformat(published_at.replace("Z", "+00:00"))
-                now = datetime.now(timezone.utc)
-                
-                if (now - published_time).total_seconds() <= self.polling_interval:
-                    return ActionResult(
+                    if not last_state:
+                        await self.save_state(session, scope, {"playlist_id": playlist_id})
+                    return []
+
+                latest = items[0]
+                latest_id = latest.get("contentDetails", {}).get("videoId")
+                latest_published = latest.get("contentDetails", {}).get("videoPublishedAt") or latest.get("snippet", {}).get("publishedAt", "")
+                last_video_id = last_state.get("video_id")
+                last_published = last_state.get("published_at") or ""
+                if latest_id != last_video_id:
+                    await self.save_state(session, scope, {"playlist_id": playlist_id, "video_id": latest_id, "published_at": latest_published})
+                if not last_video_id or latest_id == last_video_id:
+                    return []
+
+                # Above the cursor is new; if the cursor is gone from the page
+                # (deleted, or over 50 uploads since), fall back to the date.
+                new_items = []
+                for item in items:
+                    details = item.get("contentDetails", {})
+                    published_at = details.get("videoPublishedAt") or item.get("snippet", {}).get("publishedAt", "")
+                    if details.get("videoId") == last_video_id or published_at <= last_published:
+                        break
+                    new_items.append(item)
+
+                results = []
+                for item in reversed(new_items):
+                    snippet = item.get("snippet", {})
+                    details = item.get("contentDetails", {})
+                    video_id = details.get("videoId")
+                    results.append(ActionResult(
                         triggered=True,
                         event_type="youtube__new_channel_upload",
                         payload={
@@ -336,19 +607,18 @@ class GoogleYoutubeNewUploadHandler(BasePollingHandler):
                             "video.title": snippet.get("title"),
                             "video.url": f"https://www.youtube.com/watch?v={video_id}",
                             "video.description": snippet.get("description"),
-                            "video.published": published_at,
+                            "video.published": details.get("videoPublishedAt") or snippet.get("publishedAt"),
                             "channel.id": channel_id,
-                            "channel.name": snippet.get("channelTitle"),
+                            "channel.name": snippet.get("videoOwnerChannelTitle") or snippet.get("channelTitle"),
                             "channel.url": f"https://www.youtube.com/channel/{channel_id}",
                             "thumbnail.url": snippet.get("thumbnails", {}).get("high", {}).get("url"),
                         }
-                    )
-                
-                return None
+                    ))
+                return results
                     
         except Exception as e:
             print(f"Error polling YouTube: {str(e)}")
-            return None
+            return []
 
 GOOGLE_HANDLERS = {
     "drive__new_file": GoogleDriveNewFileHandler(),
@@ -2,12 +2,14 @@ from typing import Dict, Any, Optional, List
 from sqlmodel import Session, select
 import httpx
 
-from app.handlers.base import BasePollingHandler, ActionResult
+from app.handlers.base import BasePollingHandler, ActionResult, normalize_params
+from app.poll_feedback import observe_response
+from app.conditional_requests import conditional_get
 from app.oauth_models import ServiceAccount, Service
+from app.http_clients import provider_client
+from app.token_manager import token_manager
 
 class SpotifyNewPlaylistCreatedHandler(BasePollingHandler):
-    _user_playlists_cache: Dict[int, set] = {}
-    
     @property
     def service_name(self) -> str:
         return "spotify"
@@ -27,13 +29,16 @@ class SpotifyNewPlaylistCreatedHandler(BasePollingHandler):
             payload=raw_payload
         )
 
-    async def poll(self, session: Session, user_id: int, params: Dict[str, Any]) -> Optional[ActionResult]:
+    def coalescing_key(self, user_id: int, params: Dict[str, Any]) -> str:
+        return f"{self.service_name}:{self.action_type}:{user_id}"
+
+    async def poll(self, session: Session, user_id: int, params: Dict[str, Any]) -> List[ActionResult]:
         spotify_service = session.exec(
             select(Service).where(Service.name == "spotify")
         ).first()
         
         if not spotify_service:
-            return None
+            return []
 
         service_account = session.exec(
             select(ServiceAccount).where(
@@ -44,63 +49,74 @@ class SpotifyNewPlaylistCreatedHandler(BasePollingHandler):
         ).first()
         
         if not service_account:
-            return None
+            return []
+        await token_manager.ensure_valid(session, service_account)
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
+            async with provider_client("spotify") as client:
+                response = await conditional_get(
+                    session,
+                    client,
+                    f"{self.service_name}.{self.action_type}",
+                    service_account.id,
                     "https://api.spotify.com/v1/me/playlists",
                     headers={
                         "Authorization": f"Bearer {service_account.access_token}",
                     },
                     params={"limit": 50},
-                    timeout=30.0
                 )
+                observe_response(response)
+
+                if response.status_code == 304:
+                    return []
 
                 if response.status_code != 200:
                     print(f"Spotify API error : {response.status_code} {response.text}")
-                    return None
+                    return []
 
                 data = response.json()
                 playlists = data.get("items", [])
                 
                 current_playlist_ids = {p["id"] for p in playlists}
                 
-                cache_key = user_id
-                previous_playlists = self._user_playlists_cache.get(cache_key, set())
+                last_state = await self.get_last_state(session, user_id)
+                previous_playlists = set((last_state or {}).get("playlist_ids", []))
                 
                 new_playlists = current_playlist_ids - previous_playlists
-                self._user_playlists_cache[cache_key] = current_playlist_ids
-                
-                if not previous_playlists:
-                    return None
+                if current_playlist_ids != previous_playlists or last_state is None:
+                    await self.save_state(session, user_id, {"playlist_ids": sorted(current_playlist_ids)})
                 
-                for playlist in playlists:
-                    if playlist["id"] in new_playlists:
-                        return ActionResult(
-                            triggered=True,
-                            event_type="new_playlist_created",
-                            payload={
-                                "playlist.id": playlist["id"],
-                                "playlist.name": playlist["name"],
-                                "playlist.description": playlist.get("description", ""),
-                                "playlist.public": playlist.get("public", False),
-                                "playlist.tracks_total": playlist["tracks"]["total"],
-                                "playlist.url": playlist["external_urls"].get("spotify", ""),
-                                "playlist.owner": playlist["owner"]["display_name"],
-                            }
-                        )
+                if last_state is None:
+                    return []
                 
-                return None
+                return [
+                    ActionResult(
+                        triggered=True,
+                        event_type="new_playlist_created",
+                        payload={
+                            "playlist.id": playlist["id"],
+                            "playlist.name": playlist["name"],
+                            "playlist.description": playlist.get("description", ""),
+                            "playlist.public": playlist.get("public", False),
+                            "playlist.tracks_total": playlist["tracks"]["total"],
+                            "playlist.url": playlist["external_urls"].get("spotify", ""),
+                            "playlist.owner": playlist["owner"]["display_name"],
+                        }
+                    )
+                    for playlist in playlists
+                    if playlist["id"] in new_playlists
+                ]
                     
         except Exception as e:
             print(f"Error Spotify playlists : {str(e)}")
-            return None
+            return []
+
+
+SPOTIFY_API_URL = "https://api.spotify.com/v1"
+SPOTIFY_PLAYLISTS_PAGE_SIZE = 50
 
 
 class SpotifyTrackAddedToPlaylistHandler(BasePollingHandler):
-    _playlist_tracks_cache: Dict[tuple, set] = {}
-    
     @property
     def service_name(self) -> str:
         return "spotify"
@@ -120,13 +136,98 @@ class SpotifyTrackAddedToPlaylistHandler(BasePollingHandler):
             payload=raw_payload
         )
 
-    async def poll(self, session: Session, user_id: int, params: Dict[str, Any]) -> Optional[ActionResult]:
+    async def _playlist_snapshots(
+        self,
+        session: Session,
+        client: httpx.AsyncClient,
+        access_token: str,
+        user_id: int,
+        target_playlist_id: str
+    ) -> Optional[Dict[str, str]]:
+        handler_key = f"{self.service_name}.{self.action_type}"
+        headers = {"Authorization": f"Bearer {access_token}"}
+        playlists_scope = f"{user_id}:playlists:{target_playlist_id}" if target_playlist_id else f"{user_id}:playlists"
+        last_state = await self.get_last_state(session, playlists_scope) or {}
+
+        if target_playlist_id:
+            response = await conditional_get(
+                session,
+                client,
+                handler_key,
+                playlists_scope,
+                f"{SPOTIFY_API_URL}/playlists/{target_playlist_id}",
+                headers=headers,
+                params={"fields": "id,snapshot_id"},
+            )
+            observe_response(response)
+            if response.status_code == 304:
+                return last_state.get("snapshots", {})
+            if response.status_code != 200:
+                print(f"Spotify API error : {response.status_code} {response.text}")
+                return None
+            data = response.json()
+            snapshots = {data.get("id") or target_playlist_id: data.get("snapshot_id")}
+            await self.save_state(session, playlists_scope, {"snapshots": snapshots})
+            return snapshots
+
+        # Every page of /me/playlists is requested with its own validators;
+        # a 304 on one page says nothing about the others.
+        previous_pages = last_state.get("pages", [])
+        pages = []
+        offset = 0
+        while True:
+            response = await conditional_get(
+                session,
+                client,
+                handler_key,
+                playlists_scope,
+                f"{SPOTIFY_API_URL}/me/playlists",
+                headers=headers,
+                params={"limit": SPOTIFY_PLAYLISTS_PAGE_SIZE, "offset": offset},
+            )
+            observe_response(response)
+            if response.status_code == 304 and len(previous_pages) > len(pages):
+                page = previous_pages[len(pages)]
+            else:
+                if response.status_code == 304:
+                    # Validators without the page behind them: fetch it again.
+                    response = await client.get(
+                        f"{SPOTIFY_API_URL}/me/playlists",
+                        headers=headers,
+                        params={"limit": SPOTIFY_PLAYLISTS_PAGE_SIZE, "offset": offset},
+                    )
+                    observe_response(response)
+                if response.status_code != 200:
+                    print(f"Spotify API error : {response.status_code} {response.text}")
+                    return None
+                data = response.json()
+                page = {
+                    "snapshots": {playlist["id"]: playlist.get("snapshot_id") for playlist in data.get("items", [])},
+                    "next": bool(data.get("next")),
+                }
+            pages.append(page)
+            if not page["next"] or not page["snapshots"]:
+                break
+            offset += SPOTIFY_PLAYLISTS_PAGE_SIZE
+
+        if pages != previous_pages:
+            await self.save_state(session, playlists_scope, {"pages": pages})
+        snapshots = {}
+        for page in pages:
+            snapshots.update(page["snapshots"])
+        return snapshots
+
+    # A playlist's snapshot_id changes only when its contents do, so tracks
+    # are fetched only for playlists whose snapshot moved since the last
+    # poll, and then in full so the diff never mistakes a track beyond the
+    # first page for a new one.
+    async def poll(self, session: Session, user_id: int, params: Dict[str, Any]) -> List[ActionResult]:
         spotify_service = session.exec(
             select(Service).where(Service.name == "spotify")
         ).first()
         
         if not spotify_service:
-            return None
+            return []
 
         service_account = session.exec(
             select(ServiceAccount).where(
@@ -137,86 +238,93 @@ class SpotifyTrackAddedToPlaylistHandler(BasePollingHandler):
         ).first()
         
         if not service_account:
-            return None
+            return []
+        await token_manager.ensure_valid(session, service_account)
 
-        target_playlist_id = params.get("playlist_id", "").strip()
+        target_playlist_id = (params.get("playlist_id", "") or "").strip()
 
         try:
-            async with httpx.AsyncClient() as client:
-                if target_playlist_id:
-                    playlist_ids = [target_playlist_id]
-                else:
-                    response = await client.get(
-                        "https://api.spotify.com/v1/me/playlists",
-                        headers={
-                            "Authorization": f"Bearer {service_account.access_token}",
-                        },
-                        params={"limit": 20},
-                        timeout=30.0
-                    )
-                    
-                    if response.status_code != 200:
-                        print(f"Spotify API error : {response.status_code} {response.text}")
-                        return None
-                    
-                    data = response.json()
-                    playlist_ids = [p["id"] for p in data.get("items", [])]
+            async with provider_client("spotify") as client:
+                snapshots = await self._playlist_snapshots(
+                    session,
+                    client,
+                    service_account.access_token,
+                    user_id,
+                    target_playlist_id
+                )
+                if snapshots is None:
+                    return []
 
-                for playlist_id in playlist_ids:
-                    result = await self._check_playlist_for_new_tracks(
+                # Track state is kept per feed: a feed on one playlist and a
+                # feed on all of them each diff that playlist themselves.
+                feed_scope = f"{user_id}:{normalize_params(params)}"
+                results = []
+                for playlist_id, snapshot_id in snapshots.items():
+                    results.extend(await self._check_playlist_for_new_tracks(
+                        session,
                         client,
                         service_account.access_token,
                         playlist_id,
-                        user_id
-                    )
-                    if result:
-                        return result
+                        snapshot_id,
+                        feed_scope
+                    ))
                 
-                return None
+                return results
                     
         except Exception as e:
             print(f"Error : {str(e)}")
-            return None
+            return []
     
     async def _check_playlist_for_new_tracks(
         self,
+        session: Session,
         client: httpx.AsyncClient,
         access_token: str,
         playlist_id: str,
-        user_id: int
-    ) -> Optional[ActionResult]:
-        response = await client.get(
-            f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks",
-            headers={
-                "Authorization": f"Bearer {access_token}",
-            },
-            params={"limit": 20, "fields": "items(added_at,track(id,name,artists,album,uri,external_urls))"},
-            timeout=30.0
-        )
-        
-        if response.status_code != 200:
-            return None
-        
-        data = response.json()
-        # print("PLAYLIST DATA : ", data)
-        items = data.get("items", [])
+        snapshot_id: Optional[str],
+        feed_scope: str
+    ) -> List[ActionResult]:
+        scope = f"{feed_scope}:{playlist_id}"
+        last_state = await self.get_last_state(session, scope)
+        if last_state is not None and snapshot_id and last_state.get("snapshot_id") == snapshot_id:
+            return []
 
-        current_track_ids = {item["track"]["id"] for item in items if item.get("track")}
-        
-        cache_key = (user_id, playlist_id)
-        previous_tracks = self._playlist_tracks_cache.get(cache_key, set())
+        items = []
+        while True:
+            response = await client.get(
+                f"{SPOTIFY_API_URL}/playlists/{playlist_id}/tracks",
+                headers={
+                    "Authorization": f"Bearer {access_token}",
+                },
+                params={"limit": 100, "offset": len(items), "fields": "next,items(added_at,track(id,name,artists,album,uri,external_urls))"},
+            )
+            observe_response(response)
+            
+            if response.status_code != 200:
+                return []
+            
+            data = response.json()
+            page = data.get("items", [])
+            items.extend(page)
+            if not data.get("next") or not page:
+                break
+
+        current_track_ids = {item["track"]["id"] for item in items if item.get("track") and item["track"].get("id")}
+        previous_tracks = set((last_state or {}).get("track_ids", []))
         
         new_tracks = current_track_ids - previous_tracks
-        self._playlist_tracks_cache[cache_key] = current_track_ids
+        await self.save_state(session, scope, {"snapshot_id": snapshot_id, "track_ids": sorted(current_track_ids)})
 
-        if not previous_tracks:
-            return None
+        if last_state is None:
+            return []
         
+        results = []
         for item in items:
             track = item.get("track")
-            if track and track["id"] in new_tracks:
+            if track and track.get("id") in new_tracks:
+                new_tracks.discard(track["id"])
                 artists = ", ".join([a["name"] for a in track.get("artists", [])])
-                return ActionResult(
+                results.append(ActionResult(
                     triggered=True,
                     event_type="track_added_to_playlist",
                     payload={
@@ -229,9 +337,9 @@ class SpotifyTrackAddedToPlaylistHandler(BasePollingHandler):
                         "playlist.id": playlist_id,
                         "added_at": item.get("added_at", ""),
                     }
-                )
+                ))
         
-        return None
+        return results
 
 SPOTIFY_HANDLERS = {
     "new_playlist_created": SpotifyNewPlaylistCreatedHandler(),
@@ -1,13 +1,16 @@
 from typing import Dict, Any, Optional, List
 from sqlmodel import Session, select
-import httpx
 import hmac
 import hashlib
 import base64
 import os
 
-from app.handlers.base import BaseWebhookHandler, BasePollingHandler, ActionResult
+from app.handlers.base import BaseWebhookHandler, BasePollingHandler, ActionResult, normalize_params
+from app.poll_feedback import observe_response
+from app.conditional_requests import conditional_get
 from app.oauth_models import ServiceAccount
+from app.http_clients import provider_client
+from app.token_manager import token_manager
 
 class TrelloWebhookHandler(BaseWebhookHandler):
     @property
@@ -42,11 +45,10 @@ class TrelloWebhookHandler(BaseWebhookHandler):
         callback_url = f"{os.getenv('API_BASE_URL', 'http://localhost:8080')}/webhooks/trello"
         
         try:
-            async with httpx.AsyncClient() as client:
+            async with provider_client("trello") as client:
                 list_response = await client.get(
                     f"https://api.trello.com/1/tokens/{service_account.access_token}/webhooks",
                     params={"key": api_key},
-                    timeout=30.0
                 )
 
                 if list_response.status_code == 200:
@@ -65,7 +67,6 @@ class TrelloWebhookHandler(BaseWebhookHandler):
                         "idModel": board_id,
                         "description": "AREA webhook"
                     },
-                    timeout=30.0
                 )
                 
                 if response.status_code in [200, 201]:
@@ -203,12 +204,12 @@ class TrelloCardDueSoonHandler(BasePollingHandler):
             payload=raw_payload
         )
 
-    async def poll(self, session: Session, user_id: int, params: Dict[str, Any]) -> Optional[ActionResult]:
+    async def poll(self, session: Session, user_id: int, params: Dict[str, Any]) -> List[ActionResult]:
         from datetime import datetime, timedelta, timezone
         
         api_key = os.getenv("TRELLO_WEB_CLIENT_API_KEY")
         if not api_key:
-            return None
+            return []
 
         from app.oauth_models import Service
         trello_service = session.exec(
@@ -216,7 +217,7 @@ class TrelloCardDueSoonHandler(BasePollingHandler):
         ).first()
         
         if not trello_service:
-            return None
+            return []
 
         service_account = session.exec(
             select(ServiceAccount).where(
@@ -227,53 +228,85 @@ class TrelloCardDueSoonHandler(BasePollingHandler):
         ).first()
         
         if not service_account:
-            return None
+            return []
+        await token_manager.ensure_valid(session, service_account)
 
         board_id = params.get("board_id")
         hours_threshold = params.get("hours_before", 24)
         
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
+            scope = f"{user_id}:{normalize_params(params)}"
+            cards_scope = f"{scope}:cards"
+            async with provider_client("trello") as client:
+                # Validators share the scope of the cards they describe, so a
+                # 304 always has this feed's cached cards behind it.
+                response = await conditional_get(
+                    session,
+                    client,
+                    f"{self.service_name}.{self.action_type}",
+                    cards_scope,
                     f"https://api.trello.com/1/boards/{board_id}/cards",
                     params={
                         "key": api_key,
                         "token": service_account.access_token,
                         "fields": "name,due,dueComplete,shortLink,idList"
                     },
-                    timeout=30.0
                 )
-                
-                if response.status_code != 200:
-                    return None
+                observe_response(response)
+
+                # Due-soon depends on the clock, so an unchanged board is
+                # re-evaluated from the cards kept with the last 200.
+                if response.status_code == 304:
+                    cards = (await self.get_last_state(session, cards_scope) or {}).get("cards", [])
+                elif response.status_code != 200:
+                    return []
+                else:
+                    cards = response.json()
+                    await self.save_state(session, cards_scope, {"cards": [
+                        {field: card.get(field) for field in ("id", "name", "due", "dueComplete", "shortLink")}
+                        for card in cards
+                    ]})
 
-                cards = response.json()
                 now = datetime.now(timezone.utc)
                 threshold = now + timedelta(hours=hours_threshold)
-                
+
+                last_state = await self.get_last_state(session, scope)
+                notified = set((last_state or {}).get("notified", []))
+                due_soon = []
                 for card in cards:
                     if card.get("due") and not card.get("dueComplete"):
-                        due_date = datetime.fromisoformat(card["due"].replace("Z", "+00:00")).replace(tzinfo=None)
+                        due_date = datetime.fromisoformat(card["due"].replace("Z", "+00:00"))
                         if now < due_date <= threshold:
-                            return ActionResult(
-                                triggered=True,
-                                event_type="card_due_soon",
-                                payload={
-                                    "board.id": board_id,
-                                    "card.id": card.get("id"),
-                                    "card.name": card.get("name"),
-                                    "card.due": card.get("due"),
-                                    "card.shortLink": card.get("shortLink"),
-                                    "card.url": f"https://trello.com/c/{card.get('shortLink')}",
-                                    "hours_until_due": (due_date - now).total_seconds() / 3600,
-                                }
-                            )
-                
-                return None
+                            due_soon.append((card, due_date))
+
+                # Cards stay in "notified" while they are inside the window so
+                # each one fires once per due date.
+                still_due = {card.get("id") for card, _ in due_soon}
+                pending = [(card, due_date) for card, due_date in due_soon if card.get("id") not in notified]
+                remembered = (notified & still_due) | {card.get("id") for card, _ in pending}
+                if remembered != notified or last_state is None:
+                    await self.save_state(session, scope, {"notified": sorted(remembered)})
+
+                return [
+                    ActionResult(
+                        triggered=True,
+                        event_type="card_due_soon",
+                        payload={
+                            "board.id": board_id,
+                            "card.id": card.get("id"),
+                            "card.name": card.get("name"),
+                            "card.due": card.get("due"),
+                            "card.shortLink": card.get("shortLink"),
+                            "card.url": f"https://trello.com/c/{card.get('shortLink')}",
+                            "hours_until_due": (due_date - now).total_seconds() / 3600,
+                        }
+                    )
+                    for card, due_date in sorted(pending, key=lambda pair: pair[1])
+                ]
                     
         except Exception as e:
             print(f"Error polling Trello: {str(e)}")
-            return None
+            return []
 
 TRELLO_HANDLERS = {
     "new_card": TrelloNewCardHandler(),
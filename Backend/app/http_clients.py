@@ -0,0 +1,138 @@
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional
+import asyncio
+import os
+import weakref
+import httpx
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_HTTP2 = os.getenv("HTTP_HTTP2", "false").lower() in ("1", "true", "yes")
+
+
+def parse_settings(raw: Optional[str]) -> Dict[str, float]:
+    settings = {}
+    for item in (raw or "").split(","):
+        if "=" not in item:
+            continue
+        key, value = item.split("=", 1)
+        try:
+            settings[key.strip().lower()] = float(value)
+        except ValueError:
+            print(f"Ignoring invalid HTTP client setting: {item}")
+    return settings
+
+
+HTTP_PROVIDER_TIMEOUTS = parse_settings(os.getenv("HTTP_PROVIDER_TIMEOUTS"))
+HTTP_PROVIDER_MAX_CONNECTIONS = parse_settings(os.getenv("HTTP_PROVIDER_MAX_CONNECTIONS"))
+
+
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+# Counts requests and the connections the pool had to open for them, so the
+# reuse ratio shows whether keep-alive is doing its job.
+class CountingTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.requests = 0
+        self.connections_opened = 0
+        self._seen = weakref.WeakSet()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response = await super().handle_async_request(request)
+        self.requests += 1
+        for connection in list(getattr(self._pool, "connections", [])):
+            if connection not in self._seen:
+                self._seen.add(connection)
+                self.connections_opened += 1
+        return response
+
+
+# One keep-alive client per provider, shared by every handler and executor
+# of the process. Clients are bound to the loop that created them; start()
+# and aclose() are called from the API lifespan and the polling worker.
+class ProviderClients:
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self._transport = transport
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._transports: Dict[str, CountingTransport] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.http2 = HTTP_HTTP2 and http2_available()
+        if HTTP_HTTP2 and not self.http2:
+            print("HTTP_HTTP2 is set but the h2 package is not installed, using HTTP/1.1")
+
+    def start(self) -> None:
+        loop = asyncio.get_event_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._clients = {}
+            self._transports = {}
+
+    def _create(self, provider: str) -> httpx.AsyncClient:
+        from app.rate_limits import RATE_LIMIT_ENABLED, GovernedTransport
+
+        timeout = HTTP_PROVIDER_TIMEOUTS.get(provider, HTTP_TIMEOUT)
+        max_connections = int(HTTP_PROVIDER_MAX_CONNECTIONS.get(provider, HTTP_MAX_CONNECTIONS))
+        transport = self._transport
+        if transport is None:
+            transport = CountingTransport(
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=min(HTTP_MAX_KEEPALIVE_CONNECTIONS, max_connections),
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+                ),
+            )
+            self._transports[provider] = transport
+        if RATE_LIMIT_ENABLED:
+            transport = GovernedTransport(transport, provider)
+        return httpx.AsyncClient(transport=transport, timeout=timeout)
+
+    def client_for(self, provider: str) -> httpx.AsyncClient:
+        self.start()
+        provider = provider.lower()
+        client = self._clients.get(provider)
+        if client is None or client.is_closed:
+            client = self._clients[provider] = self._create(provider)
+        return client
+
+    async def aclose(self) -> None:
+        clients, self._clients = self._clients, {}
+        for provider, client in clients.items():
+            try:
+                await client.aclose()
+            except Exception as e:
+                print(f"Error closing HTTP client for {provider}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {}
+        for provider, transport in self._transports.items():
+            stats[provider] = {
+                "requests": transport.requests,
+                "connections_opened": transport.connections_opened,
+                "reuse_ratio": 1 - transport.connections_opened / transport.requests if transport.requests else 0.0,
+                "http2": self.http2,
+            }
+        return stats
+
+
+provider_clients = ProviderClients()
+
+
+def client_for(provider: str) -> httpx.AsyncClient:
+    return provider_clients.client_for(provider)
+
+
+# Drop-in for "async with httpx.AsyncClient() as client" that borrows the
+# shared client instead of opening and closing one per call.
+@asynccontextmanager
+async def provider_client(provider: str):
+    yield client_for(provider)
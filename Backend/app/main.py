@@ -43,9 +43,14 @@ from app.db import create_db_tables, engine
 from app.user import BaseUser, User, RegisteringUser, Token, EmailCheck, PasswordChange, get_user_from_token
 from app.oauth2 import oauth2_scheme, ACCESS_TOKEN_EXPIRE_MINUTES, verify_password, verify_token, get_password_hash, create_access_token
 from app.send_email import send_email
-from app.polling_worker import polling_worker
+from app.polling_worker import polling_worker, polling_stats
+from app.http_clients import provider_clients
+from app.rate_limits import rate_governor
+from app.reaction_queue import start_reaction_workers
 import asyncio
 
+RUN_POLLING_IN_API = os.getenv("RUN_POLLING_IN_API", "true").lower() in ("1", "true", "yes")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     import time
@@ -70,15 +75,23 @@ async def lifespan(app: FastAPI):
                 print(f"Failed to connect to database after {max_retries} attempts")
                 raise
     
-    polling_task = asyncio.create_task(polling_worker())
+    provider_clients.start()
+    background_tasks = start_reaction_workers()
+    if RUN_POLLING_IN_API:
+        background_tasks.append(asyncio.create_task(polling_worker()))
+    else:
+        print("Polling disabled in this process (RUN_POLLING_IN_API=false)")
     
     yield
     
-    polling_task.cancel()
-    try:
-        await polling_task
-    except asyncio.CancelledError:
-        pass
+    for task in background_tasks:
+        task.cancel()
+    for task in background_tasks:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    await provider_clients.aclose()
 
 origins = [
     "http://localhost",
@@ -297,6 +310,21 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/polling/stats")
+def polling_stats_endpoint():
+    return polling_stats()
+
+
+@app.get("/http/stats")
+def http_stats_endpoint():
+    return provider_clients.stats()
+
+
+@app.get("/http/rate-limits")
+def rate_limits_endpoint():
+    return rate_governor.stats()
+
+
 @app.get("/about.json")
 async def about(request: Request, session: SessionDep):
     client_host = get_client_ip(request)
@@ -0,0 +1,139 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Iterable, Optional, Tuple
+import os
+import time
+
+POLL_MIN_INTERVAL = int(os.getenv("POLL_MIN_INTERVAL", "15"))
+POLL_MAX_INTERVAL = int(os.getenv("POLL_MAX_INTERVAL", "900"))
+POLL_BACKOFF_AFTER = int(os.getenv("POLL_BACKOFF_AFTER", "3"))
+POLL_BACKOFF_FACTOR = float(os.getenv("POLL_BACKOFF_FACTOR", "1.5"))
+POLL_RATE_LIMIT_LOW = int(os.getenv("POLL_RATE_LIMIT_LOW", "5"))
+
+MIN_INTERVAL_PARAM = "poll_min_interval"
+MAX_INTERVAL_PARAM = "poll_max_interval"
+
+
+@dataclass
+class PollObservation:
+    retry_after: Optional[float] = None
+    rate_limit_remaining: Optional[int] = None
+    rate_limit_reset: Optional[float] = None
+    poll_interval: Optional[float] = None
+
+
+_observation: ContextVar[Optional[PollObservation]] = ContextVar("poll_observation", default=None)
+
+
+@contextmanager
+def observing():
+    observation = PollObservation()
+    token = _observation.set(observation)
+    try:
+        yield observation
+    finally:
+        _observation.reset(token)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def parse_number(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value not in (None, "") else None
+    except ValueError:
+        return None
+
+
+# Called by polling handlers after each upstream request; outside of a poll
+# it does nothing. When a poll makes several requests the most restrictive
+# answer wins.
+def observe_response(response: Any) -> None:
+    observation = _observation.get()
+    if observation is None:
+        return
+    headers = getattr(response, "headers", None) or {}
+
+    retry_after = parse_retry_after(headers.get("retry-after"))
+    if retry_after is not None:
+        observation.retry_after = max(observation.retry_after or 0.0, retry_after)
+
+    poll_interval = parse_number(headers.get("x-poll-interval"))
+    if poll_interval is not None:
+        observation.poll_interval = max(observation.poll_interval or 0.0, poll_interval)
+
+    remaining = parse_number(headers.get("x-ratelimit-remaining"))
+    if remaining is not None:
+        remaining = int(remaining)
+        if observation.rate_limit_remaining is None or remaining < observation.rate_limit_remaining:
+            observation.rate_limit_remaining = remaining
+            reset = parse_number(headers.get("x-ratelimit-reset"))
+            # Reset is either an epoch timestamp or a delay in seconds.
+            if reset is not None and reset > 10 ** 9:
+                reset = reset - time.time()
+            observation.rate_limit_reset = max(0.0, reset) if reset is not None else None
+
+
+def _param_seconds(params: Dict[str, Any], key: str) -> Optional[int]:
+    value = params.get(key)
+    try:
+        return int(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+# The most demanding area of a feed sets its bounds: the lowest minimum and
+# the lowest maximum.
+def interval_bounds(base_interval: int, area_params: Iterable[Dict[str, Any]]) -> Tuple[int, int]:
+    area_params = list(area_params)
+    minimums = [_param_seconds(params or {}, MIN_INTERVAL_PARAM) for params in area_params]
+    maximums = [_param_seconds(params or {}, MAX_INTERVAL_PARAM) for params in area_params]
+    minimum = min([value for value in minimums if value is not None] or [base_interval])
+    maximum = min([value for value in maximums if value is not None] or [max(POLL_MAX_INTERVAL, base_interval)])
+    minimum = max(POLL_MIN_INTERVAL, minimum)
+    return minimum, max(minimum, maximum)
+
+
+def next_interval(
+    current: float,
+    empty_streak: int,
+    triggered: bool,
+    minimum: int,
+    maximum: int,
+    observation: Optional[PollObservation] = None,
+) -> float:
+    if triggered:
+        interval = float(minimum)
+    elif empty_streak > POLL_BACKOFF_AFTER:
+        interval = min(float(maximum), max(float(minimum), current) * POLL_BACKOFF_FACTOR)
+    else:
+        interval = min(float(maximum), max(float(minimum), current))
+
+    # Provider hints only ever lengthen the interval, even past the maximum.
+    if observation is not None:
+        if observation.poll_interval:
+            interval = max(interval, observation.poll_interval)
+        if observation.rate_limit_remaining is not None:
+            if observation.rate_limit_remaining <= 0 and observation.rate_limit_reset:
+                interval = max(interval, observation.rate_limit_reset)
+            elif observation.rate_limit_remaining < POLL_RATE_LIMIT_LOW:
+                interval = max(interval, min(float(maximum), interval * 2))
+        if observation.retry_after:
+            interval = max(interval, observation.retry_after)
+    return interval
@@ -0,0 +1,146 @@
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Set
+from sqlalchemy import and_, or_, update
+from sqlmodel import Field, Session, SQLModel, select, delete
+import math
+import os
+import socket
+import time
+import uuid
+import zlib
+
+POLL_PARTITIONS = int(os.getenv("POLL_PARTITIONS", "64"))
+POLL_LEASE_TTL = int(os.getenv("POLL_LEASE_TTL", "30"))
+POLL_HEARTBEAT_INTERVAL = float(os.getenv("POLL_HEARTBEAT_INTERVAL", "10"))
+
+
+class PollWorker(SQLModel, table=True):
+    __tablename__ = "poll_workers"
+
+    worker_id: str = Field(primary_key=True)
+    started_at: datetime = Field(default_factory=datetime.utcnow)
+    heartbeat_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+
+class PollPartition(SQLModel, table=True):
+    __tablename__ = "poll_partitions"
+
+    partition: int = Field(primary_key=True)
+    owner: Optional[str] = Field(default=None, index=True)
+    lease_until: Optional[datetime] = None
+
+
+def partition_for(key: str, partitions: int = POLL_PARTITIONS) -> int:
+    return zlib.crc32(key.encode("utf-8")) % partitions
+
+
+def new_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+# Feeds are hashed onto a fixed set of partitions and every live worker
+# leases roughly partitions / live_workers of them. Leases are renewed on
+# each heartbeat; a worker that stops heartbeating loses its leases after
+# POLL_LEASE_TTL and the survivors pick them up on their next heartbeat.
+class PartitionLeaser:
+    def __init__(self, worker_id: Optional[str] = None, partitions: int = POLL_PARTITIONS, lease_ttl: int = POLL_LEASE_TTL, clock=time.monotonic):
+        self.worker_id = worker_id or new_worker_id()
+        self.partitions = partitions
+        self.lease_ttl = lease_ttl
+        self.clock = clock
+        self.owned: Set[int] = set()
+        self.live_workers = 0
+        self._valid_until = 0.0
+
+    def owns(self, partition: int) -> bool:
+        return partition in self.owned and self.clock() < self._valid_until
+
+    def owns_key(self, key: str) -> bool:
+        return self.owns(partition_for(key, self.partitions))
+
+    def _ensure_partitions(self, session: Session) -> None:
+        existing = set(session.exec(select(PollPartition.partition)).all())
+        missing = [PollPartition(partition=partition) for partition in range(self.partitions) if partition not in existing]
+        if missing:
+            session.add_all(missing)
+            try:
+                session.commit()
+            except Exception:
+                session.rollback()
+
+    def heartbeat(self, session: Session) -> Set[int]:
+        started = self.clock()
+        now = datetime.utcnow()
+        lease_until = now + timedelta(seconds=self.lease_ttl)
+        self._ensure_partitions(session)
+
+        worker = session.get(PollWorker, self.worker_id)
+        if worker is None:
+            worker = PollWorker(worker_id=self.worker_id)
+        worker.heartbeat_at = now
+        session.add(worker)
+        session.exec(delete(PollWorker).where(PollWorker.heartbeat_at < now - timedelta(seconds=self.lease_ttl)))
+        session.commit()
+
+        self.live_workers = max(1, len(session.exec(select(PollWorker.worker_id)).all()))
+        fair_share = math.ceil(self.partitions / self.live_workers)
+
+        session.execute(
+            update(PollPartition)
+            .where(PollPartition.owner == self.worker_id)
+            .values(lease_until=lease_until)
+        )
+        session.commit()
+        owned = sorted(session.exec(select(PollPartition.partition).where(PollPartition.owner == self.worker_id)).all())
+
+        if len(owned) > fair_share:
+            released = owned[fair_share:]
+            session.execute(
+                update(PollPartition)
+                .where(PollPartition.partition.in_(released), PollPartition.owner == self.worker_id)
+                .values(owner=None, lease_until=None)
+            )
+            session.commit()
+            owned = owned[:fair_share]
+
+        if len(owned) < fair_share:
+            free = or_(PollPartition.owner == None, PollPartition.lease_until == None, PollPartition.lease_until < now)
+            candidates = session.exec(
+                select(PollPartition.partition).where(free).order_by(PollPartition.partition).limit(fair_share - len(owned))
+            ).all()
+            for partition in candidates:
+                result = session.execute(
+                    update(PollPartition)
+                    .where(and_(PollPartition.partition == partition, free))
+                    .values(owner=self.worker_id, lease_until=lease_until)
+                )
+                if result.rowcount:
+                    owned.append(partition)
+            session.commit()
+
+        self.owned = set(owned)
+        self._valid_until = started + self.lease_ttl
+        return self.owned
+
+    def release(self, session: Session) -> None:
+        session.execute(
+            update(PollPartition)
+            .where(PollPartition.owner == self.worker_id)
+            .values(owner=None, lease_until=None)
+        )
+        session.exec(delete(PollWorker).where(PollWorker.worker_id == self.worker_id))
+        session.commit()
+        self.owned = set()
+        self._valid_until = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "worker_id": self.worker_id,
+            "partitions": self.partitions,
+            "owned": len(self.owned),
+            "live_workers": self.live_workers,
+            "lease_valid_for": max(0.0, self._valid_until - self.clock()),
+        }
+
+
+partition_leaser = PartitionLeaser()
@@ -0,0 +1,280 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+from sqlmodel import Session, select
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+
+from app.oauth_models import Area
+from app.area_loader import AreaRelations, load_area_relations
+from app.handlers import get_polling_handler
+from app.poll_feedback import PollObservation, interval_bounds, next_interval
+
+POLL_JITTER = float(os.getenv("POLL_JITTER", "0.1"))
+POLL_MAX_IDLE_WAIT = float(os.getenv("POLL_MAX_IDLE_WAIT", "60"))
+POLL_SYNC_SKEW = int(os.getenv("POLL_SYNC_SKEW", "5"))
+
+
+@dataclass
+class PollFeed:
+    key: str
+    user_id: int
+    service_name: str
+    action_key: str
+    params: Dict[str, Any] = field(default_factory=dict)
+    interval: float = 60
+    due_at: float = 0.0
+    areas: Dict[int, Dict[str, Any]] = field(default_factory=dict)
+    base_interval: int = 60
+    empty_streak: int = 0
+
+
+def feed_for_relations(relations: AreaRelations) -> Optional[PollFeed]:
+    from app.area_engine import action_name_to_key
+
+    if not relations.area.is_active or not relations.action.is_polling:
+        return None
+    service_name = relations.action_service.name
+    action_key = action_name_to_key(relations.action.name)
+    handler = get_polling_handler(service_name, action_key)
+    if handler is None:
+        print(f"No handler found for {service_name}.{action_key}")
+        return None
+    params = relations.area.params_action or {}
+    base_interval = max(1, handler.polling_interval)
+    return PollFeed(
+        key=handler.coalescing_key(relations.area.user_id, params),
+        user_id=relations.area.user_id,
+        service_name=service_name,
+        action_key=action_key,
+        params=params,
+        interval=interval_bounds(base_interval, [params])[0],
+        areas={relations.area.id: params},
+        base_interval=base_interval,
+    )
+
+
+# Areas whose handler returns the same coalescing key share one feed and one
+# upstream poll. The heap holds (due_at, sequence, feed_key); rescheduling or
+# dropping a feed leaves its old heap item behind, and items whose sequence
+# no longer matches the feed's current one are skipped when they surface.
+class PollScheduler:
+    def __init__(self, jitter: float = POLL_JITTER, clock=time.monotonic):
+        self.jitter = jitter
+        self.clock = clock
+        self._heap: List[Tuple[float, int, str]] = []
+        self._feeds: Dict[str, PollFeed] = {}
+        self._area_feeds: Dict[int, str] = {}
+        self._sequences: Dict[str, int] = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.loaded = False
+        self._synced_at: Optional[datetime] = None
+
+    def __len__(self) -> int:
+        return len(self._feeds)
+
+    @property
+    def area_count(self) -> int:
+        return len(self._area_feeds)
+
+    def feed_for_area(self, area_id: int) -> Optional[PollFeed]:
+        key = self._area_feeds.get(area_id)
+        return self._feeds.get(key) if key is not None else None
+
+    def _jittered(self, interval: float) -> float:
+        return interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def _push(self, feed: PollFeed, due_at: float) -> None:
+        sequence = next(self._counter)
+        feed.due_at = due_at
+        self._feeds[feed.key] = feed
+        self._sequences[feed.key] = sequence
+        heapq.heappush(self._heap, (due_at, sequence, feed.key))
+        if len(self._heap) > 2 * len(self._sequences) + 64:
+            self._heap = [item for item in self._heap if self._sequences.get(item[2]) == item[1]]
+            heapq.heapify(self._heap)
+
+    def _add(self, feed: PollFeed, due_at: float) -> None:
+        for area_id, params in feed.areas.items():
+            if self._area_feeds.get(area_id) == feed.key:
+                self._feeds[feed.key].areas[area_id] = params
+                continue
+            self._detach(area_id)
+            existing = self._feeds.get(feed.key)
+            if existing is not None:
+                existing.areas[area_id] = params
+            else:
+                self._push(feed, due_at)
+            self._area_feeds[area_id] = feed.key
+
+    def _detach(self, area_id: int) -> None:
+        key = self._area_feeds.pop(area_id, None)
+        feed = self._feeds.get(key) if key is not None else None
+        if feed is None:
+            return
+        feed.areas.pop(area_id, None)
+        if not feed.areas:
+            self._feeds.pop(key, None)
+            self._sequences.pop(key, None)
+
+    def _notify(self) -> None:
+        if self._wakeup is None or self._loop is None:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:
+            pass
+
+    def wake(self) -> None:
+        self._notify()
+
+    def load(self, session: Session) -> None:
+        now = self.clock()
+        self._synced_at = datetime.utcnow()
+        with self._lock:
+            self._heap = []
+            self._feeds = {}
+            self._area_feeds = {}
+            self._sequences = {}
+            for relations in load_area_relations(session, active_only=True):
+                feed = feed_for_relations(relations)
+                if feed is not None:
+                    # Spread the first sweep over one interval instead of
+                    # firing every feed at startup.
+                    self._add(feed, now + random.uniform(0, feed.interval))
+            self.loaded = True
+        self._notify()
+
+    def schedule(self, feed: PollFeed, due_at: Optional[float] = None) -> None:
+        with self._lock:
+            self._add(feed, self.clock() if due_at is None else due_at)
+        self._notify()
+
+    def upsert_area(self, session: Session, area: Area) -> None:
+        if not self.loaded:
+            return
+        rows = load_area_relations(session, area_ids=[area.id], active_only=True) if area.is_active else []
+        feed = feed_for_relations(rows[0]) if rows else None
+        if feed is None:
+            self.remove_area(area.id)
+            return
+        self.schedule(feed, self.clock() + random.uniform(0, feed.interval))
+
+    # Picks up areas changed by other processes: rows touched since the last
+    # sync are re-applied, and areas that are no longer active are dropped.
+    def sync(self, session: Session) -> None:
+        if not self.loaded:
+            self.load(session)
+            return
+        synced_at = datetime.utcnow()
+        since = self._synced_at - timedelta(seconds=POLL_SYNC_SKEW)
+        changed = load_area_relations(session, updated_since=since)
+        active_ids = set(session.exec(select(Area.id).where(Area.is_active == True)).all())
+
+        now = self.clock()
+        with self._lock:
+            for relations in changed:
+                feed = feed_for_relations(relations)
+                if feed is None:
+                    self._detach(relations.area.id)
+                else:
+                    self._add(feed, now + random.uniform(0, feed.interval))
+            for area_id in list(self._area_feeds):
+                if area_id not in active_ids:
+                    self._detach(area_id)
+        self._synced_at = synced_at
+        self._notify()
+
+    def set_interval(self, feed_key: str, interval: float) -> None:
+        with self._lock:
+            feed = self._feeds.get(feed_key)
+            if feed is None or feed.interval == interval:
+                return
+            last_run = feed.due_at - feed.interval
+            feed.interval = max(1, interval)
+            if feed_key in self._sequences:
+                self._push(feed, max(self.clock(), last_run + feed.interval))
+        self._notify()
+
+    def remove_area(self, area_id: int) -> None:
+        with self._lock:
+            self._detach(area_id)
+
+    def pop_due(self, now: Optional[float] = None) -> List[PollFeed]:
+        now = self.clock() if now is None else now
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, sequence, key = heapq.heappop(self._heap)
+                if self._sequences.get(key) == sequence:
+                    self._sequences.pop(key)
+                    due.append(self._feeds[key])
+        return due
+
+    # Adaptive interval: back off while a feed keeps coming back empty, snap
+    # back to its minimum after a trigger, and honour provider hints.
+    def record_poll(self, feed: PollFeed, triggered: bool, observation: Optional[PollObservation] = None) -> None:
+        with self._lock:
+            minimum, maximum = interval_bounds(feed.base_interval, list(feed.areas.values()))
+            previous = feed.interval
+            feed.empty_streak = 0 if triggered else feed.empty_streak + 1
+            feed.interval = next_interval(feed.interval, feed.empty_streak, triggered, minimum, maximum, observation)
+        if feed.interval < previous:
+            self._notify()
+
+    def reschedule(self, feed: PollFeed, now: Optional[float] = None) -> None:
+        now = self.clock() if now is None else now
+        with self._lock:
+            if self._feeds.get(feed.key) is not feed or feed.key in self._sequences:
+                return
+            # Anchor on the slot that was due, not on when the poll finished,
+            # so the period does not drift with poll latency.
+            due_at = feed.due_at + self._jittered(feed.interval)
+            if due_at <= now:
+                due_at = now + self._jittered(feed.interval)
+            self._push(feed, due_at)
+        # Polls finish in the background while the main loop may be waiting
+        # on an older, later deadline.
+        self._notify()
+
+    def next_due(self) -> Optional[float]:
+        with self._lock:
+            while self._heap and self._sequences.get(self._heap[0][2]) != self._heap[0][1]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    async def wait_for_next(self, max_wait: float = POLL_MAX_IDLE_WAIT) -> None:
+        loop = asyncio.get_event_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+
+        next_due = self.next_due()
+        timeout = max_wait if next_due is None else min(max_wait, next_due - self.clock())
+        if timeout <= 0:
+            return
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        next_due = self.next_due()
+        return {
+            "scheduled_feeds": len(self._feeds),
+            "scheduled_areas": len(self._area_feeds),
+            "heap_size": len(self._heap),
+            "next_due_in": None if next_due is None else max(0.0, next_due - self.clock()),
+        }
+
+
+poll_scheduler = PollScheduler()
@@ -0,0 +1,164 @@
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, Iterable, Optional
+from sqlalchemy import JSON, Column
+from sqlmodel import Field, Session, SQLModel
+import asyncio
+import copy
+import os
+import threading
+
+POLL_STATE_CACHE_SIZE = int(os.getenv("POLL_STATE_CACHE_SIZE", "100000"))
+POLL_STATE_FLUSH_INTERVAL = float(os.getenv("POLL_STATE_FLUSH_INTERVAL", "5"))
+POLL_STATE_FLUSH_BATCH = int(os.getenv("POLL_STATE_FLUSH_BATCH", "500"))
+
+
+class PollState(SQLModel, table=True):
+    __tablename__ = "poll_states"
+
+    key: str = Field(primary_key=True)
+    state: Dict[str, Any] = Field(default_factory=dict, sa_column=Column(JSON))
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+def upsert_statement(dialect: str, rows):
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    statement = insert(PollState.__table__).values(rows)
+    return statement.on_conflict_do_update(
+        index_elements=["key"],
+        set_={"state": statement.excluded.state, "updated_at": statement.excluded.updated_at},
+    )
+
+
+# Read-through cache in front of poll_states. Writes land in the cache and a
+# dirty map at once and reach the table in batches, so a poll never waits on
+# a write. Dirty entries are never evicted before they are flushed.
+class PollStateStore:
+    def __init__(self, cache_size: int = POLL_STATE_CACHE_SIZE, flush_batch: int = POLL_STATE_FLUSH_BATCH):
+        self.cache_size = cache_size
+        self.flush_batch = flush_batch
+        self._cache: "OrderedDict[str, Optional[Dict[str, Any]]]" = OrderedDict()
+        self._dirty: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._flush_needed: Optional[asyncio.Event] = None
+        self.hits = 0
+        self.misses = 0
+        self.flushed = 0
+
+    def _cache_put(self, key: str, state: Optional[Dict[str, Any]]) -> None:
+        self._cache[key] = state
+        self._cache.move_to_end(key)
+        if len(self._cache) <= self.cache_size:
+            return
+        for old_key in list(self._cache):
+            if len(self._cache) <= self.cache_size:
+                break
+            if old_key not in self._dirty:
+                del self._cache[old_key]
+
+    def get(self, session: Session, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if key in self._cache:
+                self.hits += 1
+                self._cache.move_to_end(key)
+                return copy.deepcopy(self._cache[key])
+
+        from app.db import release_connection
+        row = session.get(PollState, key)
+        state = dict(row.state or {}) if row is not None else None
+        release_connection(session)
+        with self._lock:
+            self.misses += 1
+            if key not in self._cache:
+                self._cache_put(key, state)
+            return copy.deepcopy(self._cache[key])
+
+    def put(self, key: str, state: Dict[str, Any]) -> None:
+        state = copy.deepcopy(state)
+        with self._lock:
+            self._dirty[key] = state
+            self._cache_put(key, state)
+            pending = len(self._dirty)
+        if pending >= self.flush_batch and self._flush_needed is not None:
+            self._flush_needed.set()
+
+    def invalidate(self, keys: Optional[Iterable[str]] = None) -> None:
+        with self._lock:
+            if keys is None:
+                self._cache = OrderedDict((key, self._cache.get(key)) for key in self._dirty)
+                return
+            for key in keys:
+                if key not in self._dirty:
+                    self._cache.pop(key, None)
+
+    def flush(self, session: Session) -> int:
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return 0
+
+        now = datetime.utcnow()
+        rows = [{"key": key, "state": state, "updated_at": now} for key, state in dirty.items()]
+        try:
+            dialect = session.get_bind().dialect.name
+            for start in range(0, len(rows), self.flush_batch):
+                chunk = rows[start:start + self.flush_batch]
+                statement = upsert_statement(dialect, chunk)
+                if statement is not None:
+                    session.execute(statement)
+                else:
+                    for row in chunk:
+                        session.merge(PollState(**row))
+            session.commit()
+        except Exception:
+            session.rollback()
+            with self._lock:
+                for key, state in dirty.items():
+                    self._dirty.setdefault(key, state)
+            raise
+
+        self.flushed += len(rows)
+        return len(rows)
+
+    async def run_flusher(self, engine, interval: float = POLL_STATE_FLUSH_INTERVAL):
+        loop = asyncio.get_event_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._flush_needed = asyncio.Event()
+
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._flush_needed.wait(), timeout=interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._flush_needed.clear()
+                try:
+                    with Session(engine) as session:
+                        self.flush(session)
+                except Exception as e:
+                    print(f"Poll state flush failed: {e}")
+        finally:
+            try:
+                with Session(engine) as session:
+                    self.flush(session)
+            except Exception as e:
+                print(f"Final poll state flush failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cached": len(self._cache),
+            "dirty": len(self._dirty),
+            "hits": self.hits,
+            "misses": self.misses,
+            "flushed": self.flushed,
+        }
+
+
+poll_state_store = PollStateStore()
@@ -1,72 +1,348 @@
 import asyncio
-from typing import Dict, Any
-from sqlmodel import Session, select
+import json
+import os
+import signal
+import time
+from typing import Dict, Any, List, Optional, Set
+from sqlmodel import Session
 
-from app.oauth_models import Area, Service
-from app.action import Action
-from app.db import engine
-from app.area_engine import execute_area, action_name_to_key
+from app.db import DB_MAX_OVERFLOW, DB_POOL_SIZE, engine
+from app.area_engine import execute_areas_concurrently, index_areas
+from app.concurrency import ConcurrencyLimiter, parse_limits
+from app.conditional_requests import conditional_stats
 from app.handlers import get_polling_handler
+from app.handlers.base import poll_results
+from app.http_clients import provider_clients
+from app.rate_limits import POLL, priority, rate_governor
+from app.token_manager import TOKEN_REFRESH_LOCKS, token_manager
+from app.token_scheduler import token_refresh_scheduler
+from app.poll_feedback import observing
+from app.poll_partitions import POLL_HEARTBEAT_INTERVAL, partition_leaser
+from app.poll_scheduler import PollFeed, poll_scheduler
+from app.poll_state import poll_state_store
 
+POLL_TIMEOUT = float(os.getenv("POLL_TIMEOUT", "30"))
+POLL_DRAIN_TIMEOUT = float(os.getenv("POLL_DRAIN_TIMEOUT", "25"))
+POLL_HEALTH_PORT = int(os.getenv("POLL_HEALTH_PORT", "8081"))
+POLL_BATCH_SIZE = int(os.getenv("POLL_BATCH_SIZE", "50"))
+POLL_DB_CONNECTIONS = int(os.getenv("POLL_DB_CONNECTIONS", "4"))
 
-async def polling_worker():
+poll_limiter = ConcurrencyLimiter(
+    global_limit=int(os.getenv("POLL_CONCURRENCY", "64")),
+    default_key_limit=int(os.getenv("POLL_PROVIDER_CONCURRENCY", "16")),
+    key_limits=parse_limits(os.getenv("POLL_PROVIDER_CONCURRENCY_LIMITS")),
+)
+
+
+class PollStats:
+    def __init__(self):
+        self.polls = 0
+        self.triggered = 0
+        self.results = 0
+        self.deferred = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.not_owned = 0
+        self.sweeps = 0
+        self.last_sweep_size = 0
+        self.last_sweep_duration = 0.0
+        self.max_sweep_duration = 0.0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def record_lag(self, lag: float) -> None:
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+
+    def record_sweep(self, size: int, duration: float) -> None:
+        self.sweeps += 1
+        self.last_sweep_size = size
+        self.last_sweep_duration = duration
+        self.max_sweep_duration = max(self.max_sweep_duration, duration)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "polls": self.polls,
+            "triggered": self.triggered,
+            "results": self.results,
+            "deferred": self.deferred,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "not_owned": self.not_owned,
+            "sweeps": self.sweeps,
+            "last_sweep_size": self.last_sweep_size,
+            "last_sweep_duration": self.last_sweep_duration,
+            "max_sweep_duration": self.max_sweep_duration,
+            "last_lag": self.last_lag,
+            "max_lag": self.max_lag,
+            "in_flight": poll_limiter.in_flight,
+            "queue_depth": poll_limiter.waiting,
+        }
+
+
+poll_stats = PollStats()
+
+
+def polling_stats() -> Dict[str, Any]:
+    return {
+        "scheduler": poll_scheduler.stats(),
+        "polls": poll_stats.snapshot(),
+        "state": poll_state_store.stats(),
+        "partitions": partition_leaser.stats(),
+        "conditional_requests": conditional_stats.snapshot(),
+        "http_clients": provider_clients.stats(),
+        "tokens": token_manager.stats(),
+        "token_refresh": token_refresh_scheduler.stats(),
+        "rate_limits": rate_governor.stats(),
+    }
+
+
+# Polls and executions give their connection back before every provider
+# call, so POLL_CONCURRENCY and AREA_EXECUTION_CONCURRENCY do not count
+# against the pool. What can be checked out at once is two connections per
+# token refresh in flight plus POLL_DB_CONNECTIONS for the short sessions
+# of the loop and the state flusher; a smaller pool would block the loop on
+# checkout, so the worker refuses to start.
+def check_pool_capacity(pool_size: int = DB_POOL_SIZE, max_overflow: int = DB_MAX_OVERFLOW) -> None:
+    needed = 2 * TOKEN_REFRESH_LOCKS + POLL_DB_CONNECTIONS
+    if needed > pool_size + max_overflow:
+        raise RuntimeError(
+            f"Database pool too small for the polling worker: {pool_size} + {max_overflow} connections, "
+            f"{needed} needed (2 * TOKEN_REFRESH_LOCKS + POLL_DB_CONNECTIONS)"
+        )
+
+
+async def polling_worker(stop_event: Optional[asyncio.Event] = None, drain_timeout: float = POLL_DRAIN_TIMEOUT):
+    check_pool_capacity()
     print("Polling worker started")
-    
-    while True:
+    sweeps: Set[asyncio.Task] = set()
+    state_flusher = asyncio.create_task(poll_state_store.run_flusher(engine))
+    heartbeat = asyncio.create_task(partition_heartbeat())
+    token_refresher = asyncio.create_task(
+        token_refresh_scheduler.run(engine, owns=lambda key: partition_leaser.owns_key(key))
+    )
+
+    try:
+        while stop_event is None or not stop_event.is_set():
+            try:
+                if not poll_scheduler.loaded:
+                    with Session(engine) as session:
+                        poll_scheduler.load(session)
+                    print(f"Scheduled {poll_scheduler.area_count} polling areas in {len(poll_scheduler)} feeds")
+
+                due = poll_scheduler.pop_due()
+                if not due:
+                    await poll_scheduler.wait_for_next()
+                    continue
+
+                # Polls run in the background; a feed is only due again once
+                # its previous poll has been rescheduled.
+                sweep = asyncio.create_task(run_sweep(due))
+                sweeps.add(sweep)
+                sweep.add_done_callback(sweeps.discard)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Polling worker error: {e}")
+                import traceback
+                traceback.print_exc()
+                await asyncio.sleep(10)
+
+        if sweeps:
+            print(f"Draining {len(sweeps)} in-flight poll sweeps")
+            await asyncio.wait(set(sweeps), timeout=drain_timeout)
+    finally:
+        for sweep in sweeps:
+            sweep.cancel()
+        if sweeps:
+            await asyncio.gather(*sweeps, return_exceptions=True)
+        token_refresher.cancel()
+        heartbeat.cancel()
+        state_flusher.cancel()
+        await asyncio.gather(token_refresher, heartbeat, state_flusher, return_exceptions=True)
+
+
+async def partition_heartbeat():
+    try:
+        while True:
+            try:
+                with Session(engine) as session:
+                    # Cursors of partitions we may hand over must be in the
+                    # table before another worker takes them.
+                    poll_state_store.flush(session)
+                    previous = set(partition_leaser.owned)
+                    owned = partition_leaser.heartbeat(session)
+                    if owned - previous:
+                        poll_state_store.invalidate()
+                    if owned != previous:
+                        print(f"Poll worker {partition_leaser.worker_id} owns {len(owned)} partitions ({partition_leaser.live_workers} live workers)")
+                    poll_scheduler.sync(session)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Poll partition heartbeat failed: {e}")
+            await asyncio.sleep(POLL_HEARTBEAT_INTERVAL)
+    finally:
         try:
             with Session(engine) as session:
-                polling_actions = session.exec(
-                    select(Action).where(Action.is_polling == True)
-                ).all()
-                
-                print(f"Found {len(polling_actions)} polling actions")
-                for action in polling_actions:
-                    print(f"Polling action: {action.name}")
-                    await poll_action(session, action)
-            
-            await asyncio.sleep(60)
-            
+                poll_state_store.flush(session)
+                partition_leaser.release(session)
         except Exception as e:
-            print(f"Polling worker error: {e}")
-            import traceback
-            traceback.print_exc()
-            await asyncio.sleep(10)
+            print(f"Could not release poll partitions: {e}")
 
 
-async def poll_action(session: Session, action: Action):
-    service = session.get(Service, action.service_id)
-    if not service:
-        print(f"Service not found for action {action.name}")
-        return
+async def run_sweep(feeds: List[PollFeed]):
+    started = time.monotonic()
+    owned = []
+    for feed in feeds:
+        if partition_leaser.owns_key(feed.key):
+            owned.append(feed)
+        else:
+            poll_stats.not_owned += 1
+            poll_scheduler.reschedule(feed)
+    await asyncio.gather(*(run_poll(feed) for feed in owned))
+    poll_stats.record_sweep(len(owned), time.monotonic() - started)
 
-    action_key = action_name_to_key(action.name)
-    handler = get_polling_handler(service.name, action_key)
-    
-    if not handler:
-        print(f"No handler found for {service.name}.{action_key}")
+
+async def run_poll(feed: PollFeed):
+    try:
+        async with poll_limiter.slot(feed.service_name):
+            poll_stats.record_lag(max(0.0, poll_scheduler.clock() - feed.due_at))
+            payloads = await poll_feed(feed)
+
+        if payloads:
+            await fan_out(feed, payloads)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        poll_stats.errors += 1
+        print(f"Error dispatching feed {feed.key}: {e}")
+    finally:
+        poll_scheduler.reschedule(feed)
+
+
+async def fan_out(feed: PollFeed, payloads: List[Dict[str, Any]]):
+    handler = get_polling_handler(feed.service_name, feed.action_key)
+    matches = []
+    for payload in payloads:
+        for area_id, params in list(feed.areas.items()):
+            if handler is None:
+                matches.append((area_id, payload))
+            elif await handler.matches_conditions(params, payload):
+                matches.append((area_id, handler.payload_for_area(params, payload)))
+    if not matches:
         return
 
-    areas = session.exec(
-        select(Area).where(
-            Area.action_id == action.id,
-            Area.is_active == True
-        )
-    ).all()
+    # The whole batch is indexed once and executed in a single gather.
+    with Session(engine) as session:
+        indexed_areas = index_areas(session, sorted({area_id for area_id, _ in matches}), active_only=True)
+    await execute_areas_concurrently([
+        (indexed_areas[area_id], payload)
+        for area_id, payload in matches
+        if area_id in indexed_areas
+    ])
 
-    print(f"Found {len(areas)} active areas for {service.name}.{action_key}")
 
-    for area in areas:
+def backlog_key(feed: PollFeed) -> str:
+    return f"backlog:{feed.key}"
+
+
+async def poll_feed(feed: PollFeed) -> List[Dict[str, Any]]:
+    handler = get_polling_handler(feed.service_name, feed.action_key)
+    if not handler:
+        print(f"No handler found for {feed.service_name}.{feed.action_key}")
+        return []
+
+    poll_stats.polls += 1
+    backlog: List[Dict[str, Any]] = []
+    results = []
+    # Provider calls of a poll give way to executions on the same provider.
+    with observing() as observation, priority(POLL):
         try:
-            print(f"Polling AREA {area.id}: {area.name}")
-            result = await handler.poll(session, area.user_id, area.params_action)
-            
-            if result and result.triggered:
-                print(f"Polling triggered for AREA {area.id}: {area.name}")
-                await execute_area(session, area, result.payload)
-            else:
-                print(f"No trigger for AREA {area.id}")
-                
+            # Handlers release the connection before each provider call.
+            with Session(engine, expire_on_commit=False) as session:
+                backlog = (poll_state_store.get(session, backlog_key(feed)) or {}).get("payloads", [])
+                results = poll_results(await asyncio.wait_for(
+                    handler.poll(session, feed.user_id, feed.params),
+                    timeout=POLL_TIMEOUT,
+                ))
+        except asyncio.TimeoutError:
+            poll_stats.timeouts += 1
+            print(f"Polling feed {feed.key} timed out after {POLL_TIMEOUT}s")
         except Exception as e:
-            print(f"Error polling AREA {area.id}: {e}")
+            poll_stats.errors += 1
+            print(f"Error polling feed {feed.key}: {e}")
             import traceback
             traceback.print_exc()
+
+    # At most POLL_BATCH_SIZE payloads go out per poll; the rest go first on
+    # the next poll, which comes at the minimum interval. The handler's cursor
+    # is already past them, so they are kept in the poll state store next to
+    # it and survive a restart or a partition handover.
+    payloads = backlog + [result.payload for result in results]
+    batch, rest = payloads[:POLL_BATCH_SIZE], payloads[POLL_BATCH_SIZE:]
+    if rest or backlog:
+        poll_state_store.put(backlog_key(feed), {"payloads": json.loads(json.dumps(rest, default=str))})
+    poll_scheduler.record_poll(feed, bool(payloads), observation)
+
+    if batch:
+        poll_stats.triggered += 1
+        poll_stats.results += len(batch)
+        poll_stats.deferred += len(rest)
+        print(f"Polling emitted {len(batch)} result(s) for {len(feed.areas)} AREA(s) on feed {feed.key}")
+    return batch
+
+
+async def handle_health(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        path = request_line.decode("latin-1").split(" ")[1] if request_line.count(b" ") >= 2 else "/"
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+
+        if path.startswith("/stats"):
+            status, body = 200, polling_stats()
+        elif path.startswith("/health"):
+            healthy = partition_leaser.stats()["lease_valid_for"] > 0
+            status = 200 if healthy else 503
+            body = {"status": "ok" if healthy else "no_lease", "worker_id": partition_leaser.worker_id}
+        else:
+            status, body = 404, {"detail": "Not Found"}
+
+        payload = json.dumps(body, default=str).encode("utf-8")
+        reason = {200: "OK", 404: "Not Found", 503: "Service Unavailable"}[status]
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode("latin-1") + payload
+        )
+        await writer.drain()
+    except Exception:
+        pass
+    finally:
+        writer.close()
+
+
+async def run_standalone():
+    stop_event = asyncio.Event()
+    loop = asyncio.get_event_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, lambda: (stop_event.set(), poll_scheduler.wake()))
+        except NotImplementedError:
+            pass
+
+    provider_clients.start()
+    server = await asyncio.start_server(handle_health, "0.0.0.0", POLL_HEALTH_PORT)
+    print(f"Polling worker health endpoint listening on :{POLL_HEALTH_PORT}")
+    try:
+        await polling_worker(stop_event)
+    finally:
+        server.close()
+        await server.wait_closed()
+        await provider_clients.aclose()
+    print("Polling worker stopped")
+
+
+if __name__ == "__main__":
+    asyncio.run(run_standalone())
@@ -0,0 +1,267 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional, Tuple
+import asyncio
+import hashlib
+import os
+import time
+import httpx
+
+from app.http_clients import parse_settings
+from app.poll_feedback import parse_retry_after
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "30"))
+RATE_LIMIT_POLL_RESERVE = float(os.getenv("RATE_LIMIT_POLL_RESERVE", "0.2"))
+RATE_LIMIT_RETRIES = int(os.getenv("RATE_LIMIT_RETRIES", "2"))
+RATE_LIMIT_DEFAULT_BACKOFF = float(os.getenv("RATE_LIMIT_DEFAULT_BACKOFF", "5"))
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "120"))
+RATE_LIMIT_PROCESSES = max(1, int(os.getenv("RATE_LIMIT_PROCESSES", "1")))
+
+# Requests per second. Account limits are per user token, app limits per
+# OAuth client or API key:
+# GitHub 5000/h per token, Trello 100/10s per token and 300/10s per key.
+# Buckets live in each process, so the app rates are divided between the
+# RATE_LIMIT_PROCESSES processes that call the providers (the API and every
+# polling worker). Account buckets are not divided: a token is mostly used
+# by the worker that owns its feeds.
+ACCOUNT_RATES = {"github": 1.38, "trello": 10.0, "google": 10.0, "spotify": 5.0}
+ACCOUNT_RATES.update(parse_settings(os.getenv("RATE_LIMIT_ACCOUNT_RATES")))
+APP_RATES = {"github": 50.0, "trello": 30.0, "google": 100.0, "spotify": 10.0}
+APP_RATES.update(parse_settings(os.getenv("RATE_LIMIT_APP_RATES")))
+APP_RATES = {provider: rate / RATE_LIMIT_PROCESSES for provider, rate in APP_RATES.items()}
+DEFAULT_ACCOUNT_RATE = float(os.getenv("RATE_LIMIT_DEFAULT_ACCOUNT_RATE", "10"))
+DEFAULT_APP_RATE = float(os.getenv("RATE_LIMIT_DEFAULT_APP_RATE", "100")) / RATE_LIMIT_PROCESSES
+
+APP = "app"
+EXECUTION = 0
+POLL = 1
+
+request_priority: ContextVar[int] = ContextVar("request_priority", default=EXECUTION)
+
+
+@contextmanager
+def priority(level: int):
+    token = request_priority.set(level)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+
+def account_key(request: httpx.Request) -> Optional[str]:
+    credential = request.headers.get("authorization") or request.url.params.get("token")
+    if not credential:
+        return None
+    return hashlib.sha1(credential.encode("utf-8")).hexdigest()[:16]
+
+
+def header_int(headers: httpx.Headers, name: str) -> Optional[int]:
+    try:
+        return int(float(headers[name]))
+    except (KeyError, ValueError):
+        return None
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = now
+        self.blocked_until = 0.0
+
+    def _fill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + max(0.0, now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def delay(self, need: float, now: float) -> float:
+        self._fill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < need:
+            wait = max(wait, (need - self.tokens) / self.rate)
+        return wait
+
+    def take(self, now: float) -> None:
+        self._fill(now)
+        self.tokens -= 1
+
+    def observe(self, remaining: Optional[int], reset_at: Optional[float], now: float) -> None:
+        self._fill(now)
+        if remaining is not None:
+            self.tokens = min(self.tokens, remaining)
+            if remaining <= 0 and reset_at:
+                self.block(reset_at)
+
+    def block(self, until: float) -> None:
+        self.blocked_until = max(self.blocked_until, until)
+
+
+class ProviderRateStats:
+    def __init__(self):
+        self.requests = 0
+        self.throttled = 0
+        self.wait_time = 0.0
+        self.poll_deferrals = 0
+        self.rate_limited = 0
+        self.retries = 0
+
+
+# Token buckets per (provider, account) and (provider, app), shared by the
+# pollers and executors of the process. Buckets start from the configured
+# rates and are corrected by the rate-limit headers of every response. A
+# request takes one token from both buckets; polls leave
+# RATE_LIMIT_POLL_RESERVE of each bucket to executions and hold back while
+# an execution is waiting on the same provider.
+class RateGovernor:
+    def __init__(self, clock=time.time, sleep=asyncio.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._executions_waiting: Dict[str, int] = {}
+        self._stats: Dict[str, ProviderRateStats] = {}
+
+    def bucket(self, provider: str, account: str) -> TokenBucket:
+        bucket = self._buckets.get((provider, account))
+        if bucket is None:
+            if account == APP:
+                rate = APP_RATES.get(provider, DEFAULT_APP_RATE)
+            else:
+                rate = ACCOUNT_RATES.get(provider, DEFAULT_ACCOUNT_RATE)
+            bucket = self._buckets[(provider, account)] = TokenBucket(rate, max(1.0, rate * RATE_LIMIT_BURST), self.clock())
+        return bucket
+
+    def _buckets_for(self, provider: str, account: Optional[str]) -> List[TokenBucket]:
+        buckets = [self.bucket(provider, APP)]
+        if account:
+            buckets.append(self.bucket(provider, account))
+        return buckets
+
+    def stats_for(self, provider: str) -> ProviderRateStats:
+        stats = self._stats.get(provider)
+        if stats is None:
+            stats = self._stats[provider] = ProviderRateStats()
+        return stats
+
+    async def acquire(self, provider: str, account: Optional[str], level: Optional[int] = None) -> float:
+        level = request_priority.get() if level is None else level
+        buckets = self._buckets_for(provider, account)
+        stats = self.stats_for(provider)
+        stats.requests += 1
+        waited = 0.0
+        waiting = False
+        try:
+            while True:
+                now = self.clock()
+                delay = 0.0
+                for bucket in buckets:
+                    need = 1.0 if level == EXECUTION else 1.0 + RATE_LIMIT_POLL_RESERVE * bucket.capacity
+                    delay = max(delay, bucket.delay(min(need, bucket.capacity), now))
+                if level != EXECUTION and self._executions_waiting.get(provider):
+                    stats.poll_deferrals += 1
+                    delay = max(delay, 0.05)
+                # Past RATE_LIMIT_MAX_WAIT the request goes out anyway and
+                # the provider's own error reaches the caller.
+                if delay <= 0 or waited >= RATE_LIMIT_MAX_WAIT:
+                    for bucket in buckets:
+                        bucket.take(now)
+                    return waited
+
+                if not waiting:
+                    waiting = True
+                    stats.throttled += 1
+                    if level == EXECUTION:
+                        self._executions_waiting[provider] = self._executions_waiting.get(provider, 0) + 1
+                delay = min(delay, RATE_LIMIT_MAX_WAIT - waited)
+                stats.wait_time += delay
+                waited += delay
+                await self.sleep(delay)
+        finally:
+            if waiting and level == EXECUTION:
+                self._executions_waiting[provider] -= 1
+
+    # Returns whether the response was rate limited.
+    def observe(self, provider: str, account: Optional[str], response: httpx.Response) -> bool:
+        headers = response.headers
+        now = self.clock()
+        account_bucket = self.bucket(provider, account) if account else None
+        app_bucket = self.bucket(provider, APP)
+        target = account_bucket or app_bucket
+
+        # GitHub and most REST APIs: limit of the token making the call.
+        remaining = header_int(headers, "x-ratelimit-remaining")
+        if remaining is not None:
+            reset = header_int(headers, "x-ratelimit-reset")
+            target.observe(remaining, float(reset) if reset else now + RATE_LIMIT_DEFAULT_BACKOFF, now)
+
+        # Trello reports the token and the API key limits separately.
+        interval = header_int(headers, "x-rate-limit-api-token-interval-ms")
+        token_remaining = header_int(headers, "x-rate-limit-api-token-remaining")
+        if token_remaining is not None:
+            reset_at = now + (interval / 1000.0 if interval else RATE_LIMIT_DEFAULT_BACKOFF)
+            target.observe(token_remaining, reset_at, now)
+        interval = header_int(headers, "x-rate-limit-api-key-interval-ms")
+        key_remaining = header_int(headers, "x-rate-limit-api-key-remaining")
+        if key_remaining is not None:
+            reset_at = now + (interval / 1000.0 if interval else RATE_LIMIT_DEFAULT_BACKOFF)
+            app_bucket.observe(key_remaining, reset_at, now)
+
+        limited = response.status_code == 429 or (response.status_code == 403 and remaining == 0)
+        if limited:
+            self.stats_for(provider).rate_limited += 1
+            retry_after = parse_retry_after(headers.get("retry-after"))
+            if retry_after is None and remaining != 0:
+                retry_after = RATE_LIMIT_DEFAULT_BACKOFF
+            if retry_after is not None:
+                target.block(now + retry_after)
+        return limited
+
+    def stats(self) -> Dict[str, Any]:
+        now = self.clock()
+        stats = {}
+        for provider, provider_stats in self._stats.items():
+            app_bucket = self.bucket(provider, APP)
+            stats[provider] = {
+                "requests": provider_stats.requests,
+                "throttled": provider_stats.throttled,
+                "wait_time": provider_stats.wait_time,
+                "poll_deferrals": provider_stats.poll_deferrals,
+                "rate_limited": provider_stats.rate_limited,
+                "retries": provider_stats.retries,
+                "accounts": sum(1 for (name, account) in self._buckets if name == provider and account != APP),
+                "app_tokens": app_bucket.tokens,
+                "app_blocked_for": max(0.0, app_bucket.blocked_until - now),
+            }
+        return stats
+
+
+rate_governor = RateGovernor()
+
+
+# Wraps a provider's transport so every request waits for its buckets and
+# every response feeds them. A rate-limited response is retried after the
+# wait instead of being returned, up to RATE_LIMIT_RETRIES times.
+class GovernedTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport: httpx.AsyncBaseTransport, provider: str, governor: Optional[RateGovernor] = None):
+        self.transport = transport
+        self.provider = provider
+        self._governor = governor
+
+    @property
+    def governor(self) -> RateGovernor:
+        return self._governor or rate_governor
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        account = account_key(request)
+        attempt = 0
+        while True:
+            await self.governor.acquire(self.provider, account)
+            response = await self.transport.handle_async_request(request)
+            if not self.governor.observe(self.provider, account, response) or attempt >= RATE_LIMIT_RETRIES:
+                return response
+            attempt += 1
+            self.governor.stats_for(self.provider).retries += 1
+            await response.aclose()
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
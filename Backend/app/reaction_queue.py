@@ -0,0 +1,246 @@
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+from sqlalchemy import JSON, Column, and_, or_, update
+from sqlmodel import Field, Session, SQLModel, select, delete
+import asyncio
+import os
+import socket
+import threading
+import uuid
+
+from app.db import engine
+from app.trigger_index import IndexedArea
+
+REACTION_WORKERS = int(os.getenv("REACTION_WORKERS", "8"))
+REACTION_JOB_VISIBILITY_TIMEOUT = int(os.getenv("REACTION_JOB_VISIBILITY_TIMEOUT", "300"))
+REACTION_JOB_MAX_ATTEMPTS = int(os.getenv("REACTION_JOB_MAX_ATTEMPTS", "3"))
+REACTION_JOB_RETRY_DELAY = int(os.getenv("REACTION_JOB_RETRY_DELAY", "30"))
+REACTION_JOB_IDLE_WAIT = float(os.getenv("REACTION_JOB_IDLE_WAIT", "2"))
+REACTION_JOB_RETENTION_HOURS = int(os.getenv("REACTION_JOB_RETENTION_HOURS", "24"))
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class ReactionJob(SQLModel, table=True):
+    __tablename__ = "reaction_jobs"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    area_id: int = Field(index=True)
+    payload: Dict[str, Any] = Field(default_factory=dict, sa_column=Column(JSON))
+    status: str = Field(default=JOB_PENDING, index=True)
+    attempts: int = 0
+    available_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    locked_by: Optional[str] = None
+    locked_until: Optional[datetime] = None
+    last_error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+def enqueue_jobs(session: Session, executions: List[Tuple[IndexedArea, Dict[str, Any]]]) -> List[ReactionJob]:
+    jobs = [ReactionJob(area_id=area.id, payload=payload) for area, payload in executions]
+    if not jobs:
+        return []
+
+    session.add_all(jobs)
+    session.commit()
+    for job in jobs:
+        session.refresh(job)
+    notify_workers()
+    return jobs
+
+
+def _claimable(now: datetime, max_attempts: int = REACTION_JOB_MAX_ATTEMPTS):
+    return or_(
+        and_(ReactionJob.status == JOB_PENDING, ReactionJob.available_at <= now),
+        and_(ReactionJob.status == JOB_RUNNING, ReactionJob.locked_until < now, ReactionJob.attempts < max_attempts),
+    )
+
+
+# A job whose worker died (or that outlived the visibility timeout) on its
+# last attempt is failed instead of being handed out again.
+def fail_abandoned_jobs(session: Session, now: datetime, max_attempts: int = REACTION_JOB_MAX_ATTEMPTS) -> int:
+    result = session.execute(
+        update(ReactionJob)
+        .where(
+            ReactionJob.status == JOB_RUNNING,
+            ReactionJob.locked_until < now,
+            ReactionJob.attempts >= max_attempts,
+        )
+        .values(
+            status=JOB_FAILED,
+            locked_by=None,
+            locked_until=None,
+            last_error="Worker lost or visibility timeout exceeded on the last attempt",
+            updated_at=now,
+        )
+    )
+    session.commit()
+    return result.rowcount
+
+
+_claim_lock = threading.Lock()
+
+
+def claim_jobs(
+    session: Session,
+    worker_id: str,
+    limit: int = 1,
+    visibility_timeout: int = REACTION_JOB_VISIBILITY_TIMEOUT,
+    max_attempts: int = REACTION_JOB_MAX_ATTEMPTS,
+) -> List[ReactionJob]:
+    now = datetime.utcnow()
+    fail_abandoned_jobs(session, now, max_attempts)
+    statement = select(ReactionJob).where(_claimable(now, max_attempts)).order_by(ReactionJob.id).limit(limit)
+
+    if session.get_bind().dialect.name == "postgresql":
+        jobs = session.exec(statement.with_for_update(skip_locked=True)).all()
+        claimed = []
+        for job in jobs:
+            _mark_claimed(job, worker_id, now, visibility_timeout)
+            session.add(job)
+            claimed.append(job)
+        session.commit()
+        for job in claimed:
+            session.refresh(job)
+        return claimed
+
+    # No SKIP LOCKED (SQLite): serialize claims in-process and only keep the
+    # rows whose conditional update still matched.
+    with _claim_lock:
+        job_ids = [job.id for job in session.exec(statement).all()]
+        claimed_ids = []
+        for job_id in job_ids:
+            result = session.execute(
+                update(ReactionJob)
+                .where(ReactionJob.id == job_id, _claimable(now, max_attempts))
+                .values(
+                    status=JOB_RUNNING,
+                    locked_by=worker_id,
+                    locked_until=now + timedelta(seconds=visibility_timeout),
+                    attempts=ReactionJob.attempts + 1,
+                    updated_at=now,
+                )
+            )
+            if result.rowcount:
+                claimed_ids.append(job_id)
+        session.commit()
+
+    if not claimed_ids:
+        return []
+    return list(session.exec(select(ReactionJob).where(ReactionJob.id.in_(claimed_ids)).order_by(ReactionJob.id)).all())
+
+
+def _mark_claimed(job: ReactionJob, worker_id: str, now: datetime, visibility_timeout: int) -> None:
+    job.status = JOB_RUNNING
+    job.locked_by = worker_id
+    job.locked_until = now + timedelta(seconds=visibility_timeout)
+    job.attempts += 1
+    job.updated_at = now
+
+
+def finish_job(session: Session, job: ReactionJob, error: Optional[str] = None, max_attempts: int = REACTION_JOB_MAX_ATTEMPTS) -> ReactionJob:
+    now = datetime.utcnow()
+    job.locked_by = None
+    job.locked_until = None
+    job.updated_at = now
+
+    if error is None:
+        job.status = JOB_DONE
+        job.last_error = None
+    elif job.attempts < max_attempts:
+        job.status = JOB_PENDING
+        job.last_error = error
+        job.available_at = now + timedelta(seconds=REACTION_JOB_RETRY_DELAY * 2 ** (job.attempts - 1))
+    else:
+        job.status = JOB_FAILED
+        job.last_error = error
+
+    session.add(job)
+    session.commit()
+    session.refresh(job)
+    return job
+
+
+def purge_finished_jobs(session: Session, retention_hours: int = REACTION_JOB_RETENTION_HOURS) -> None:
+    cutoff = datetime.utcnow() - timedelta(hours=retention_hours)
+    session.exec(delete(ReactionJob).where(
+        ReactionJob.status.in_([JOB_DONE, JOB_FAILED]),
+        ReactionJob.updated_at < cutoff,
+    ))
+    session.commit()
+
+
+_wakeup: Optional[asyncio.Event] = None
+
+
+def notify_workers() -> None:
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+async def run_job(job: ReactionJob) -> Optional[str]:
+    from app.area_engine import execute_areas_concurrently, index_areas
+
+    with Session(engine) as session:
+        indexed_area = index_areas(session, [job.area_id], active_only=True).get(job.area_id)
+
+    if indexed_area is None:
+        print(f"Skipping job {job.id}: AREA {job.area_id} is gone, inactive or incomplete")
+        return None
+
+    outcomes = await execute_areas_concurrently([(indexed_area, job.payload)])
+    return outcomes[0].error if outcomes[0].status == "failed" else None
+
+
+async def reaction_worker(worker_id: str, purge_every: int = 600):
+    global _wakeup
+    if _wakeup is None:
+        _wakeup = asyncio.Event()
+
+    print(f"Reaction worker {worker_id} started")
+    last_purge = 0.0
+
+    while True:
+        try:
+            loop_time = asyncio.get_event_loop().time()
+            if worker_id.endswith("-0") and loop_time - last_purge > purge_every:
+                with Session(engine) as session:
+                    purge_finished_jobs(session)
+                last_purge = loop_time
+
+            _wakeup.clear()
+            with Session(engine) as session:
+                jobs = claim_jobs(session, worker_id)
+
+            if not jobs:
+                try:
+                    await asyncio.wait_for(_wakeup.wait(), timeout=REACTION_JOB_IDLE_WAIT)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            for job in jobs:
+                error = await run_job(job)
+                with Session(engine) as session:
+                    job = session.get(ReactionJob, job.id)
+                    if job is not None and job.locked_by == worker_id:
+                        finish_job(session, job, error)
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Reaction worker {worker_id} error: {e}")
+            import traceback
+            traceback.print_exc()
+            await asyncio.sleep(REACTION_JOB_IDLE_WAIT)
+
+
+def start_reaction_workers(count: int = REACTION_WORKERS) -> List[asyncio.Task]:
+    global _wakeup
+    _wakeup = asyncio.Event()
+    prefix = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    return [asyncio.create_task(reaction_worker(f"{prefix}-{index}")) for index in range(count)]
@@ -18,6 +18,9 @@ from app.reaction import Reaction
 from app.oauth2 import oauth2_scheme
 from app.schemas.services import AreaCreate, AreaRead, AreaDetailRead, AreaActionDetail, AreaReactionDetail, ServiceBasicRead, ActionRead, ReactionRead
 from app.user import get_user_from_token
+from app.trigger_index import trigger_index
+from app.poll_scheduler import poll_scheduler
+from app.area_loader import load_area_relations
 
 areas_router = APIRouter(
     prefix="/areas",
@@ -94,6 +97,8 @@ async def create_area(area_data: AreaCreate, session: SessionDep, token: TokenDe
     session.add(area)
     session.commit()
     session.refresh(area)
+    trigger_index.upsert_area(session, area)
+    poll_scheduler.upsert_area(session, area)
 
     from app.webhook_manager import WebhookManager
     try:
@@ -109,19 +114,13 @@ def list_areas(session: SessionDep, token: TokenDep):
     user = get_user_from_token(token, session)
     if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    statement = select(Area).where(Area.user_id == user.id)
-    areas = session.exec(statement).all()
-    
     result = []
-    for area in areas:
-        action_service = session.get(Service, area.action_service_id)
-        action = session.get(Action, area.action_id)
-
-        reaction_service = session.get(Service, area.reaction_service_id)
-        reaction = session.get(Reaction, area.reaction_id)
-        
-        if not all([action_service, action, reaction_service, reaction]):
-            continue
+    for relations in load_area_relations(session, user_id=user.id):
+        area = relations.area
+        action_service = relations.action_service
+        action = relations.action
+        reaction_service = relations.reaction_service
+        reaction = relations.reaction
 
         area_name = area.name or f"{action.name} → {reaction.name}"
         
@@ -187,6 +186,8 @@ def toggle_area(area_id: int, session: SessionDep, token: TokenDep):
     session.add(area)
     session.commit()
     session.refresh(area)
+    trigger_index.upsert_area(session, area)
+    poll_scheduler.upsert_area(session, area)
     return AreaRead.model_validate(area)
 
 
@@ -203,3 +204,5 @@ async def delete_area(area_id: int, session: SessionDep, token: TokenDep):
     
     session.delete(area)
     session.commit()
+    trigger_index.remove_area(area_id)
+    poll_scheduler.remove_area(area_id)
@@ -129,7 +129,7 @@ def disconnect_service(
     return {"success": True, "message": "Service disconnected"}
 
 @service_accounts_router.post("/{service_account_id}/refresh", tags=["service-accounts"])
-def refresh_service_token(
+async def refresh_service_token(
     service_account_id: int,
     session: SessionDep,
     token: TokenDep
@@ -146,7 +146,7 @@ def refresh_service_token(
         raise HTTPException(status_code=403, detail="Forbidden")
     
     try:
-        refreshed = refresh_service_account_token(session, service_account)
+        refreshed = await refresh_service_account_token(session, service_account)
         return {
             "success": True,
             "message": "Token refreshed successfully",
@@ -187,7 +187,7 @@ def get_my_oauth_connections(session: SessionDep, token: TokenDep):
 
 
 @service_accounts_router.post("/oauth-connections/{connection_id}/refresh", tags=["oauth"])
-def refresh_oauth_connection_endpoint(
+async def refresh_oauth_connection_endpoint(
     connection_id: int,
     session: SessionDep,
     token: TokenDep
@@ -204,7 +204,7 @@ def refresh_oauth_connection_endpoint(
         raise HTTPException(status_code=403, detail="Forbidden")
     
     try:
-        refreshed = refresh_oauth_connection(session, oauth_conn)
+        refreshed = await refresh_oauth_connection(session, oauth_conn)
         return {
             "success": True,
             "message": "OAuth connection refreshed successfully",
@@ -219,12 +219,12 @@ def refresh_oauth_connection_endpoint(
         )
 
 @service_accounts_router.post("/admin/refresh-expired-tokens", tags=["admin"])
-def admin_refresh_all_expired_tokens(
+async def admin_refresh_all_expired_tokens(
     session: SessionDep,
     max_count: int = 100
 ):
     try:
-        stats = batch_refresh_expired_tokens(session, max_count=max_count)
+        stats = await batch_refresh_expired_tokens(session, max_count=max_count)
         return {
             "success": True,
             "stats": stats,
@@ -1,14 +1,51 @@
 from fastapi import APIRouter, Request, HTTPException, Header
-from typing import Optional, Dict, Any
+from dataclasses import asdict
+from typing import Optional, Dict, Any, List
+from sqlmodel import Session
 import os
 
-from app.area_engine import trigger_areas_with_handlers
+from app.area_engine import enqueue_areas_with_handlers
+from app.db import engine
+from app.delivery_dedup import body_delivery_id, delivery_deduplicator
 from app.handlers import get_handlers_for_event, get_webhook_handler, process_webhook
 
 webhooks_router = APIRouter(prefix="/webhooks", tags=["webhooks"])
 
-@webhooks_router.post("/github")
-async def github_webhook(request: Request, x_hub_signature_256: Optional[str] = Header(None), x_github_event: Optional[str] = Header(None)):
+
+def is_duplicate_delivery(provider: str, delivery_id: Optional[str]) -> bool:
+    if not delivery_id:
+        return False
+    with Session(engine) as session:
+        return delivery_deduplicator.is_duplicate(session, provider, delivery_id)
+
+
+def forget_delivery(provider: str, delivery_id: Optional[str]) -> None:
+    if not delivery_id:
+        return
+    with Session(engine) as session:
+        delivery_deduplicator.forget(session, provider, delivery_id)
+
+
+async def enqueue_results(service: str, results) -> List[Dict[str, Any]]:
+    area_outcomes = []
+    for result in results:
+        if result.triggered:
+            outcomes = await enqueue_areas_with_handlers(
+                service=service,
+                event_type=result.event_type,
+                payload=result.payload
+            )
+            area_outcomes.extend(asdict(outcome) for outcome in outcomes)
+    return area_outcomes
+
+
+@webhooks_router.get("/stats")
+async def webhook_stats():
+    return {"deduplication": delivery_deduplicator.stats()}
+
+
+@webhooks_router.post("/github", status_code=202)
+async def github_webhook(request: Request, x_hub_signature_256: Optional[str] = Header(None), x_github_event: Optional[str] = Header(None), x_github_delivery: Optional[str] = Header(None)):
     body = await request.body()
     headers = dict(request.headers)
 
@@ -19,6 +56,10 @@ async def github_webhook(request: Request, x_hub_signature_256: Optional[str] =
             is_valid = await handler.verify_signature(body, headers, webhook_secret)
             if not is_valid:
                 raise HTTPException(status_code=401, detail="Invalid signature")
+
+    delivery_id = x_github_delivery or (body_delivery_id(body) if body else None)
+    if is_duplicate_delivery("github", delivery_id):
+        return {"status": "duplicate", "delivery": delivery_id}
     
     try:
         payload = await request.json()
@@ -28,22 +69,19 @@ async def github_webhook(request: Request, x_hub_signature_256: Optional[str] =
     event_type = x_github_event or "unknown"
     print(f"GitHub webhook received: {event_type}")
 
-    results = await process_webhook("github", event_type, payload, headers, body)
-    
-    triggered_count = 0
-    for result in results:
-        if result.triggered:
-            await trigger_areas_with_handlers(
-                service="github",
-                event_type=result.event_type,
-                payload=result.payload
-            )
-            triggered_count += 1
+    try:
+        results = await process_webhook("github", event_type, payload, headers, body)
+        triggered_count = sum(1 for result in results if result.triggered)
+        area_outcomes = await enqueue_results("github", results)
+    except Exception:
+        forget_delivery("github", delivery_id)
+        raise
     
     return {
-        "status": "ok", 
+        "status": "accepted", 
         "event": event_type,
-        "handlers_triggered": triggered_count
+        "handlers_triggered": triggered_count,
+        "areas": area_outcomes
     }
 
 @webhooks_router.get("/github")
@@ -53,7 +91,7 @@ async def github_webhook_verify(request: Request):
         return {"challenge": challenge}
     return {"status": "ok"}
 
-@webhooks_router.post("/trello")
+@webhooks_router.post("/trello", status_code=202)
 async def trello_webhook(request: Request):
     body = await request.body()
     headers = dict(request.headers)
@@ -65,6 +103,10 @@ async def trello_webhook(request: Request):
             is_valid = await handler.verify_signature(body, headers, webhook_secret)
             if not is_valid:
                 raise HTTPException(status_code=401, detail="Invalid signature")
+
+    delivery_id = body_delivery_id(body) if body else None
+    if is_duplicate_delivery("trello", delivery_id):
+        return {"status": "duplicate", "delivery": delivery_id}
     
     try:
         payload = await request.json()
@@ -75,20 +117,17 @@ async def trello_webhook(request: Request):
     action_type = action.get("type", "unknown")
     print(f"Trello webhook received: {action_type}")
 
-    results = await process_webhook("trello", action_type, payload, headers, body)
-    
-    triggered_count = 0
-    for result in results:
-        if result.triggered:
-            await trigger_areas_with_handlers(
-                service="trello",
-                event_type=result.event_type,
-                payload=result.payload
-            )
-            triggered_count += 1
+    try:
+        results = await process_webhook("trello", action_type, payload, headers, body)
+        triggered_count = sum(1 for result in results if result.triggered)
+        area_outcomes = await enqueue_results("trello", results)
+    except Exception:
+        forget_delivery("trello", delivery_id)
+        raise
     
     return {
-        "status": "ok", 
+        "status": "accepted", 
         "event": action_type,
-        "handlers_triggered": triggered_count
+        "handlers_triggered": triggered_count,
+        "areas": area_outcomes
     }
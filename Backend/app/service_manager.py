@@ -1,11 +1,9 @@
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Any
 from sqlmodel import Session, select, func
-from fastapi import HTTPException
 
 from app.oauth_models import Service, ServiceAccount
 from app.oauth_handler import exchange_code_for_token, get_user_info_from_provider
-from app.core.oauth_config import providers_registry
 
 
 def get_service_by_name(session: Session, service_name: str) -> Optional[Service]:
@@ -101,83 +99,9 @@ def disconnect_service_account(session: Session, user_id: int, service_id: int)
     return False
 
 
-def refresh_service_token(session: Session, service_account: ServiceAccount) -> ServiceAccount:
-    if not service_account.refresh_token:
-        raise HTTPException(
-            status_code=400,
-            detail="No refresh token available for this service account"
-        )
-    
-    service = session.get(Service, service_account.service_id)
-    if not service:
-        raise HTTPException(status_code=404, detail="Service not found")
-    
-    registry = providers_registry()
-    if service.oauth_provider not in registry:
-        raise HTTPException(
-            status_code=400,
-            detail=f"OAuth provider not configured: {service.oauth_provider}"
-        )
-    
-    provider = registry[service.oauth_provider]
-    
-    import requests
-    
-    token_data = {
-        "client_id": provider.web.client_id if provider.web else "",
-        "client_secret": provider.web.client_secret if provider.web else "",
-        "refresh_token": service_account.refresh_token,
-        "grant_type": "refresh_token",
-    }
-    
-    try:
-        response = requests.post(
-            provider.token_url,
-            data=token_data,
-            headers={"Accept": "application/json"},
-            timeout=10
-        )
-        
-        if response.status_code != 200:
-            service_account.error_count += 1
-            service_account.last_error = f"Token refresh failed: {response.text}"
-            session.add(service_account)
-            session.commit()
-            raise HTTPException(
-                status_code=400,
-                detail=f"Token refresh failed: {response.text}"
-            )
-        
-        token_response = response.json()
-        
-        service_account.access_token = token_response.get("access_token", service_account.access_token)
-        
-        if "refresh_token" in token_response:
-            service_account.refresh_token = token_response["refresh_token"]
-        
-        expires_in = token_response.get("expires_in")
-        if expires_in:
-            service_account.expires_at = datetime.utcnow() + timedelta(seconds=expires_in)
-        
-        service_account.error_count = 0
-        service_account.last_error = None
-        service_account.updated_at = datetime.utcnow()
-        
-        session.add(service_account)
-        session.commit()
-        session.refresh(service_account)
-        
-        return service_account
-    
-    except requests.RequestException as e:
-        service_account.error_count += 1
-        service_account.last_error = f"Network error: {str(e)}"
-        session.add(service_account)
-        session.commit()
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error refreshing token: {str(e)}"
-        )
+async def refresh_service_token(session: Session, service_account: ServiceAccount) -> ServiceAccount:
+    from app.token_refresh import refresh_service_account_token
+    return await refresh_service_account_token(session, service_account)
 
 
 def is_token_expired(service_account: ServiceAccount) -> bool:
@@ -189,9 +113,6 @@ def is_token_expired(service_account: ServiceAccount) -> bool:
     return datetime.utcnow() + buffer >= service_account.expires_at
 
 
-def get_valid_token(session: Session, service_account: ServiceAccount) -> str:
-
-    if is_token_expired(service_account):
-        service_account = refresh_service_token(session, service_account)
-    
-    return service_account.access_token
+async def get_valid_token(session: Session, service_account: ServiceAccount) -> str:
+    from app.token_manager import token_manager
+    return await token_manager.ensure_valid(session, service_account)
@@ -0,0 +1,250 @@
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlmodel import Session
+import asyncio
+import os
+import time
+import zlib
+import httpx
+
+from app.concurrency import ConcurrencyLimiter
+from app.core.oauth_config import providers_registry
+from app.http_clients import client_for
+from app.oauth_models import OAuthConnection, ServiceAccount, Service
+
+TOKEN_REFRESH_MARGIN = int(os.getenv("TOKEN_REFRESH_MARGIN", "300"))
+TOKEN_REFRESH_TIMEOUT = float(os.getenv("TOKEN_REFRESH_TIMEOUT", "10"))
+TOKEN_REFRESH_LOCK_WAIT = float(os.getenv("TOKEN_REFRESH_LOCK_WAIT", "15"))
+TOKEN_REFRESH_LOCK_POLL = float(os.getenv("TOKEN_REFRESH_LOCK_POLL", "0.1"))
+TOKEN_REFRESH_LOCKS = int(os.getenv("TOKEN_REFRESH_LOCKS", "8"))
+
+# A refresh holds a lock connection across the provider call and a short
+# session next to it, so the number in flight bounds the pool it needs.
+refresh_slots = ConcurrencyLimiter(global_limit=TOKEN_REFRESH_LOCKS, default_key_limit=TOKEN_REFRESH_LOCKS)
+
+
+async def request_token_refresh(provider_name: str, token_url: str, token_data: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        response = await client_for(provider_name).post(
+            token_url,
+            data=token_data,
+            headers={"Accept": "application/json"},
+            timeout=TOKEN_REFRESH_TIMEOUT
+        )
+    except httpx.RequestError as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Network error during token refresh: {str(e)}"
+        )
+
+    if response.status_code != 200:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Token refresh failed: {response.text}"
+        )
+
+    token_response = response.json()
+    if "access_token" not in token_response:
+        raise HTTPException(
+            status_code=500,
+            detail="Token refresh response missing access_token"
+        )
+    return token_response
+
+
+# Executors and pollers get their tokens from here. Concurrent callers for
+# one ServiceAccount or OAuthConnection share a single in-flight refresh;
+# across processes the refresh runs under an advisory lock, and whoever gets
+# the lock second finds the token already fresh and skips the provider call.
+class TokenManager:
+    def __init__(self, engine=None, margin: int = TOKEN_REFRESH_MARGIN):
+        self._engine = engine
+        self.margin = margin
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._inflight: Dict[Tuple[str, int], asyncio.Future] = {}
+        self.refreshes = 0
+        self.skipped = 0
+        self.joined = 0
+        self.failures = 0
+
+    @property
+    def engine(self):
+        if self._engine is not None:
+            return self._engine
+        from app.db import engine
+        return engine
+
+    def needs_refresh(self, row: Any, margin: Optional[int] = None) -> bool:
+        if not row.expires_at or not row.refresh_token:
+            return False
+        margin = self.margin if margin is None else margin
+        return datetime.utcnow() + timedelta(seconds=margin) >= row.expires_at
+
+    # Provider calls follow, so the caller's connection is released first.
+    async def ensure_valid(self, session: Session, service_account: ServiceAccount) -> str:
+        from app.db import release_connection
+        needs_refresh = self.needs_refresh(service_account)
+        release_connection(session)
+        if not needs_refresh:
+            return service_account.access_token
+        try:
+            await self.refresh(service_account.id)
+        except HTTPException:
+            # A token inside the margin is still usable.
+            if self.needs_refresh(service_account, margin=0):
+                raise
+            print(f"Token refresh failed for service account {service_account.id}, using current token")
+        session.refresh(service_account)
+        release_connection(session)
+        return service_account.access_token
+
+    async def refresh(self, account_id: int, force: bool = False, margin: Optional[int] = None) -> None:
+        await self._single_flight(ServiceAccount, account_id, force, margin)
+
+    async def refresh_connection(self, connection_id: int, force: bool = False, margin: Optional[int] = None) -> None:
+        await self._single_flight(OAuthConnection, connection_id, force, margin)
+
+    async def _single_flight(self, model, row_id: int, force: bool, margin: Optional[int]) -> None:
+        loop = asyncio.get_event_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._inflight = {}
+
+        key = (model.__tablename__, row_id)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._refresh(model, row_id, force, margin))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.joined += 1
+        # Shielded so a cancelled caller does not cancel the refresh the
+        # others are waiting on.
+        await asyncio.shield(task)
+
+    # Serializes refreshes of one row across processes without holding a
+    # transaction or a row lock: a session-level advisory lock on its own
+    # autocommit connection, polled with pg_try_advisory_lock so waiting
+    # never blocks the event loop. Other databases only get the in-process
+    # single flight.
+    @asynccontextmanager
+    async def _row_lock(self, model, row_id: int):
+        engine = self.engine
+        if engine.dialect.name != "postgresql":
+            yield
+            return
+
+        key = (zlib.crc32(model.__tablename__.encode("utf-8")) - 2 ** 31, row_id)
+        connection = await asyncio.to_thread(lambda: engine.connect().execution_options(isolation_level="AUTOCOMMIT"))
+        try:
+            deadline = time.monotonic() + TOKEN_REFRESH_LOCK_WAIT
+            while not await asyncio.to_thread(
+                lambda: connection.execute(text("SELECT pg_try_advisory_lock(:a, :b)"), {"a": key[0], "b": key[1]}).scalar()
+            ):
+                if time.monotonic() > deadline:
+                    raise HTTPException(status_code=503, detail="Token refresh already in progress")
+                await asyncio.sleep(TOKEN_REFRESH_LOCK_POLL)
+            try:
+                yield
+            finally:
+                await asyncio.to_thread(
+                    lambda: connection.execute(text("SELECT pg_advisory_unlock(:a, :b)"), {"a": key[0], "b": key[1]})
+                )
+        finally:
+            await asyncio.to_thread(connection.close)
+
+    def _load_refresh(self, model, row_id: int, force: bool, margin: Optional[int]) -> Optional[Tuple[str, str]]:
+        with Session(self.engine) as session:
+            row = session.get(model, row_id)
+            if row is None:
+                raise HTTPException(status_code=404, detail="Token owner not found")
+            if not force and not self.needs_refresh(row, margin):
+                return None
+            if not row.refresh_token:
+                raise HTTPException(status_code=400, detail="No refresh token available")
+            if model is OAuthConnection:
+                return row.provider, row.refresh_token
+            service = session.get(Service, row.service_id)
+            if not service:
+                raise HTTPException(status_code=404, detail="Service not found")
+            return service.oauth_provider, row.refresh_token
+
+    def _store_refresh(self, model, row_id: int, token_response: Optional[Dict[str, Any]], error: Optional[str] = None) -> None:
+        with Session(self.engine) as session:
+            row = session.get(model, row_id)
+            if row is None:
+                return
+            if token_response is None:
+                if model is ServiceAccount:
+                    row.error_count += 1
+                    row.last_error = error
+                    session.add(row)
+                    session.commit()
+                return
+
+            row.access_token = token_response["access_token"]
+            if "refresh_token" in token_response:
+                row.refresh_token = token_response["refresh_token"]
+            # Without expires_in the old expires_at would stay in the past and
+            # make the token due again on every scan; it has no known expiry.
+            expires_in = token_response.get("expires_in")
+            row.expires_at = datetime.utcnow() + timedelta(seconds=int(expires_in)) if expires_in else None
+            if model is ServiceAccount:
+                row.error_count = 0
+                row.last_error = None
+            elif "scope" in token_response:
+                row.scope = token_response["scope"]
+            row.updated_at = datetime.utcnow()
+            session.add(row)
+            session.commit()
+
+    # The database is only touched in short transactions run in a thread;
+    # nothing is held open across the provider call but the advisory lock.
+    async def _refresh(self, model, row_id: int, force: bool, margin: Optional[int]) -> None:
+        async with refresh_slots.slot(model.__tablename__), self._row_lock(model, row_id):
+            refresh = await asyncio.to_thread(self._load_refresh, model, row_id, force, margin)
+            if refresh is None:
+                self.skipped += 1
+                return
+            provider_name, refresh_token = refresh
+
+            try:
+                registry = providers_registry()
+                if provider_name not in registry:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"OAuth provider not configured: {provider_name}"
+                    )
+                provider_config = registry[provider_name]
+
+                token_data = {
+                    "client_id": provider_config.web.client_id if provider_config.web else "",
+                    "refresh_token": refresh_token,
+                    "grant_type": "refresh_token",
+                }
+                if provider_config.web and provider_config.web.client_secret:
+                    token_data["client_secret"] = provider_config.web.client_secret
+
+                token_response = await request_token_refresh(provider_name, provider_config.token_url, token_data)
+            except HTTPException as e:
+                self.failures += 1
+                await asyncio.to_thread(self._store_refresh, model, row_id, None, str(e.detail))
+                raise
+
+            await asyncio.to_thread(self._store_refresh, model, row_id, token_response)
+            self.refreshes += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "refreshes": self.refreshes,
+            "skipped": self.skipped,
+            "joined": self.joined,
+            "failures": self.failures,
+            "in_flight": len(self._inflight),
+        }
+
+
+token_manager = TokenManager()
@@ -0,0 +1,176 @@
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Set, Tuple
+from sqlmodel import Session, select
+import asyncio
+import heapq
+import itertools
+import os
+import time
+
+from app.concurrency import ConcurrencyLimiter, parse_limits
+from app.oauth_models import OAuthConnection, ServiceAccount, Service
+from app.rate_limits import POLL, priority
+from app.token_manager import TokenManager, token_manager
+
+TOKEN_PROACTIVE_MARGIN = int(os.getenv("TOKEN_PROACTIVE_MARGIN", "600"))
+TOKEN_SCHEDULER_RESCAN = float(os.getenv("TOKEN_SCHEDULER_RESCAN", "60"))
+TOKEN_REFRESH_MAX_ERRORS = int(os.getenv("TOKEN_REFRESH_MAX_ERRORS", "5"))
+
+SERVICE_ACCOUNT = "service_account"
+OAUTH_CONNECTION = "oauth_connection"
+
+refresh_limiter = ConcurrencyLimiter(
+    global_limit=int(os.getenv("TOKEN_REFRESH_CONCURRENCY", "16")),
+    default_key_limit=int(os.getenv("TOKEN_REFRESH_PROVIDER_CONCURRENCY", "4")),
+    key_limits=parse_limits(os.getenv("TOKEN_REFRESH_PROVIDER_CONCURRENCY_LIMITS")),
+)
+
+
+def epoch(value: datetime) -> float:
+    return (value - datetime(1970, 1, 1)).total_seconds()
+
+
+# Heap of (refresh_at, sequence, kind, id) where refresh_at is expires_at
+# minus the margin. Expiries are picked up by a periodic scan of the tokens
+# expiring within the next two scans; an entry whose refresh_at no longer
+# matches the latest one for its token is skipped when it surfaces.
+class TokenRefreshScheduler:
+    def __init__(self, manager: Optional[TokenManager] = None, margin: int = TOKEN_PROACTIVE_MARGIN, clock=time.time):
+        self._manager = manager
+        self.margin = margin
+        self.clock = clock
+        self._heap: List[Tuple[float, int, str, int]] = []
+        self._due: Dict[Tuple[str, int], float] = {}
+        self._providers: Dict[Tuple[str, int], str] = {}
+        self._counter = itertools.count()
+        self._errors: Dict[Tuple[str, int], int] = {}
+        self.refreshed = 0
+        self.failures = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    @property
+    def manager(self) -> TokenManager:
+        return self._manager or token_manager
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def schedule(self, kind: str, row_id: int, provider: str, refresh_at: float) -> None:
+        key = (kind, row_id)
+        if self._due.get(key) == refresh_at or self._errors.get(key, 0) >= TOKEN_REFRESH_MAX_ERRORS:
+            return
+        self._due[key] = refresh_at
+        self._providers[key] = provider or "unknown"
+        heapq.heappush(self._heap, (refresh_at, next(self._counter), kind, row_id))
+
+    def load(self, session: Session, horizon: float = TOKEN_SCHEDULER_RESCAN * 2) -> int:
+        until = datetime.utcnow() + timedelta(seconds=self.margin + horizon)
+        accounts = session.exec(
+            select(ServiceAccount, Service)
+            .where(ServiceAccount.service_id == Service.id)
+            .where(ServiceAccount.is_active == True)
+            .where(ServiceAccount.refresh_token != None)
+            .where(ServiceAccount.error_count < TOKEN_REFRESH_MAX_ERRORS)
+            .where(ServiceAccount.expires_at != None)
+            .where(ServiceAccount.expires_at <= until)
+        ).all()
+        for account, service in accounts:
+            self.schedule(SERVICE_ACCOUNT, account.id, service.oauth_provider or service.name, epoch(account.expires_at) - self.margin)
+
+        connections = session.exec(
+            select(OAuthConnection)
+            .where(OAuthConnection.refresh_token != None)
+            .where(OAuthConnection.expires_at != None)
+            .where(OAuthConnection.expires_at <= until)
+        ).all()
+        for connection in connections:
+            self.schedule(OAUTH_CONNECTION, connection.id, connection.provider, epoch(connection.expires_at) - self.margin)
+        return len(accounts) + len(connections)
+
+    def pop_due(self, now: Optional[float] = None) -> List[Tuple[str, int, str, float]]:
+        now = self.clock() if now is None else now
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            refresh_at, _, kind, row_id = heapq.heappop(self._heap)
+            key = (kind, row_id)
+            if self._due.get(key) != refresh_at:
+                continue
+            del self._due[key]
+            due.append((kind, row_id, self._providers.pop(key), refresh_at))
+        return due
+
+    def next_due(self) -> Optional[float]:
+        while self._heap and self._due.get((self._heap[0][2], self._heap[0][3])) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    async def refresh_one(self, kind: str, row_id: int, provider: str, refresh_at: float) -> None:
+        with priority(POLL):
+            await self._refresh_one(kind, row_id, provider, refresh_at)
+
+    async def _refresh_one(self, kind: str, row_id: int, provider: str, refresh_at: float) -> None:
+        async with refresh_limiter.slot(provider):
+            lag = max(0.0, self.clock() - refresh_at)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            try:
+                if kind == OAUTH_CONNECTION:
+                    await self.manager.refresh_connection(row_id, margin=self.margin)
+                else:
+                    await self.manager.refresh(row_id, margin=self.margin)
+                self.refreshed += 1
+                self._errors.pop((kind, row_id), None)
+            except Exception as e:
+                # Retried on the next scans until TOKEN_REFRESH_MAX_ERRORS.
+                self.failures += 1
+                self._errors[(kind, row_id)] = self._errors.get((kind, row_id), 0) + 1
+                print(f"Proactive refresh of {kind} {row_id} failed: {e}")
+
+    async def run(self, engine, owns=None, rescan: float = TOKEN_SCHEDULER_RESCAN):
+        refreshes: Set[asyncio.Task] = set()
+        next_scan = 0.0
+        try:
+            while True:
+                now = self.clock()
+                if now >= next_scan:
+                    try:
+                        with Session(engine) as session:
+                            self.load(session, horizon=rescan * 2)
+                    except Exception as e:
+                        print(f"Token refresh scan failed: {e}")
+                    next_scan = now + rescan
+
+                for kind, row_id, provider, refresh_at in self.pop_due():
+                    # With several pollers each token is refreshed by the
+                    # owner of its partition only.
+                    if owns is not None and not owns(f"token:{kind}:{row_id}"):
+                        continue
+                    task = asyncio.create_task(self.refresh_one(kind, row_id, provider, refresh_at))
+                    refreshes.add(task)
+                    task.add_done_callback(refreshes.discard)
+
+                next_due = self.next_due()
+                wake_at = next_scan if next_due is None else min(next_scan, next_due)
+                await asyncio.sleep(max(0.05, wake_at - self.clock()))
+        finally:
+            for task in refreshes:
+                task.cancel()
+            if refreshes:
+                await asyncio.gather(*refreshes, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        next_due = self.next_due()
+        return {
+            "scheduled": len(self._due),
+            "refreshed": self.refreshed,
+            "failures": self.failures,
+            "given_up": sum(1 for count in self._errors.values() if count >= TOKEN_REFRESH_MAX_ERRORS),
+            "last_lag": self.last_lag,
+            "max_lag": self.max_lag,
+            "next_due_in": None if next_due is None else max(0.0, next_due - self.clock()),
+            "in_flight": refresh_limiter.in_flight,
+        }
+
+
+token_refresh_scheduler = TokenRefreshScheduler()
@@ -0,0 +1,218 @@
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Set, Tuple
+from sqlmodel import Session
+import os
+import threading
+import time
+
+from app.oauth_models import Area, Service
+from app.reaction import Reaction
+from app.area_loader import load_area_relations
+from app.area_templates import CompiledParams, get_area_templates, invalidate_area_templates
+
+
+TRIGGER_INDEX_MAX_AGE = int(os.getenv("AREA_TRIGGER_INDEX_MAX_AGE", "300"))
+
+
+@dataclass
+class IndexedArea:
+    id: int
+    user_id: int
+    name: Optional[str]
+    action_id: int
+    reaction_id: int
+    reaction_name: str
+    reaction_key: str
+    reaction_service_name: str
+    params_action: Dict[str, Any] = field(default_factory=dict)
+    params_reaction: Dict[str, Any] = field(default_factory=dict)
+    reaction_templates: CompiledParams = ()
+
+    @classmethod
+    def from_models(cls, area: Area, reaction: Reaction, reaction_service: Service) -> "IndexedArea":
+        from app.area_engine import reaction_name_to_key
+
+        return cls(
+            id=area.id,
+            user_id=area.user_id,
+            name=area.name,
+            action_id=area.action_id,
+            reaction_id=reaction.id,
+            reaction_name=reaction.name,
+            reaction_key=reaction_name_to_key(reaction.name),
+            reaction_service_name=reaction_service.name,
+            params_action=area.params_action or {},
+            params_reaction=area.params_reaction or {},
+            reaction_templates=get_area_templates(area.id, area.params_reaction or {}),
+        )
+
+
+def indexable_conditions(params: Dict[str, Any]) -> Dict[str, Any]:
+    conditions = {}
+    for key, expected_value in (params or {}).items():
+        if expected_value == "" or expected_value is None:
+            continue
+        try:
+            hash(expected_value)
+        except TypeError:
+            continue
+        conditions[key] = expected_value
+    return conditions
+
+
+# Inverted index over the equality conditions of the areas sharing one action.
+# For every condition key it keeps value -> area ids, plus the areas that do
+# not filter on that key (empty string / missing means wildcard). Candidates
+# still go through check_action_conditions, the index only narrows the set.
+class TriggerBucket:
+    def __init__(self):
+        self.areas: Dict[int, IndexedArea] = {}
+        self._by_value: Dict[str, Dict[Any, Set[int]]] = {}
+        self._wildcards: Dict[str, Set[int]] = {}
+        self._conditions: Dict[int, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self.areas)
+
+    def add(self, area: IndexedArea) -> None:
+        self.remove(area.id)
+        conditions = indexable_conditions(area.params_action)
+
+        for key in conditions:
+            if key not in self._by_value:
+                self._by_value[key] = {}
+                self._wildcards[key] = set(self.areas)
+
+        self.areas[area.id] = area
+        self._conditions[area.id] = conditions
+        for key, values in self._by_value.items():
+            if key in conditions:
+                values.setdefault(conditions[key], set()).add(area.id)
+            else:
+                self._wildcards[key].add(area.id)
+
+    def remove(self, area_id: int) -> None:
+        if self.areas.pop(area_id, None) is None:
+            return
+
+        conditions = self._conditions.pop(area_id)
+        for key in list(self._by_value):
+            values = self._by_value[key]
+            if key in conditions:
+                area_ids = values[conditions[key]]
+                area_ids.discard(area_id)
+                if not area_ids:
+                    del values[conditions[key]]
+            else:
+                self._wildcards[key].discard(area_id)
+            if not values:
+                del self._by_value[key]
+                del self._wildcards[key]
+
+    def candidates(self, payload: Optional[Dict[str, Any]] = None) -> List[IndexedArea]:
+        from app.area_engine import get_nested_value
+
+        if payload is None:
+            return list(self.areas.values())
+
+        best: Optional[Tuple[Set[int], Set[int]]] = None
+        best_size = len(self.areas)
+        for key, values in self._by_value.items():
+            actual_value = get_nested_value(payload, key)
+            if actual_value is None:
+                continue
+            try:
+                matched = values.get(actual_value, set())
+            except TypeError:
+                continue
+
+            size = len(matched) + len(self._wildcards[key])
+            if best is None or size < best_size:
+                best = (matched, self._wildcards[key])
+                best_size = size
+
+        if best is None:
+            return list(self.areas.values())
+
+        area_ids = sorted(best[0] | best[1])
+        return [self.areas[area_id] for area_id in area_ids]
+
+
+# (service name, event key) -> active areas, kept in sync by routers/areas.py.
+# The periodic full rebuild picks up changes made by other processes.
+class TriggerIndex:
+    def __init__(self, max_age: int = TRIGGER_INDEX_MAX_AGE):
+        self.max_age = max_age
+        self._buckets: Dict[Tuple[str, str], TriggerBucket] = {}
+        self._area_keys: Dict[int, Tuple[str, str]] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _is_stale(self) -> bool:
+        if self._loaded_at is None:
+            return True
+        return self.max_age > 0 and time.monotonic() - self._loaded_at > self.max_age
+
+    def _query_active_areas(self, session: Session, area_id: Optional[int] = None):
+        from app.area_engine import action_name_to_key
+
+        area_ids = [area_id] if area_id is not None else None
+        for relations in load_area_relations(session, area_ids=area_ids, active_only=True):
+            key = (relations.action_service.name, action_name_to_key(relations.action.name))
+            yield key, IndexedArea.from_models(relations.area, relations.reaction, relations.reaction_service)
+
+    def rebuild(self, session: Session) -> None:
+        buckets: Dict[Tuple[str, str], TriggerBucket] = {}
+        area_keys: Dict[int, Tuple[str, str]] = {}
+        for key, entry in self._query_active_areas(session):
+            buckets.setdefault(key, TriggerBucket()).add(entry)
+            area_keys[entry.id] = key
+
+        with self._lock:
+            self._buckets = buckets
+            self._area_keys = area_keys
+            self._loaded_at = time.monotonic()
+        print(f"Trigger index rebuilt: {len(area_keys)} active areas in {len(buckets)} buckets")
+
+    def lookup(self, session: Session, service: str, event_key: str, payload: Optional[Dict[str, Any]] = None) -> List[IndexedArea]:
+        if self._is_stale():
+            self.rebuild(session)
+        with self._lock:
+            bucket = self._buckets.get((service, event_key))
+            if bucket is None:
+                return []
+            return bucket.candidates(payload)
+
+    def _discard(self, area_id: int) -> None:
+        key = self._area_keys.pop(area_id, None)
+        if key is None:
+            return
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket.remove(area_id)
+            if not bucket:
+                del self._buckets[key]
+
+    def upsert_area(self, session: Session, area: Area) -> None:
+        if self._loaded_at is None:
+            return
+
+        invalidate_area_templates(area.id)
+        rows = list(self._query_active_areas(session, area.id)) if area.is_active else []
+        with self._lock:
+            self._discard(area.id)
+            for key, entry in rows:
+                self._buckets.setdefault(key, TriggerBucket()).add(entry)
+                self._area_keys[entry.id] = key
+
+    def remove_area(self, area_id: int) -> None:
+        invalidate_area_templates(area_id)
+        with self._lock:
+            self._discard(area_id)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._loaded_at = None
+
+
+trigger_index = TriggerIndex()
@@ -0,0 +1,96 @@
+# Micro-benchmark for reaction parameter interpolation on a GitHub push payload.
+# Run from Backend/: python -m benchmarks.interpolation_bench
+import re
+import timeit
+
+from app.area_templates import compile_params, render_params
+
+
+def legacy_get_nested_value(data, path):
+    if path in data:
+        return data[path]
+    value = data
+    for component in re.split(r'[\.\[]', path):
+        if not component:
+            continue
+        if component.endswith(']'):
+            index = int(component[:-1])
+            if isinstance(value, list) and 0 <= index < len(value):
+                value = value[index]
+            else:
+                return None
+        elif isinstance(value, dict):
+            value = value.get(component)
+        else:
+            return None
+        if value is None:
+            return None
+    return value
+
+
+def legacy_interpolate_parameters(params, data):
+    result = {}
+    for key, value in params.items():
+        if isinstance(value, str) and "{{" in value and "}}" in value:
+            def replace_var(match):
+                var_value = legacy_get_nested_value(data, match.group(1).strip())
+                return str(var_value) if var_value is not None else ""
+            result[key] = re.sub(r'\{\{([^}]+)\}\}', replace_var, value)
+        else:
+            result[key] = value
+    return result
+
+
+def github_push_payload(commit_count=20):
+    commits = [
+        {
+            "id": f"{i:040x}",
+            "message": f"Commit number {i}\n\nSome longer description of the change.",
+            "url": f"https://github.com/octo/repo/commit/{i:040x}",
+            "author": {"name": "Octo Cat", "email": "octo@example.com"},
+        }
+        for i in range(commit_count)
+    ]
+    return {
+        "repository.full_name": "octo/repo",
+        "repository.name": "repo",
+        "repository": "octo/repo",
+        "pusher.name": "octocat",
+        "pusher.email": "octo@example.com",
+        "ref": "refs/heads/main",
+        "branch": "main",
+        "commits": commits,
+        "commits_count": len(commits),
+        "head_commit.message": commits[-1]["message"],
+        "head_commit.id": commits[-1]["id"],
+        "head_commit.url": commits[-1]["url"],
+        "compare": "https://github.com/octo/repo/compare/a...b",
+        "sender.login": "octocat",
+        "sender": "octocat",
+    }
+
+
+REACTION_PARAMS = {
+    "repository": "octo/notifications",
+    "title": "Push on {{repository.full_name}} ({{branch}}) by {{pusher.name}}",
+    "body": "{{commits_count}} commits, head {{head_commit.id}}: {{head_commit.message}}\n"
+            "First commit {{commits[0].id}} by {{commits[0].author.name}}\n{{compare}}",
+    "labels": "push,automated",
+}
+
+
+def main(number=20000):
+    payload = github_push_payload()
+    compiled = compile_params(REACTION_PARAMS)
+    assert render_params(compiled, payload) == legacy_interpolate_parameters(REACTION_PARAMS, payload)
+
+    legacy = timeit.timeit(lambda: legacy_interpolate_parameters(REACTION_PARAMS, payload), number=number)
+    precompiled = timeit.timeit(lambda: render_params(compiled, payload), number=number)
+
+    print(f"legacy re.sub:  {legacy / number * 1e6:7.2f} us/call")
+    print(f"precompiled:    {precompiled / number * 1e6:7.2f} us/call")
+    print(f"speedup:        {legacy / precompiled:7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
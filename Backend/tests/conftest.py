@@ -40,15 +40,25 @@ for key, value in IN_MEMORY_ENV.items():
 
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
 from sqlmodel import Session, SQLModel, create_engine
 
-from app import main as main_module
+from app import conditional_requests, main as main_module, poll_state
+from app.oauth2 import get_password_hash
+from app.oauth_models import Service, ServiceAccount
+from app.poll_state import PollState, PollStateStore
 from app.user import User
 from app.main import app
 import app.db as db_module
 
 APP_GET_SESSION = db_module.get_session
 
+
+@compiles(JSONB, "sqlite")
+def compile_jsonb_for_sqlite(type_, compiler, **kw):
+    return "JSON"
+
 TEST_DATABASE_URL = TEST_DB_URL
 engine = create_engine(TEST_DATABASE_URL, connect_args={"check_same_thread": False})
 db_module.engine = engine
@@ -99,3 +109,40 @@ def session(fresh_db) -> Generator[Session, None, None]:
 def client(fresh_db) -> TestClient:
     with TestClient(app) as test_client:
         yield test_client
+
+
+SERVICE_ACCOUNT_TABLES = [Service.__table__, ServiceAccount.__table__, PollState.__table__]
+
+
+# One user with an account on one service, and a fresh poll state store.
+# Parametrise indirectly to change the service or the account's tokens:
+# {"service": "spotify", "refresh_token": "r", "expires_in": 30}.
+@pytest.fixture
+def service_account_session(request, session, monkeypatch):
+    from datetime import datetime, timedelta
+
+    options = getattr(request, "param", None) or {}
+    service_name = options.get("service", "google")
+    SQLModel.metadata.drop_all(engine, tables=SERVICE_ACCOUNT_TABLES)
+    SQLModel.metadata.create_all(engine, tables=SERVICE_ACCOUNT_TABLES)
+    store = PollStateStore()
+    monkeypatch.setattr(poll_state, "poll_state_store", store)
+    monkeypatch.setattr(conditional_requests, "poll_state_store", store)
+
+    user = User(email="lee@example.com", name="Lee", hashed_password=get_password_hash("Sup3rSecret!"))
+    service = Service(name=service_name, display_name=service_name.title(), oauth_provider=service_name)
+    session.add_all([user, service])
+    session.commit()
+    expires_in = options.get("expires_in")
+    account = ServiceAccount(
+        user_id=user.id,
+        service_id=service.id,
+        access_token=options.get("access_token", "token"),
+        refresh_token=options.get("refresh_token"),
+        expires_at=datetime.utcnow() + timedelta(seconds=expires_in) if expires_in is not None else None,
+    )
+    session.add(account)
+    session.commit()
+    session.refresh(account)
+    yield session, account
+    SQLModel.metadata.drop_all(engine, tables=SERVICE_ACCOUNT_TABLES)
@@ -0,0 +1,72 @@
+import asyncio
+
+from sqlmodel import create_engine, select
+
+from app import area_engine
+from app.area_templates import compile_params
+from app.concurrency import ConcurrencyLimiter
+from app.executors.base import EXECUTORS
+from app.oauth_models import ServiceAccount
+from app.token_manager import token_manager
+from app.trigger_index import IndexedArea
+from tests.conftest import engine
+
+
+# Loads its account like the real executors, then waits on the provider.
+class AccountExecutor:
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.sent = []
+        self.running = 0
+        self.peak = 0
+
+    async def execute(self, user_id, parameters, session):
+        account = session.exec(select(ServiceAccount).where(ServiceAccount.user_id == user_id)).first()
+        await token_manager.ensure_valid(session, account)
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(0.05)
+        self.running -= 1
+        if parameters["text"] == self.fail_on:
+            raise Exception("provider rejected the call")
+        self.sent.append(parameters["text"])
+        return True
+
+
+def make_area(area_id, user_id, action_params=None):
+    params = {"text": "{{message}}"}
+    return IndexedArea(
+        id=area_id,
+        user_id=user_id,
+        name=f"area {area_id}",
+        action_id=1,
+        reaction_id=1,
+        reaction_name="Google - Send",
+        reaction_key="send",
+        reaction_service_name="google",
+        params_action=action_params or {},
+        params_reaction=params,
+        reaction_templates=compile_params(params),
+    )
+
+
+def test_executions_report_each_area_without_holding_connections(monkeypatch, service_account_session):
+    session, account = service_account_session
+    user_id = account.user_id
+    executor = AccountExecutor(fail_on="m3")
+    small_pool = create_engine(engine.url, connect_args={"check_same_thread": False}, pool_size=1, max_overflow=0, pool_timeout=0.5)
+    monkeypatch.setattr(area_engine, "engine", small_pool)
+    monkeypatch.setattr(area_engine, "execution_limiter", ConcurrencyLimiter(global_limit=8, default_key_limit=8))
+    monkeypatch.setitem(EXECUTORS, "google", {"send": executor})
+
+    executions = [(make_area(n, user_id), {"message": f"m{n}"}) for n in range(4)]
+    executions.append((make_area(4, user_id, {"message": "other"}), {"message": "m4"}))
+    outcomes = asyncio.run(area_engine.execute_areas_concurrently(executions))
+    small_pool.dispose()
+
+    assert [(outcome.area_id, outcome.status) for outcome in outcomes] == [
+        (0, "executed"), (1, "executed"), (2, "executed"), (3, "failed"), (4, "skipped"),
+    ]
+    assert outcomes[3].error == "provider rejected the call"
+    assert sorted(executor.sent) == ["m0", "m1", "m2"]
+    assert executor.peak == 4
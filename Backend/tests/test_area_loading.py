@@ -0,0 +1,99 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import event
+from sqlmodel import SQLModel
+
+from app.action import Action
+from app.area_engine import index_areas
+from app.oauth2 import create_access_token, get_password_hash
+from app.oauth_models import Area, Service
+from app.reaction import Reaction
+from app.user import User
+from tests.conftest import engine
+
+CATALOG_TABLES = [Service.__table__, Action.__table__, Reaction.__table__, Area.__table__]
+
+
+@pytest.fixture
+def catalog_session(session):
+    SQLModel.metadata.drop_all(engine, tables=CATALOG_TABLES)
+    SQLModel.metadata.create_all(engine, tables=CATALOG_TABLES)
+    yield session
+    SQLModel.metadata.drop_all(engine, tables=CATALOG_TABLES)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(engine, "before_cursor_execute", self)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(engine, "before_cursor_execute", self)
+
+
+def seed_areas(session, count):
+    user = User(email="dana@example.com", name="Dana", hashed_password=get_password_hash("Sup3rSecret!"))
+    github = Service(name="github", display_name="GitHub")
+    discord = Service(name="discord", display_name="Discord")
+    session.add_all([user, github, discord])
+    session.commit()
+
+    action = Action(name="GitHub - Push", service_id=github.id, parameters={})
+    reaction = Reaction(name="Discord - Send Webhook Message", service_id=discord.id)
+    session.add_all([action, reaction])
+    session.commit()
+
+    areas = [
+        Area(
+            user_id=user.id,
+            action_service_id=github.id,
+            action_id=action.id,
+            reaction_service_id=discord.id,
+            reaction_id=reaction.id,
+            params_action={"repository.full_name": f"octo/repo{index}"},
+            params_reaction={"content": "{{head_commit.message}}"},
+        )
+        for index in range(count)
+    ]
+    session.add_all(areas)
+    session.commit()
+    return user, [area.id for area in areas]
+
+
+def count_list_areas_queries(client, user):
+    token = create_access_token(data={"sub": user.email}, expires=timedelta(minutes=5))
+    with QueryCounter() as counter:
+        response = client.get("/areas/", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    return counter.count, response.json()
+
+
+@pytest.mark.parametrize("area_count", [1, 12])
+def test_list_areas_uses_constant_number_of_queries(client, catalog_session, area_count):
+    user, _ = seed_areas(catalog_session, area_count)
+
+    queries, body = count_list_areas_queries(client, user)
+
+    assert len(body) == area_count
+    assert body[0]["action"]["service"]["name"] == "github"
+    assert body[0]["reaction"]["reaction"]["name"] == "Discord - Send Webhook Message"
+    assert queries == 2
+
+
+@pytest.mark.parametrize("area_count", [1, 12])
+def test_index_areas_uses_a_single_query(catalog_session, area_count):
+    _, area_ids = seed_areas(catalog_session, area_count)
+
+    with QueryCounter() as counter:
+        indexed = index_areas(catalog_session, area_ids)
+
+    assert counter.count == 1
+    assert sorted(indexed) == sorted(area_ids)
+    assert {area.reaction_service_name for area in indexed.values()} == {"discord"}
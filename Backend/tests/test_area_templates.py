@@ -0,0 +1,63 @@
+from app.area_engine import get_nested_value
+from app.area_templates import compile_params, compile_path, compile_template, get_area_templates, invalidate_area_templates, render_params, render_template
+
+
+PAYLOAD = {
+    "repository.full_name": "octo/repo",
+    "commits": [{"id": "abc", "author": {"name": "Octo"}}],
+    "pull_request": {"number": 7},
+    "empty": None,
+}
+
+
+def test_render_flat_nested_and_indexed_paths():
+    segments = compile_template("{{ repository.full_name }}#{{pull_request.number}} {{commits[0].author.name}}")
+    assert render_template(segments, PAYLOAD) == "octo/repo#7 Octo"
+
+
+def test_missing_values_render_as_empty_string():
+    segments = compile_template("[{{missing}}][{{empty}}][{{commits[3].id}}]")
+    assert render_template(segments, PAYLOAD) == "[][][]"
+
+
+def test_plain_strings_are_returned_unchanged():
+    assert compile_template("no templates {here}") == ("no templates {here}",)
+    assert render_template(compile_template("{{ unbalanced"), PAYLOAD) == "{{ unbalanced"
+
+
+def test_render_params_handles_lists_and_raw_values():
+    params = {
+        "title": "Push on {{repository.full_name}}",
+        "labels": ["{{commits[0].id}}", "static", 3],
+        "public": True,
+    }
+    assert render_params(compile_params(params), PAYLOAD) == {
+        "title": "Push on octo/repo",
+        "labels": ["abc", "static", 3],
+        "public": True,
+    }
+
+
+def test_area_templates_are_cached_until_params_change():
+    invalidate_area_templates(42)
+    first = get_area_templates(42, {"title": "{{repository.full_name}}"})
+    assert get_area_templates(42, {"title": "{{repository.full_name}}"}) is first
+
+    updated = get_area_templates(42, {"title": "{{commits[0].id}}"})
+    assert render_params(updated, PAYLOAD) == {"title": "abc"}
+    invalidate_area_templates(42)
+
+
+def test_get_nested_value_uses_cached_compiled_paths():
+    compile_path.cache_clear()
+    assert get_nested_value(PAYLOAD, "commits[0].author.name") == "Octo"
+    assert get_nested_value(PAYLOAD, "commits[0].author.name") == "Octo"
+    assert compile_path.cache_info().hits == 1
+    assert compile_path("commits[0].id") == ("commits", 0, "id")
+
+
+def test_get_nested_value_prefers_flat_keys_and_tolerates_bad_indexes():
+    compile_path.cache_clear()
+    assert get_nested_value(PAYLOAD, "repository.full_name") == "octo/repo"
+    assert compile_path.cache_info().misses == 0
+    assert get_nested_value(PAYLOAD, "commits[x].id") is None
@@ -0,0 +1,32 @@
+import asyncio
+
+from app.concurrency import ConcurrencyLimiter, parse_limits
+
+
+def test_parse_limits_ignores_invalid_entries():
+    assert parse_limits("google=4, Spotify=2,bad,discord=x") == {"google": 4, "spotify": 2}
+    assert parse_limits(None) == {}
+
+
+def test_limiter_bounds_global_and_per_key_concurrency():
+    limiter = ConcurrencyLimiter(global_limit=3, default_key_limit=2, key_limits={"spotify": 1})
+    running = {"google": 0, "spotify": 0, "total": 0}
+    peaks = {"google": 0, "spotify": 0, "total": 0}
+
+    async def task(key):
+        async with limiter.slot(key):
+            running[key] += 1
+            running["total"] += 1
+            for name in peaks:
+                peaks[name] = max(peaks[name], running[name])
+            await asyncio.sleep(0.01)
+            running[key] -= 1
+            running["total"] -= 1
+
+    async def main():
+        await asyncio.gather(*(task(key) for key in ["google"] * 5 + ["spotify"] * 5))
+
+    asyncio.run(main())
+
+    assert peaks == {"google": 2, "spotify": 1, "total": 3}
+    assert limiter.in_flight == 0 and limiter.waiting == 0
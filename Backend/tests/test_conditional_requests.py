@@ -0,0 +1,63 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+from sqlmodel import SQLModel
+
+from app import conditional_requests, http_clients
+from app.conditional_requests import ConditionalStats, conditional_get
+from app.handlers.trello import TrelloCardDueSoonHandler
+from app.http_clients import ProviderClients
+from app.poll_state import PollState, PollStateStore
+from tests.conftest import engine
+
+
+@pytest.fixture
+def state_session(session):
+    SQLModel.metadata.drop_all(engine, tables=[PollState.__table__])
+    SQLModel.metadata.create_all(engine, tables=[PollState.__table__])
+    yield session
+    SQLModel.metadata.drop_all(engine, tables=[PollState.__table__])
+
+
+def test_second_poll_sends_validators_and_gets_304(state_session, monkeypatch):
+    monkeypatch.setattr(conditional_requests, "poll_state_store", PollStateStore())
+    stats = ConditionalStats()
+    monkeypatch.setattr(conditional_requests, "conditional_stats", stats)
+    seen = []
+
+    def respond(request):
+        seen.append(request.headers.get("if-none-match"))
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, json={"items": []}, headers={"ETag": '"v1"'})
+
+    async def poll_twice():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(respond)) as client:
+            first = await conditional_get(state_session, client, "spotify.new_playlist_created", 7, "https://api.test/playlists", params={"limit": 50})
+            second = await conditional_get(state_session, client, "spotify.new_playlist_created", 7, "https://api.test/playlists", params={"limit": 50})
+            other_account = await conditional_get(state_session, client, "spotify.new_playlist_created", 8, "https://api.test/playlists", params={"limit": 50})
+        return first.status_code, second.status_code, other_account.status_code
+
+    assert asyncio.run(poll_twice()) == (200, 304, 200)
+    assert seen == [None, '"v1"', None]
+    assert stats.snapshot()["spotify.new_playlist_created"] == {"requests": 3, "not_modified": 1, "hit_ratio": 1 / 3}
+
+
+@pytest.mark.parametrize("service_account_session", [{"service": "trello"}], indirect=True)
+def test_due_soon_feeds_on_one_board_keep_their_own_validators(service_account_session, monkeypatch):
+    session, account = service_account_session
+    due = (datetime.now(timezone.utc) + timedelta(hours=2)).isoformat().replace("+00:00", "Z")
+
+    def respond(request):
+        if request.headers.get("if-none-match") == '"cards"':
+            return httpx.Response(304)
+        return httpx.Response(200, json=[{"id": "c1", "name": "Ship", "due": due, "dueComplete": False}], headers={"ETag": '"cards"'})
+
+    monkeypatch.setattr(http_clients, "provider_clients", ProviderClients(transport=httpx.MockTransport(respond)))
+    handler = TrelloCardDueSoonHandler()
+
+    for hours_before in (24, 48):
+        results = asyncio.run(handler.poll(session, account.user_id, {"board_id": "b1", "hours_before": hours_before}))
+        assert [result.payload["card.id"] for result in results] == ["c1"]
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlmodel import SQLModel
+
+from app.delivery_dedup import DeliveryDeduplicator, WebhookDelivery, body_delivery_id
+from tests.conftest import engine
+
+
+@pytest.fixture
+def dedup_session(session):
+    SQLModel.metadata.drop_all(engine, tables=[WebhookDelivery.__table__])
+    SQLModel.metadata.create_all(engine, tables=[WebhookDelivery.__table__])
+    yield session
+    SQLModel.metadata.drop_all(engine, tables=[WebhookDelivery.__table__])
+
+
+def test_replay_is_caught_in_memory_then_in_db(dedup_session):
+    dedup = DeliveryDeduplicator(ttl=60)
+    assert dedup.is_duplicate(dedup_session, "github", "delivery-1") is False
+    assert dedup.is_duplicate(dedup_session, "github", "delivery-1") is True
+    assert dedup.memory_hits == 1
+
+    dedup.clear_memory()
+    assert dedup.is_duplicate(dedup_session, "github", "delivery-1") is True
+    assert dedup.db_hits == 1
+    assert dedup.is_duplicate(dedup_session, "trello", "delivery-1") is False
+
+    stats = dedup.stats()
+    assert stats["misses"] == 2
+    assert stats["hit_rate"] == 0.5
+
+
+@pytest.mark.filterwarnings("error::sqlalchemy.exc.SAWarning")
+def test_expired_delivery_is_accepted_again(dedup_session):
+    dedup = DeliveryDeduplicator(ttl=60)
+    dedup_session.add(WebhookDelivery(
+        delivery_key="github:old",
+        provider="github",
+        expires_at=datetime.utcnow() - timedelta(seconds=1),
+    ))
+    dedup_session.commit()
+
+    assert dedup.is_duplicate(dedup_session, "github", "old") is False
+    dedup.clear_memory()
+    assert dedup.is_duplicate(dedup_session, "github", "old") is True
+
+
+def test_forgotten_delivery_can_be_retried(dedup_session):
+    dedup = DeliveryDeduplicator(ttl=60)
+    delivery_id = body_delivery_id(b'{"action": {}}')
+    assert dedup.is_duplicate(dedup_session, "trello", delivery_id) is False
+    dedup.forget(dedup_session, "trello", delivery_id)
+    assert dedup.is_duplicate(dedup_session, "trello", delivery_id) is False
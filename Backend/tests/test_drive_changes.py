@@ -0,0 +1,82 @@
+import asyncio
+
+import httpx
+
+from app import http_clients
+from app.handlers.google import GoogleDriveNewFileHandler
+from app.http_clients import ProviderClients
+
+
+def drive_file(file_id, created, parents, mime="application/pdf"):
+    return {"id": file_id, "name": file_id, "mimeType": mime, "createdTime": created, "parents": parents}
+
+
+def test_changes_feed_emits_new_files_once_for_every_area_of_the_account(service_account_session, monkeypatch):
+    session, account = service_account_session
+    user_id = account.user_id
+    page_tokens = []
+
+    def respond(request):
+        path = request.url.path
+        if path.endswith("/changes/startPageToken"):
+            return httpx.Response(200, json={"startPageToken": "1"})
+        if path.endswith("/files/root"):
+            return httpx.Response(200, json={"id": "root-id"})
+        page_tokens.append(request.url.params["pageToken"])
+        if request.url.params["pageToken"] == "1":
+            return httpx.Response(200, json={"nextPageToken": "2", "changes": [
+                {"fileId": "new-pdf", "file": drive_file("new-pdf", "2099-01-01T00:00:02Z", ["root-id"])},
+                {"fileId": "old-edit", "file": drive_file("old-edit", "2000-01-01T00:00:00Z", ["root-id"])},
+            ]})
+        if request.url.params["pageToken"] == "2":
+            return httpx.Response(200, json={"newStartPageToken": "3", "changes": [
+                {"fileId": "new-doc", "file": drive_file("new-doc", "2099-01-01T00:00:01Z", ["folder-a"], "application/vnd.google-apps.document")},
+                {"fileId": "trashed", "file": {**drive_file("trashed", "2099-01-01T00:00:03Z", ["root-id"]), "trashed": True}},
+            ]})
+        # An edit of an emitted file, and a file created before the newest
+        # emitted one whose change only shows up now.
+        return httpx.Response(200, json={"newStartPageToken": "4", "changes": [
+            {"fileId": "new-pdf", "file": drive_file("new-pdf", "2099-01-01T00:00:02Z", ["root-id"])},
+            {"fileId": "slow-upload", "file": drive_file("slow-upload", "2099-01-01T00:00:00Z", ["root-id"])},
+        ]})
+
+    monkeypatch.setattr(http_clients, "provider_clients", ProviderClients(transport=httpx.MockTransport(respond)))
+    handler = GoogleDriveNewFileHandler()
+    assert handler.coalescing_key(user_id, {"folder_id": "a"}) == handler.coalescing_key(user_id, {"folder_id": "b"})
+
+    assert asyncio.run(handler.poll(session, user_id, {})) == []
+    results = asyncio.run(handler.poll(session, user_id, {}))
+    assert [result.payload["file.id"] for result in results] == ["new-doc", "new-pdf"]
+    assert [result.payload["file.id"] for result in asyncio.run(handler.poll(session, user_id, {}))] == ["slow-upload"]
+    assert page_tokens == ["1", "2", "3"]
+
+    doc, pdf = (result.payload for result in results)
+    assert asyncio.run(handler.matches_conditions({"folder_id": "", "file_type": "pdf"}, pdf))
+    assert not asyncio.run(handler.matches_conditions({"folder_id": "root", "file_type": "document"}, pdf))
+    assert asyncio.run(handler.matches_conditions({"folder_id": "folder-a", "file_type": "document"}, doc))
+    assert handler.payload_for_area({"folder_id": "folder-a"}, doc)["folder_id"] == "folder-a"
+
+
+def test_emitted_ids_are_bounded_by_raising_the_floor(service_account_session, monkeypatch):
+    from app.handlers import google
+
+    session, account = service_account_session
+    files = [drive_file(f"f{index}", f"2099-01-01T00:00:0{index}Z", ["root-id"]) for index in range(4)]
+
+    def respond(request):
+        if request.url.path.endswith("/changes/startPageToken"):
+            return httpx.Response(200, json={"startPageToken": "1"})
+        if request.url.path.endswith("/files/root"):
+            return httpx.Response(200, json={"id": "root-id"})
+        return httpx.Response(200, json={"newStartPageToken": "2", "changes": [{"fileId": item["id"], "file": item} for item in files]})
+
+    monkeypatch.setattr(google, "DRIVE_EMITTED_LIMIT", 2)
+    monkeypatch.setattr(http_clients, "provider_clients", ProviderClients(transport=httpx.MockTransport(respond)))
+    handler = GoogleDriveNewFileHandler()
+    asyncio.run(handler.poll(session, account.user_id, {}))
+    assert len(asyncio.run(handler.poll(session, account.user_id, {}))) == 4
+
+    state = asyncio.run(handler.get_last_state(session, account.user_id))
+    assert sorted(state["emitted"]) == ["f2", "f3"]
+    assert state["created_after"].startswith("2099-01-01T00:00:01")
+    assert asyncio.run(handler.poll(session, account.user_id, {})) == []
@@ -0,0 +1,85 @@
+import asyncio
+import json
+
+import httpx
+
+from app import http_clients
+from app.handlers.google import GoogleGmailNewEmailHandler, build_batch_body, parse_batch_response
+from app.http_clients import ProviderClients
+
+
+def batch_response(request):
+    boundary = "batch_resp"
+    parts = []
+    for line in request.content.decode().split("\r\n"):
+        if line.startswith("GET "):
+            message_id = line.split("/messages/")[1].split("?")[0]
+            status = "404 Not Found" if message_id == "gone" else "200 OK"
+            body = json.dumps({
+                "id": message_id,
+                "threadId": f"thread-{message_id}",
+                "labelIds": ["INBOX", "UNREAD"],
+                "payload": {"headers": [{"name": "Subject", "value": f"Hello {message_id}"}, {"name": "From", "value": "a@b.c"}]},
+            })
+            parts.append(f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-item{len(parts)}>\r\n\r\n"
+                         f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n\r\n{body}\r\n")
+    return httpx.Response(200, headers={"Content-Type": f"multipart/mixed; boundary={boundary}"},
+                          content="".join(parts) + f"--{boundary}--\r\n")
+
+
+def test_poll_reads_history_since_cursor_and_batches_metadata(service_account_session, monkeypatch):
+    session, account = service_account_session
+    user_id = account.user_id
+    calls = []
+
+    def respond(request):
+        calls.append(request.url.path)
+        if request.url.path.endswith("/profile"):
+            return httpx.Response(200, json={"historyId": "100"})
+        if request.url.path.endswith("/history"):
+            assert request.url.params["startHistoryId"] == "100"
+            if "pageToken" not in request.url.params:
+                return httpx.Response(200, json={"historyId": "105", "nextPageToken": "p2", "history": [
+                    {"messagesAdded": [{"message": {"id": "m1"}}, {"message": {"id": "gone"}}]},
+                ]})
+            return httpx.Response(200, json={"historyId": "107", "history": [
+                {"messagesAdded": [{"message": {"id": "m2"}}, {"message": {"id": "m1"}}]},
+            ]})
+        return batch_response(request)
+
+    monkeypatch.setattr(http_clients, "provider_clients", ProviderClients(transport=httpx.MockTransport(respond)))
+    handler = GoogleGmailNewEmailHandler()
+
+    params = {"subject_contains": "hello"}
+    assert asyncio.run(handler.poll(session, user_id, params)) == []
+    results = asyncio.run(handler.poll(session, user_id, params))
+
+    assert [result.payload["email.id"] for result in results] == ["m1", "m2"]
+    assert results[1].payload["email.subject"] == "Hello m2"
+    assert calls.count("/batch/gmail/v1") == 1
+    assert asyncio.run(handler.get_last_state(session, f"{user_id}:INBOX")) == {"history_id": "107"}
+
+
+def test_areas_on_one_inbox_share_a_feed_and_filter_per_area():
+    handler = GoogleGmailNewEmailHandler()
+    by_sender = {"from_address": "a@b.c"}
+    by_subject = {"subject_contains": "invoice"}
+    assert handler.coalescing_key(1, by_sender) == handler.coalescing_key(1, by_subject) == handler.coalescing_key(1, {"label": "INBOX"})
+    assert handler.coalescing_key(1, {"label": "Work"}) != handler.coalescing_key(1, by_sender)
+
+    payload = {"email.from": "Ann <A@b.c>", "email.subject": "Hello"}
+    assert asyncio.run(handler.matches_conditions(by_sender, payload)) is True
+    assert asyncio.run(handler.matches_conditions(by_subject, payload)) is False
+
+
+def test_batch_body_round_trips_through_response_parser():
+    body = build_batch_body(["/gmail/v1/users/me/messages/a", "/gmail/v1/users/me/messages/b"], "xyz")
+    assert body.count("--xyz\r\n") == 2 and body.endswith("--xyz--\r\n")
+
+    response = (
+        "--resp\r\nContent-Type: application/http\r\nContent-ID: <response-item1>\r\n\r\n"
+        "HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n{\"id\": \"b\"}\r\n"
+        "--resp\r\nContent-Type: application/http\r\nContent-ID: <response-item0>\r\n\r\n"
+        "HTTP/1.1 404 Not Found\r\n\r\n\r\n--resp--\r\n"
+    )
+    assert parse_batch_response('multipart/mixed; boundary="resp"', response) == {1: (200, {"id": "b"}), 0: (404, None)}
@@ -0,0 +1,35 @@
+import asyncio
+
+from app.http_clients import ProviderClients
+
+
+async def keep_alive_server(reader, writer):
+    while True:
+        request = await reader.readuntil(b"\r\n\r\n")
+        if not request:
+            break
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: 2\r\n\r\n{}")
+        await writer.drain()
+
+
+def test_provider_client_is_shared_and_keeps_connections_alive():
+    clients = ProviderClients()
+
+    async def run():
+        server = await asyncio.start_server(keep_alive_server, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        client = clients.client_for("github")
+        assert clients.client_for("GitHub") is client
+        for _ in range(3):
+            response = await clients.client_for("github").get(f"http://127.0.0.1:{port}/")
+            assert response.status_code == 200
+        await clients.aclose()
+        server.close()
+        return client
+
+    client = asyncio.run(run())
+    assert client.is_closed
+    stats = clients.stats()["github"]
+    assert stats["requests"] == 3
+    assert stats["connections_opened"] == 1
+    assert round(stats["reuse_ratio"], 2) == 0.67
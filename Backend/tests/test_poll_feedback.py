@@ -0,0 +1,54 @@
+import httpx
+
+from app.handlers.base import normalize_params
+from app.poll_feedback import PollObservation, interval_bounds, next_interval, observe_response, observing, parse_retry_after
+from app.poll_scheduler import PollFeed, PollScheduler
+
+
+def test_empty_polls_back_off_and_a_trigger_snaps_back():
+    interval = 60.0
+    for streak in range(1, 4):
+        interval = next_interval(interval, streak, False, 60, 600)
+    assert interval == 60
+
+    for streak in range(4, 12):
+        interval = next_interval(interval, streak, False, 60, 600)
+    assert interval == 600
+
+    assert next_interval(interval, 0, True, 60, 600) == 60
+
+
+def test_provider_hints_lengthen_the_interval():
+    assert next_interval(60, 0, True, 60, 600, PollObservation(retry_after=120)) == 120
+    assert next_interval(60, 1, False, 60, 600, PollObservation(poll_interval=90)) == 90
+    assert next_interval(60, 1, False, 60, 600, PollObservation(rate_limit_remaining=0, rate_limit_reset=1800)) == 1800
+    assert next_interval(60, 1, False, 60, 600, PollObservation(rate_limit_remaining=2)) == 120
+
+
+def test_observe_response_only_records_inside_a_poll():
+    response = httpx.Response(429, headers={"Retry-After": "30", "X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "45"})
+    observe_response(response)
+
+    with observing() as observation:
+        observe_response(httpx.Response(200, headers={"X-RateLimit-Remaining": "10"}))
+        observe_response(response)
+    assert observation.retry_after == 30
+    assert observation.rate_limit_remaining == 0
+    assert observation.rate_limit_reset == 45
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+
+
+def test_user_bounds_apply_per_feed_and_do_not_split_feeds():
+    assert interval_bounds(60, [{}]) == (60, 900)
+    assert interval_bounds(60, [{"poll_min_interval": "30", "poll_max_interval": "120"}, {"poll_max_interval": 300}]) == (30, 120)
+    assert interval_bounds(60, [{"poll_min_interval": "1"}])[0] == 15
+    assert normalize_params({"label": "INBOX", "poll_min_interval": "30"}) == normalize_params({"label": "INBOX"})
+
+    scheduler = PollScheduler(jitter=0)
+    feed = PollFeed(key="k", user_id=1, service_name="google", action_key="gmail__new_email",
+                    areas={1: {"poll_max_interval": "100"}}, interval=60, base_interval=60)
+    for _ in range(6):
+        scheduler.record_poll(feed, False)
+    assert feed.interval == 100
+    scheduler.record_poll(feed, True)
+    assert feed.interval == 60 and feed.empty_streak == 0
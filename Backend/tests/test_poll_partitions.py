@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlmodel import SQLModel, select
+
+from app.poll_partitions import PartitionLeaser, PollPartition, PollWorker, partition_for
+from tests.conftest import engine
+
+PARTITION_TABLES = [PollWorker.__table__, PollPartition.__table__]
+
+
+@pytest.fixture
+def lease_session(session):
+    SQLModel.metadata.drop_all(engine, tables=PARTITION_TABLES)
+    SQLModel.metadata.create_all(engine, tables=PARTITION_TABLES)
+    yield session
+    SQLModel.metadata.drop_all(engine, tables=PARTITION_TABLES)
+
+
+def test_partitions_rebalance_when_workers_join_and_leave(lease_session):
+    first = PartitionLeaser("worker-a", partitions=8)
+    second = PartitionLeaser("worker-b", partitions=8)
+
+    assert len(first.heartbeat(lease_session)) == 8
+    assert second.heartbeat(lease_session) == set()
+
+    assert len(first.heartbeat(lease_session)) == 4
+    assert len(second.heartbeat(lease_session)) == 4
+    assert first.owned.isdisjoint(second.owned)
+
+    second.release(lease_session)
+    assert len(first.heartbeat(lease_session)) == 8
+
+
+def test_expired_worker_leases_are_taken_over(lease_session):
+    crashed = PartitionLeaser("worker-a", partitions=4)
+    survivor = PartitionLeaser("worker-b", partitions=4)
+    crashed.heartbeat(lease_session)
+
+    stale = datetime.utcnow() - timedelta(minutes=5)
+    lease_session.get(PollWorker, "worker-a").heartbeat_at = stale
+    for partition in lease_session.exec(select(PollPartition)).all():
+        partition.lease_until = stale
+    lease_session.commit()
+
+    assert survivor.heartbeat(lease_session) == {0, 1, 2, 3}
+    assert lease_session.get(PollWorker, "worker-a") is None
+
+
+def test_ownership_lapses_without_heartbeat(lease_session):
+    clock = [100.0]
+    leaser = PartitionLeaser("worker-a", partitions=2, lease_ttl=30, clock=lambda: clock[0])
+    leaser.heartbeat(lease_session)
+    key = "spotify:new_playlist_created:1"
+    assert leaser.owns_key(key)
+    assert 0 <= partition_for(key, 2) < 2
+
+    clock[0] += 31
+    assert not leaser.owns_key(key)
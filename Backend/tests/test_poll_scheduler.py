@@ -0,0 +1,164 @@
+import asyncio
+import time
+
+import pytest
+from sqlmodel import SQLModel
+
+from app.action import Action
+from app.oauth2 import get_password_hash
+from app.oauth_models import Area, Service
+from app.poll_scheduler import PollFeed, PollScheduler
+from app.reaction import Reaction
+from app.user import User
+from tests.conftest import engine
+
+CATALOG_TABLES = [Service.__table__, Action.__table__, Reaction.__table__, Area.__table__]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_entry(area_id, interval=60, key=None):
+    return PollFeed(
+        key=key or f"feed-{area_id}",
+        user_id=1,
+        service_name="spotify",
+        action_key="new_playlist_created",
+        interval=interval,
+        areas={area_id: {}},
+    )
+
+
+def test_due_entries_come_out_in_order_and_are_rescheduled_without_drift():
+    clock = FakeClock()
+    scheduler = PollScheduler(jitter=0, clock=clock)
+    scheduler.schedule(make_entry(1), due_at=1010)
+    scheduler.schedule(make_entry(2), due_at=1005)
+    scheduler.schedule(make_entry(3), due_at=1100)
+
+    assert scheduler.pop_due(1000) == []
+    due = scheduler.pop_due(1020)
+    assert [list(entry.areas)[0] for entry in due] == [2, 1]
+
+    clock.now = 1030
+    for entry in due:
+        scheduler.reschedule(entry)
+    assert scheduler.next_due() == 1065
+    assert [list(entry.areas)[0] for entry in scheduler.pop_due(1070)] == [2, 1]
+
+
+def test_overrunning_poll_is_rescheduled_from_now():
+    clock = FakeClock()
+    scheduler = PollScheduler(jitter=0, clock=clock)
+    scheduler.schedule(make_entry(1, interval=10), due_at=1000)
+    entry = scheduler.pop_due()[0]
+
+    clock.now = 1025
+    scheduler.reschedule(entry)
+    assert scheduler.next_due() == 1035
+
+
+def test_reschedule_wakes_a_waiting_loop():
+    async def scenario():
+        scheduler = PollScheduler(jitter=0)
+        scheduler.schedule(make_entry(1, interval=0.1), due_at=time.monotonic())
+        feed = scheduler.pop_due()[0]
+
+        # Nothing is scheduled, so the loop would sleep for the idle wait.
+        waiter = asyncio.ensure_future(scheduler.wait_for_next(max_wait=3))
+        await asyncio.sleep(0.01)
+        scheduler.reschedule(feed)
+        await asyncio.wait_for(waiter, timeout=1)
+        await scheduler.wait_for_next(max_wait=3)
+        return [entry.key for entry in scheduler.pop_due()]
+
+    started = time.monotonic()
+    assert asyncio.run(scenario()) == ["feed-1"]
+    assert time.monotonic() - started < 1
+
+
+def test_removed_and_reinterval_areas_are_updated_in_place():
+    clock = FakeClock()
+    scheduler = PollScheduler(jitter=0, clock=clock)
+    scheduler.schedule(make_entry(1), due_at=1060)
+    scheduler.schedule(make_entry(2), due_at=1060)
+
+    scheduler.remove_area(1)
+    scheduler.set_interval("feed-2", 30)
+    assert len(scheduler) == 1
+    assert scheduler.next_due() == 1030
+    assert [list(entry.areas)[0] for entry in scheduler.pop_due(1060)] == [2]
+
+
+def test_areas_with_the_same_key_share_one_feed():
+    scheduler = PollScheduler(jitter=0, clock=FakeClock())
+    scheduler.schedule(make_entry(1, key="spotify:new_playlist_created:1"), due_at=1010)
+    scheduler.schedule(make_entry(2, key="spotify:new_playlist_created:1"), due_at=1500)
+    scheduler.schedule(make_entry(3, key="spotify:new_playlist_created:2"), due_at=1020)
+
+    assert len(scheduler) == 2 and scheduler.area_count == 3
+    due = scheduler.pop_due(1030)
+    assert [sorted(feed.areas) for feed in due] == [[1, 2], [3]]
+
+    scheduler.remove_area(1)
+    scheduler.remove_area(3)
+    assert len(scheduler) == 1
+    for feed in due:
+        scheduler.reschedule(feed)
+    assert [sorted(feed.areas) for feed in scheduler.pop_due(2000)] == [[2]]
+
+
+@pytest.fixture
+def catalog_session(session):
+    SQLModel.metadata.drop_all(engine, tables=CATALOG_TABLES)
+    SQLModel.metadata.create_all(engine, tables=CATALOG_TABLES)
+    yield session
+    SQLModel.metadata.drop_all(engine, tables=CATALOG_TABLES)
+
+
+def test_load_and_upsert_follow_area_state(catalog_session):
+    user = User(email="lee@example.com", name="Lee", hashed_password=get_password_hash("Sup3rSecret!"))
+    spotify = Service(name="spotify", display_name="Spotify")
+    catalog_session.add_all([user, spotify])
+    catalog_session.commit()
+    polling = Action(name="Spotify - New Playlist Created", service_id=spotify.id, is_polling=True, parameters={})
+    webhook = Action(name="Spotify - Something Else", service_id=spotify.id, is_polling=False, parameters={})
+    reaction = Reaction(name="Spotify - Play", service_id=spotify.id)
+    catalog_session.add_all([polling, webhook, reaction])
+    catalog_session.commit()
+
+    areas = [
+        Area(user_id=user.id, action_service_id=spotify.id, action_id=action.id,
+             reaction_service_id=spotify.id, reaction_id=reaction.id)
+        for action in (polling, webhook, polling)
+    ]
+    catalog_session.add_all(areas)
+    catalog_session.commit()
+
+    clock = FakeClock()
+    scheduler = PollScheduler(jitter=0, clock=clock)
+    scheduler.load(catalog_session)
+    assert len(scheduler) == 1
+    assert scheduler.area_count == 2
+    assert 1000 <= scheduler.next_due() <= 1060
+
+    polled = areas[0]
+    polled.is_active = False
+    catalog_session.add(polled)
+    catalog_session.commit()
+    scheduler.upsert_area(catalog_session, polled)
+    assert len(scheduler) == 1
+    assert sorted(scheduler.feed_for_area(areas[2].id).areas) == [areas[2].id]
+    assert scheduler.feed_for_area(polled.id) is None
+
+    polled.is_active = True
+    catalog_session.add(polled)
+    catalog_session.commit()
+    scheduler.upsert_area(catalog_session, polled)
+    assert len(scheduler) == 1
+    assert sorted(scheduler.feed_for_area(polled.id).areas) == [polled.id, areas[2].id]
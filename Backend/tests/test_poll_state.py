@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+from sqlmodel import SQLModel
+
+from app.handlers import get_polling_handler
+from app.poll_state import PollState, PollStateStore
+from tests.conftest import engine
+
+
+@pytest.fixture
+def state_session(session):
+    SQLModel.metadata.drop_all(engine, tables=[PollState.__table__])
+    SQLModel.metadata.create_all(engine, tables=[PollState.__table__])
+    yield session
+    SQLModel.metadata.drop_all(engine, tables=[PollState.__table__])
+
+
+def test_writes_are_batched_and_survive_a_new_store(state_session):
+    store = PollStateStore()
+    assert store.get(state_session, "spotify:new_playlist_created:1") is None
+
+    store.put("spotify:new_playlist_created:1", {"playlist_ids": ["a"]})
+    store.put("spotify:new_playlist_created:1", {"playlist_ids": ["a", "b"]})
+    assert state_session.get(PollState, "spotify:new_playlist_created:1") is None
+    assert store.get(state_session, "spotify:new_playlist_created:1") == {"playlist_ids": ["a", "b"]}
+
+    assert store.flush(state_session) == 1
+    assert store.flush(state_session) == 0
+
+    restarted = PollStateStore()
+    assert restarted.get(state_session, "spotify:new_playlist_created:1") == {"playlist_ids": ["a", "b"]}
+    restarted.put("spotify:new_playlist_created:1", {"playlist_ids": ["c"]})
+    restarted.flush(state_session)
+    state_session.expire_all()
+    assert state_session.get(PollState, "spotify:new_playlist_created:1").state == {"playlist_ids": ["c"]}
+
+
+def test_cache_evicts_only_flushed_entries(state_session):
+    store = PollStateStore(cache_size=2)
+    for index in range(4):
+        store.put(f"key-{index}", {"n": index})
+    assert store.stats()["cached"] == 4
+
+    store.flush(state_session)
+    store.put("key-4", {"n": 4})
+    assert store.stats()["cached"] == 2
+    assert store.get(state_session, "key-0") == {"n": 0}
+    assert store.misses == 1
+
+
+def test_handler_state_is_namespaced_and_copied(state_session, monkeypatch):
+    store = PollStateStore()
+    monkeypatch.setattr("app.poll_state.poll_state_store", store)
+    handler = get_polling_handler("discord", "user_status_change")
+
+    async def roundtrip():
+        state = {"profile": {"username": "dana"}}
+        await handler.save_state(state_session, 7, state)
+        state["profile"]["username"] = "changed"
+        return await handler.get_last_state(state_session, 7)
+
+    assert asyncio.run(roundtrip()) == {"profile": {"username": "dana"}}
+    assert store.flush(state_session) == 1
+    assert state_session.get(PollState, "discord:user_profile_change:7") is not None
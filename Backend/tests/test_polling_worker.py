@@ -0,0 +1,286 @@
+import asyncio
+
+import pytest
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from app import poll_state, polling_worker
+from app.concurrency import ConcurrencyLimiter
+from app.handlers.base import ActionResult
+from app.oauth_models import ServiceAccount
+from app.poll_scheduler import PollFeed, PollScheduler
+from app.poll_state import PollState, PollStateStore
+from app.token_manager import token_manager
+from tests.conftest import engine
+
+
+class SlowHandler:
+    def __init__(self, delay):
+        self.delay = delay
+        self.running = 0
+        self.peak = 0
+
+    async def poll(self, session, user_id, params):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(self.delay)
+        self.running -= 1
+        return ActionResult(triggered=False, event_type="tick", payload={})
+
+
+class OwnsEverything:
+    def __init__(self, owned=True):
+        self.owned = owned
+
+    def owns_key(self, key):
+        return self.owned
+
+
+@pytest.fixture(autouse=True)
+def leaser(monkeypatch):
+    stub = OwnsEverything()
+    monkeypatch.setattr(polling_worker, "partition_leaser", stub)
+    return stub
+
+
+@pytest.fixture(autouse=True)
+def state_store(monkeypatch):
+    SQLModel.metadata.drop_all(engine, tables=[PollState.__table__])
+    SQLModel.metadata.create_all(engine, tables=[PollState.__table__])
+    store = PollStateStore()
+    monkeypatch.setattr(polling_worker, "engine", engine)
+    monkeypatch.setattr(polling_worker, "poll_state_store", store)
+    yield store
+    SQLModel.metadata.drop_all(engine, tables=[PollState.__table__])
+
+
+def make_entry(area_id):
+    return PollFeed(key=f"feed-{area_id}", user_id=1, service_name="spotify", action_key="new_playlist_created", areas={area_id: {}})
+
+
+def test_sweep_polls_concurrently_under_provider_limit(monkeypatch):
+    handler = SlowHandler(delay=0.05)
+    scheduler = PollScheduler(jitter=0)
+    stats = polling_worker.PollStats()
+    monkeypatch.setattr(polling_worker, "get_polling_handler", lambda service, action: handler)
+    monkeypatch.setattr(polling_worker, "poll_scheduler", scheduler)
+    monkeypatch.setattr(polling_worker, "poll_stats", stats)
+    monkeypatch.setattr(polling_worker, "poll_limiter", ConcurrencyLimiter(global_limit=10, default_key_limit=3))
+
+    entries = [make_entry(area_id) for area_id in range(6)]
+    for entry in entries:
+        scheduler.schedule(entry, due_at=0)
+    due = scheduler.pop_due()
+
+    asyncio.run(polling_worker.run_sweep(due))
+
+    assert handler.peak == 3
+    assert stats.polls == 6
+    assert stats.sweeps == 1
+    assert stats.last_sweep_duration < 0.3
+    assert len(scheduler) == 6 and scheduler.next_due() is not None
+
+
+def test_slow_poll_times_out_and_is_rescheduled(monkeypatch):
+    handler = SlowHandler(delay=1)
+    scheduler = PollScheduler(jitter=0)
+    stats = polling_worker.PollStats()
+    monkeypatch.setattr(polling_worker, "get_polling_handler", lambda service, action: handler)
+    monkeypatch.setattr(polling_worker, "poll_scheduler", scheduler)
+    monkeypatch.setattr(polling_worker, "poll_stats", stats)
+    monkeypatch.setattr(polling_worker, "POLL_TIMEOUT", 0.05)
+
+    scheduler.schedule(make_entry(1), due_at=0)
+    asyncio.run(polling_worker.run_sweep(scheduler.pop_due()))
+
+    assert stats.timeouts == 1
+    assert scheduler.next_due() is not None
+
+
+# Reads its account and its state like the real handlers, then waits on
+# the provider.
+class AccountHandler(SlowHandler):
+    async def poll(self, session, user_id, params):
+        account = session.exec(select(ServiceAccount).where(ServiceAccount.user_id == user_id)).first()
+        await token_manager.ensure_valid(session, account)
+        poll_state.poll_state_store.get(session, f"state:{params['feed']}")
+        return await super().poll(session, user_id, params)
+
+
+def test_polls_do_not_hold_a_connection_across_provider_calls(monkeypatch, service_account_session):
+    session, account = service_account_session
+    user_id = account.user_id
+    handler = AccountHandler(delay=0.05)
+    stats = polling_worker.PollStats()
+    small_pool = create_engine(engine.url, connect_args={"check_same_thread": False}, pool_size=1, max_overflow=0, pool_timeout=0.5)
+    monkeypatch.setattr(polling_worker, "engine", small_pool)
+    monkeypatch.setattr(polling_worker, "get_polling_handler", lambda service, action: handler)
+    monkeypatch.setattr(polling_worker, "poll_scheduler", PollScheduler(jitter=0))
+    monkeypatch.setattr(polling_worker, "poll_stats", stats)
+
+    feeds = [
+        PollFeed(key=f"feed-{n}", user_id=user_id, service_name="google", action_key="tick", params={"feed": n}, areas={n: {}})
+        for n in range(4)
+    ]
+
+    asyncio.run(polling_worker.run_sweep(feeds))
+    small_pool.dispose()
+
+    assert stats.polls == 4 and stats.errors == 0
+    assert handler.peak == 4
+
+
+class TriggeringHandler:
+    def __init__(self):
+        self.calls = 0
+
+    async def poll(self, session, user_id, params):
+        self.calls += 1
+        return ActionResult(triggered=True, event_type="new_playlist_created", payload={"playlist.id": "p1"})
+
+    async def matches_conditions(self, params, payload):
+        return params.get("skip") is not True
+
+    def payload_for_area(self, params, payload):
+        return payload
+
+
+def test_one_poll_fans_out_to_every_area_of_the_feed(monkeypatch):
+    handler = TriggeringHandler()
+    executed = []
+
+    async def fake_execute(executions):
+        executed.extend(executions)
+        return []
+
+    monkeypatch.setattr(polling_worker, "get_polling_handler", lambda service, action: handler)
+    monkeypatch.setattr(polling_worker, "poll_scheduler", PollScheduler(jitter=0))
+    monkeypatch.setattr(polling_worker, "poll_stats", polling_worker.PollStats())
+    monkeypatch.setattr(polling_worker, "index_areas", lambda session, area_ids, active_only=False: {area_id: f"area-{area_id}" for area_id in area_ids})
+    monkeypatch.setattr(polling_worker, "execute_areas_concurrently", fake_execute)
+
+    feed = PollFeed(key="spotify:new_playlist_created:1", user_id=1, service_name="spotify", action_key="new_playlist_created",
+                    areas={1: {}, 2: {}, 3: {"skip": True}})
+    asyncio.run(polling_worker.run_poll(feed))
+
+    assert handler.calls == 1
+    assert executed == [("area-1", {"playlist.id": "p1"}), ("area-2", {"playlist.id": "p1"})]
+
+
+class BatchHandler:
+    def __init__(self, batches):
+        self.batches = list(batches)
+
+    async def poll(self, session, user_id, params):
+        return [
+            ActionResult(triggered=True, event_type="track_added_to_playlist", payload={"track.id": track_id})
+            for track_id in self.batches.pop(0)
+        ]
+
+    async def matches_conditions(self, params, payload):
+        return True
+
+    def payload_for_area(self, params, payload):
+        return payload
+
+
+def test_a_poll_emits_every_new_item_up_to_the_batch_size(monkeypatch, state_store):
+    handler = BatchHandler([["t1", "t2", "t3"], ["t4"]])
+    executed = []
+
+    async def fake_execute(executions):
+        executed.append([(area, payload["track.id"]) for area, payload in executions])
+        return []
+
+    stats = polling_worker.PollStats()
+    monkeypatch.setattr(polling_worker, "get_polling_handler", lambda service, action: handler)
+    monkeypatch.setattr(polling_worker, "poll_scheduler", PollScheduler(jitter=0))
+    monkeypatch.setattr(polling_worker, "poll_stats", stats)
+    monkeypatch.setattr(polling_worker, "POLL_BATCH_SIZE", 2)
+    monkeypatch.setattr(polling_worker, "index_areas", lambda session, area_ids, active_only=False: {area_id: f"area-{area_id}" for area_id in area_ids})
+    monkeypatch.setattr(polling_worker, "execute_areas_concurrently", fake_execute)
+
+    def make_feed():
+        return PollFeed(key="spotify:track_added_to_playlist:1", user_id=1, service_name="spotify", action_key="track_added_to_playlist",
+                        areas={1: {}, 2: {}})
+
+    feed = make_feed()
+    asyncio.run(polling_worker.run_poll(feed))
+    assert executed == [[("area-1", "t1"), ("area-2", "t1"), ("area-1", "t2"), ("area-2", "t2")]]
+    backlog = state_store.get(None, polling_worker.backlog_key(feed))
+    assert [payload["track.id"] for payload in backlog["payloads"]] == ["t3"]
+
+    # The deferred payload is flushed with the cursors, so a worker starting
+    # from the table (after a restart or a handover) still emits it first.
+    with Session(engine) as session:
+        state_store.flush(session)
+    monkeypatch.setattr(polling_worker, "poll_state_store", PollStateStore())
+    asyncio.run(polling_worker.run_poll(make_feed()))
+    assert executed[1] == [("area-1", "t3"), ("area-2", "t3"), ("area-1", "t4"), ("area-2", "t4")]
+    assert polling_worker.poll_state_store.get(None, polling_worker.backlog_key(feed)) == {"payloads": []}
+    assert stats.results == 4 and stats.deferred == 1
+
+
+def test_coalescing_keys_ignore_blank_params_and_param_order():
+    from app.handlers import get_polling_handler
+
+    gmail = get_polling_handler("google", "gmail__new_email")
+    assert gmail.coalescing_key(1, {"label": "INBOX", "from_address": " a@b.c ", "subject_contains": ""}) == \
+        gmail.coalescing_key(1, {"from_address": "a@b.c", "label": "INBOX"})
+    assert gmail.coalescing_key(1, {"label": "INBOX"}) != gmail.coalescing_key(2, {"label": "INBOX"})
+
+    playlists = get_polling_handler("spotify", "new_playlist_created")
+    assert playlists.coalescing_key(1, {"anything": "x"}) == playlists.coalescing_key(1, {})
+
+
+def test_feeds_of_partitions_owned_elsewhere_are_only_rescheduled(monkeypatch, leaser):
+    handler = SlowHandler(delay=0)
+    scheduler = PollScheduler(jitter=0)
+    stats = polling_worker.PollStats()
+    leaser.owned = False
+    monkeypatch.setattr(polling_worker, "get_polling_handler", lambda service, action: handler)
+    monkeypatch.setattr(polling_worker, "poll_scheduler", scheduler)
+    monkeypatch.setattr(polling_worker, "poll_stats", stats)
+
+    scheduler.schedule(make_entry(1), due_at=0)
+    asyncio.run(polling_worker.run_sweep(scheduler.pop_due()))
+
+    assert stats.polls == 0
+    assert stats.not_owned == 1
+    assert scheduler.next_due() is not None
+
+
+def test_health_endpoint_reports_lease_state(monkeypatch):
+    class Leaser:
+        worker_id = "worker-a"
+
+        def __init__(self, valid_for):
+            self.valid_for = valid_for
+
+        def stats(self):
+            return {"lease_valid_for": self.valid_for}
+
+    async def get(path):
+        server = await asyncio.start_server(polling_worker.handle_health, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        response = await reader.read()
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return response.split(b"\r\n", 1)[0]
+
+    monkeypatch.setattr(polling_worker, "partition_leaser", Leaser(12.0))
+    assert asyncio.run(get("/health")) == b"HTTP/1.1 200 OK"
+    monkeypatch.setattr(polling_worker, "partition_leaser", Leaser(0.0))
+    assert asyncio.run(get("/health")) == b"HTTP/1.1 503 Service Unavailable"
+    assert asyncio.run(get("/nope")) == b"HTTP/1.1 404 Not Found"
+
+
+def test_worker_refuses_a_pool_smaller_than_its_refresh_locks(monkeypatch):
+    monkeypatch.setattr(polling_worker, "TOKEN_REFRESH_LOCKS", 8)
+    monkeypatch.setattr(polling_worker, "POLL_DB_CONNECTIONS", 4)
+
+    polling_worker.check_pool_capacity(pool_size=10, max_overflow=10)
+    with pytest.raises(RuntimeError, match="pool too small"):
+        polling_worker.check_pool_capacity(pool_size=10, max_overflow=5)
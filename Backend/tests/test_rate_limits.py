@@ -0,0 +1,104 @@
+import asyncio
+import time
+from email.utils import formatdate
+
+import httpx
+
+from app import rate_limits
+from app.rate_limits import EXECUTION, POLL, GovernedTransport, RateGovernor, priority
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_requests_wait_for_the_account_bucket_to_refill(monkeypatch):
+    monkeypatch.setitem(rate_limits.ACCOUNT_RATES, "github", 1.0)
+    monkeypatch.setattr(rate_limits, "RATE_LIMIT_BURST", 2)
+    clock = FakeClock()
+    governor = RateGovernor(clock=clock, sleep=clock.sleep)
+
+    async def burst():
+        for _ in range(4):
+            await governor.acquire("github", "alice", EXECUTION)
+        await governor.acquire("github", "bob", EXECUTION)
+
+    asyncio.run(burst())
+    assert clock.now == 1002.0
+    stats = governor.stats()["github"]
+    assert stats["requests"] == 5 and stats["throttled"] == 2 and stats["accounts"] == 2
+
+
+def test_polls_leave_a_reserve_for_executions(monkeypatch):
+    monkeypatch.setitem(rate_limits.ACCOUNT_RATES, "trello", 1.0)
+    monkeypatch.setattr(rate_limits, "RATE_LIMIT_BURST", 10)
+    monkeypatch.setattr(rate_limits, "RATE_LIMIT_POLL_RESERVE", 0.5)
+    clock = FakeClock()
+    governor = RateGovernor(clock=clock, sleep=clock.sleep)
+
+    async def drain():
+        for _ in range(5):
+            await governor.acquire("trello", "alice", POLL)
+        assert clock.sleeps == []
+        await governor.acquire("trello", "alice", EXECUTION)
+        assert clock.sleeps == []
+        with priority(POLL):
+            await governor.acquire("trello", "alice")
+        assert clock.sleeps == [2.0]
+
+    asyncio.run(drain())
+
+
+def test_headers_feed_the_buckets_and_rate_limited_calls_are_retried(monkeypatch):
+    clock = FakeClock()
+    governor = RateGovernor(clock=clock, sleep=clock.sleep)
+    calls = []
+
+    def respond(request):
+        calls.append(clock.now)
+        if len(calls) == 1:
+            return httpx.Response(403, headers={"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "1060"})
+        if len(calls) == 2:
+            return httpx.Response(429, headers={"Retry-After": "30"})
+        return httpx.Response(200, headers={"X-RateLimit-Remaining": "4999"}, json={"ok": True})
+
+    async def call():
+        transport = GovernedTransport(httpx.MockTransport(respond), "github", governor)
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await client.get("https://api.github.com/user", headers={"Authorization": "Bearer t"})
+
+    response = asyncio.run(call())
+    assert response.status_code == 200
+    assert calls == [1000.0, 1060.0, 1090.0]
+    stats = governor.stats()["github"]
+    assert stats["rate_limited"] == 2 and stats["retries"] == 2
+
+
+def test_trello_key_limit_throttles_every_account():
+    clock = FakeClock()
+    governor = RateGovernor(clock=clock, sleep=clock.sleep)
+    response = httpx.Response(200, headers={
+        "x-rate-limit-api-key-interval-ms": "10000",
+        "x-rate-limit-api-key-remaining": "0",
+        "x-rate-limit-api-token-remaining": "99",
+    })
+    assert not governor.observe("trello", "alice", response)
+
+    asyncio.run(governor.acquire("trello", "bob", EXECUTION))
+    assert clock.now == 1010.0
+
+
+def test_retry_after_date_blocks_until_that_time():
+    governor = RateGovernor()
+    response = httpx.Response(429, headers={"Retry-After": formatdate(time.time() + 60, usegmt=True)})
+    assert governor.observe("spotify", "alice", response)
+    assert 55 < governor.bucket("spotify", "alice").blocked_until - time.time() <= 60
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlmodel import SQLModel
+
+from app.reaction_queue import JOB_DONE, JOB_FAILED, JOB_PENDING, JOB_RUNNING, ReactionJob, claim_jobs, enqueue_jobs, finish_job
+from app.trigger_index import IndexedArea
+from tests.conftest import engine
+
+
+@pytest.fixture
+def queue_session(session):
+    SQLModel.metadata.drop_all(engine, tables=[ReactionJob.__table__])
+    SQLModel.metadata.create_all(engine, tables=[ReactionJob.__table__])
+    yield session
+    SQLModel.metadata.drop_all(engine, tables=[ReactionJob.__table__])
+
+
+def make_area(area_id):
+    return IndexedArea(
+        id=area_id,
+        user_id=1,
+        name=None,
+        action_id=1,
+        reaction_id=1,
+        reaction_name="Discord - Send Webhook Message",
+        reaction_key="send_webhook_message",
+        reaction_service_name="discord",
+    )
+
+
+def test_enqueued_job_is_claimed_once(queue_session):
+    jobs = enqueue_jobs(queue_session, [(make_area(1), {"ref": "refs/heads/main"}), (make_area(2), {})])
+    assert [job.area_id for job in jobs] == [1, 2]
+
+    first = claim_jobs(queue_session, "worker-a")
+    second = claim_jobs(queue_session, "worker-b")
+    assert [job.area_id for job in first] == [1]
+    assert [job.area_id for job in second] == [2]
+    assert claim_jobs(queue_session, "worker-c") == []
+
+    assert first[0].status == JOB_RUNNING
+    assert first[0].locked_by == "worker-a"
+    assert first[0].attempts == 1
+    assert first[0].payload == {"ref": "refs/heads/main"}
+
+
+def test_expired_visibility_timeout_lets_another_worker_resume(queue_session):
+    enqueue_jobs(queue_session, [(make_area(1), {})])
+    job = claim_jobs(queue_session, "crashed-worker")[0]
+
+    job.locked_until = datetime.utcnow() - timedelta(seconds=1)
+    queue_session.add(job)
+    queue_session.commit()
+
+    resumed = claim_jobs(queue_session, "worker-b")
+    assert [j.id for j in resumed] == [job.id]
+    assert resumed[0].locked_by == "worker-b"
+    assert resumed[0].attempts == 2
+
+
+def test_job_lost_on_its_last_attempt_is_failed_not_reclaimed(queue_session):
+    enqueue_jobs(queue_session, [(make_area(1), {})])
+    for worker_id in ("crashed-a", "crashed-b"):
+        job = claim_jobs(queue_session, worker_id, max_attempts=2)[0]
+        job.locked_until = datetime.utcnow() - timedelta(seconds=1)
+        queue_session.add(job)
+        queue_session.commit()
+
+    assert claim_jobs(queue_session, "worker-c", max_attempts=2) == []
+    queue_session.refresh(job)
+    assert job.status == JOB_FAILED
+    assert job.attempts == 2
+    assert job.locked_by is None
+
+
+def test_failed_job_is_retried_then_given_up(queue_session):
+    enqueue_jobs(queue_session, [(make_area(1), {})])
+    job = claim_jobs(queue_session, "worker-a")[0]
+
+    job = finish_job(queue_session, job, error="boom", max_attempts=2)
+    assert job.status == JOB_PENDING
+    assert job.available_at > datetime.utcnow()
+    assert claim_jobs(queue_session, "worker-a") == []
+
+    job.available_at = datetime.utcnow() - timedelta(seconds=1)
+    queue_session.add(job)
+    queue_session.commit()
+    job = claim_jobs(queue_session, "worker-a")[0]
+
+    job = finish_job(queue_session, job, error="boom again", max_attempts=2)
+    assert job.status == JOB_FAILED
+    assert job.last_error == "boom again"
+
+
+def test_finished_job_is_done(queue_session):
+    enqueue_jobs(queue_session, [(make_area(1), {})])
+    job = finish_job(queue_session, claim_jobs(queue_session, "worker-a")[0])
+    assert job.status == JOB_DONE
+    assert job.locked_by is None
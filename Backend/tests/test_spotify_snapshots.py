@@ -0,0 +1,100 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app import http_clients
+from app.handlers.spotify import SpotifyTrackAddedToPlaylistHandler
+from app.http_clients import ProviderClients
+
+pytestmark = pytest.mark.parametrize("service_account_session", [{"service": "spotify"}], indirect=True)
+
+
+def track(track_id):
+    return {"added_at": "2024-01-01T00:00:00Z", "track": {"id": track_id, "name": track_id, "artists": [], "uri": f"spotify:track:{track_id}", "external_urls": {}}}
+
+
+def test_only_playlists_with_a_new_snapshot_are_diffed_in_full(service_account_session, monkeypatch):
+    session, account = service_account_session
+    user_id = account.user_id
+    snapshots = {"big": "s1", "small": "s1"}
+    tracks = {"big": [track(f"t{index}") for index in range(150)], "small": [track("x")]}
+    fetched = []
+
+    def respond(request):
+        if request.url.path == "/v1/me/playlists":
+            return httpx.Response(200, json={"items": [{"id": key, "snapshot_id": value} for key, value in snapshots.items()], "next": None})
+        playlist_id = request.url.path.split("/")[3]
+        offset, limit = int(request.url.params["offset"]), int(request.url.params["limit"])
+        fetched.append((playlist_id, offset))
+        page = tracks[playlist_id][offset:offset + limit]
+        return httpx.Response(200, json={"items": page, "next": "more" if offset + limit < len(tracks[playlist_id]) else None})
+
+    monkeypatch.setattr(http_clients, "provider_clients", ProviderClients(transport=httpx.MockTransport(respond)))
+    handler = SpotifyTrackAddedToPlaylistHandler()
+
+    assert asyncio.run(handler.poll(session, user_id, {})) == []
+    assert sorted(fetched) == [("big", 0), ("big", 100), ("small", 0)]
+
+    fetched.clear()
+    assert asyncio.run(handler.poll(session, user_id, {})) == []
+    assert fetched == []
+
+    tracks["big"].append(track("new"))
+    snapshots["big"] = "s2"
+    results = asyncio.run(handler.poll(session, user_id, {}))
+    assert [result.payload["track.id"] for result in results] == ["new"]
+    assert fetched == [("big", 0), ("big", 100)]
+
+
+def test_feeds_on_one_playlist_and_on_all_playlists_both_see_a_new_track(service_account_session, monkeypatch):
+    session, account = service_account_session
+    user_id = account.user_id
+    snapshots = {"mix": "s1"}
+    tracks = {"mix": [track("a")]}
+
+    def respond(request):
+        if request.url.path == "/v1/me/playlists":
+            return httpx.Response(200, json={"items": [{"id": key, "snapshot_id": value} for key, value in snapshots.items()], "next": None})
+        if request.url.path == "/v1/playlists/mix":
+            return httpx.Response(200, json={"id": "mix", "snapshot_id": snapshots["mix"]})
+        return httpx.Response(200, json={"items": tracks["mix"], "next": None})
+
+    monkeypatch.setattr(http_clients, "provider_clients", ProviderClients(transport=httpx.MockTransport(respond)))
+    handler = SpotifyTrackAddedToPlaylistHandler()
+    all_playlists, one_playlist = {}, {"playlist_id": "mix"}
+    assert handler.coalescing_key(user_id, all_playlists) != handler.coalescing_key(user_id, one_playlist)
+
+    for params in (all_playlists, one_playlist):
+        assert asyncio.run(handler.poll(session, user_id, params)) == []
+
+    tracks["mix"].append(track("b"))
+    snapshots["mix"] = "s2"
+    for params in (all_playlists, one_playlist):
+        assert [result.payload["track.id"] for result in asyncio.run(handler.poll(session, user_id, params))] == ["b"]
+
+
+def test_a_change_on_a_later_playlists_page_is_seen_when_the_first_page_is_unchanged(service_account_session, monkeypatch):
+    session, account = service_account_session
+    playlists = [{"id": f"p{index}", "snapshot_id": "s1"} for index in range(60)]
+    tracks = {"p55": [track("a")]}
+
+    def respond(request):
+        if request.url.path == "/v1/me/playlists":
+            offset = int(request.url.params["offset"])
+            page = playlists[offset:offset + 50]
+            etag = '"' + ",".join(item["snapshot_id"] for item in page) + '"'
+            if request.headers.get("if-none-match") == etag:
+                return httpx.Response(304)
+            return httpx.Response(200, json={"items": page, "next": "more" if offset + 50 < len(playlists) else None}, headers={"ETag": etag})
+        playlist_id = request.url.path.split("/")[3]
+        return httpx.Response(200, json={"items": tracks.get(playlist_id, []), "next": None})
+
+    monkeypatch.setattr(http_clients, "provider_clients", ProviderClients(transport=httpx.MockTransport(respond)))
+    handler = SpotifyTrackAddedToPlaylistHandler()
+    assert asyncio.run(handler.poll(session, account.user_id, {})) == []
+    assert asyncio.run(handler.poll(session, account.user_id, {})) == []
+
+    tracks["p55"].append(track("b"))
+    playlists[55]["snapshot_id"] = "s2"
+    assert [result.payload["track.id"] for result in asyncio.run(handler.poll(session, account.user_id, {}))] == ["b"]
@@ -0,0 +1,112 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from sqlmodel import Session
+
+from app import http_clients, token_manager as token_manager_module
+from app.http_clients import ProviderClients
+from app.oauth_models import ServiceAccount
+from app.token_manager import TokenManager
+from tests.conftest import engine
+
+pytestmark = pytest.mark.parametrize(
+    "service_account_session",
+    [{"access_token": "old", "refresh_token": "refresh", "expires_in": 30}],
+    indirect=True,
+)
+
+
+@pytest.fixture(autouse=True)
+def google_provider(monkeypatch):
+    provider = SimpleNamespace(token_url="https://oauth.test/token", web=SimpleNamespace(client_id="id", client_secret="secret"))
+    monkeypatch.setattr(token_manager_module, "providers_registry", lambda: {"google": provider})
+
+
+def test_concurrent_callers_share_one_refresh(service_account_session, monkeypatch):
+    session, account = service_account_session
+    posted = []
+
+    async def respond(request):
+        posted.append(request.content)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"access_token": "new", "expires_in": 3600})
+
+    monkeypatch.setattr(http_clients, "provider_clients", ProviderClients(transport=httpx.MockTransport(respond)))
+    manager = TokenManager(engine=engine)
+
+    async def callers():
+        sessions = [Session(engine) for _ in range(5)]
+        accounts = [caller.get(ServiceAccount, account.id) for caller in sessions]
+        tokens = await asyncio.gather(*(manager.ensure_valid(caller, acc) for caller, acc in zip(sessions, accounts)))
+        for caller in sessions:
+            caller.close()
+        return tokens
+
+    assert asyncio.run(callers()) == ["new"] * 5
+    assert len(posted) == 1 and b"grant_type=refresh_token" in posted[0]
+    assert manager.stats()["refreshes"] == 1 and manager.stats()["joined"] == 4
+
+    # Another process that read the stale row before the refresh finds it
+    # fresh once it holds the lock and does not refresh again.
+    other = TokenManager(engine=engine)
+    asyncio.run(other.refresh(account.id))
+    assert len(posted) == 1 and other.stats()["skipped"] == 1
+
+
+def test_failed_refresh_keeps_a_still_valid_token(service_account_session, monkeypatch):
+    session, account = service_account_session
+    monkeypatch.setattr(http_clients, "provider_clients", ProviderClients(transport=httpx.MockTransport(lambda request: httpx.Response(400, text="invalid_grant"))))
+    manager = TokenManager(engine=engine)
+
+    assert asyncio.run(manager.ensure_valid(session, account)) == "old"
+    assert account.error_count == 1 and "invalid_grant" in account.last_error
+
+
+def test_no_connection_is_held_across_the_provider_call(service_account_session, monkeypatch):
+    session, account = service_account_session
+    account_id = account.id
+    session.commit()
+    checked_out = engine.pool.checkedout()
+    during_call = []
+
+    async def respond(request):
+        during_call.append(engine.pool.checkedout())
+        return httpx.Response(200, json={"access_token": "new", "refresh_token": "rotated", "expires_in": 3600})
+
+    monkeypatch.setattr(http_clients, "provider_clients", ProviderClients(transport=httpx.MockTransport(respond)))
+    manager = TokenManager(engine=engine)
+    asyncio.run(manager.refresh(account_id, force=True))
+
+    assert during_call == [checked_out]
+    refreshed = session.get(ServiceAccount, account_id)
+    assert refreshed.access_token == "new" and refreshed.refresh_token == "rotated"
+
+
+def test_manual_refresh_joins_the_managed_refresh(service_account_session, monkeypatch):
+    from app.token_refresh import refresh_service_account_token
+
+    session, account = service_account_session
+    posted = []
+
+    async def respond(request):
+        posted.append(request.content)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"access_token": "new", "refresh_token": "rotated", "expires_in": 3600})
+
+    monkeypatch.setattr(http_clients, "provider_clients", ProviderClients(transport=httpx.MockTransport(respond)))
+    manager = TokenManager(engine=engine)
+    monkeypatch.setattr("app.token_refresh.token_manager", manager)
+
+    async def both():
+        with Session(engine) as other:
+            other_account = other.get(ServiceAccount, account.id)
+            return await asyncio.gather(
+                manager.ensure_valid(other, other_account),
+                refresh_service_account_token(session, account),
+            )
+
+    token, refreshed = asyncio.run(both())
+    assert len(posted) == 1
+    assert token == "new" and refreshed.access_token == "new" and refreshed.refresh_token == "rotated"
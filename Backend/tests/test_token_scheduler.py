@@ -0,0 +1,137 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import httpx
+from sqlmodel import SQLModel
+import pytest
+
+from app import http_clients, token_manager as token_manager_module
+from app.http_clients import ProviderClients
+from app.oauth2 import get_password_hash
+from app.oauth_models import OAuthConnection, Service, ServiceAccount
+from app.token_manager import TokenManager
+from app.token_scheduler import OAUTH_CONNECTION, SERVICE_ACCOUNT, TokenRefreshScheduler, epoch
+from app.user import User
+from tests.conftest import engine
+
+TABLES = [Service.__table__, ServiceAccount.__table__, OAuthConnection.__table__]
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class RecordingManager:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+
+    async def refresh(self, row_id, force=False, margin=None):
+        self.calls.append((SERVICE_ACCOUNT, row_id, margin))
+        if self.fail:
+            raise RuntimeError("invalid_grant")
+
+    async def refresh_connection(self, row_id, force=False, margin=None):
+        self.calls.append((OAUTH_CONNECTION, row_id, margin))
+
+
+@pytest.fixture
+def token_session(session):
+    SQLModel.metadata.drop_all(engine, tables=TABLES)
+    SQLModel.metadata.create_all(engine, tables=TABLES)
+    yield session
+    SQLModel.metadata.drop_all(engine, tables=TABLES)
+
+
+def test_tokens_are_refreshed_a_margin_before_expiry_in_expiry_order(token_session):
+    now = datetime.utcnow()
+    user = User(email="lee@example.com", name="Lee", hashed_password=get_password_hash("Sup3rSecret!"))
+    google = Service(name="google", display_name="Google", oauth_provider="google")
+    token_session.add_all([user, google])
+    token_session.commit()
+    token_session.add_all([
+        ServiceAccount(user_id=user.id, service_id=google.id, access_token="a", refresh_token="r", expires_at=now + timedelta(seconds=700)),
+        ServiceAccount(user_id=user.id, service_id=google.id, access_token="b", refresh_token="r", expires_at=now + timedelta(seconds=650)),
+        ServiceAccount(user_id=user.id, service_id=google.id, access_token="c", refresh_token=None, expires_at=now + timedelta(seconds=600)),
+        ServiceAccount(user_id=user.id, service_id=google.id, access_token="d", refresh_token="r", expires_at=now + timedelta(days=1)),
+        OAuthConnection(user_id=user.id, provider="github", provider_user_id="1", access_token="e", refresh_token="r", expires_at=now + timedelta(seconds=100)),
+    ])
+    token_session.commit()
+
+    manager = RecordingManager()
+    clock = FakeClock(epoch(now))
+    scheduler = TokenRefreshScheduler(manager=manager, margin=600, clock=clock)
+    assert scheduler.load(token_session, horizon=120) == 3
+
+    due = scheduler.pop_due()
+    assert [(kind, provider) for kind, _, provider, _ in due] == [(OAUTH_CONNECTION, "github")]
+    clock.now += 100
+    due += scheduler.pop_due()
+    assert [kind for kind, _, _, _ in due] == [OAUTH_CONNECTION, SERVICE_ACCOUNT, SERVICE_ACCOUNT]
+
+    async def refresh_all():
+        for entry in due:
+            await scheduler.refresh_one(*entry)
+
+    asyncio.run(refresh_all())
+    assert [call[0] for call in manager.calls] == [OAUTH_CONNECTION, SERVICE_ACCOUNT, SERVICE_ACCOUNT]
+    assert all(call[2] == 600 for call in manager.calls)
+    stats = scheduler.stats()
+    assert stats["refreshed"] == 3 and stats["failures"] == 0
+    assert 599 <= stats["max_lag"] <= 601
+
+
+def test_failing_token_is_given_up_after_max_errors(monkeypatch):
+    from app import token_scheduler
+
+    monkeypatch.setattr(token_scheduler, "TOKEN_REFRESH_MAX_ERRORS", 2)
+    scheduler = TokenRefreshScheduler(manager=RecordingManager(fail=True), margin=600, clock=FakeClock(1000.0))
+
+    for _ in range(3):
+        scheduler.schedule(SERVICE_ACCOUNT, 1, "google", 900.0)
+        for entry in scheduler.pop_due():
+            asyncio.run(scheduler.refresh_one(*entry))
+
+    assert scheduler.stats()["failures"] == 2
+    assert scheduler.stats()["given_up"] == 1
+
+
+def test_token_refreshed_without_an_expiry_is_not_due_again(token_session, monkeypatch):
+    provider = SimpleNamespace(token_url="https://oauth.test/token", web=SimpleNamespace(client_id="id", client_secret="secret"))
+    monkeypatch.setattr(token_manager_module, "providers_registry", lambda: {"google": provider})
+    posted = []
+
+    def respond(request):
+        posted.append(request)
+        return httpx.Response(200, json={"access_token": "new"})
+
+    monkeypatch.setattr(http_clients, "provider_clients", ProviderClients(transport=httpx.MockTransport(respond)))
+
+    user = User(email="lee@example.com", name="Lee", hashed_password=get_password_hash("Sup3rSecret!"))
+    google = Service(name="google", display_name="Google", oauth_provider="google")
+    token_session.add_all([user, google])
+    token_session.commit()
+    account = ServiceAccount(user_id=user.id, service_id=google.id, access_token="old", refresh_token="r",
+                             expires_at=datetime.utcnow() + timedelta(seconds=30))
+    token_session.add(account)
+    token_session.commit()
+
+    scheduler = TokenRefreshScheduler(manager=TokenManager(engine=engine), margin=600)
+
+    async def scan():
+        scheduler.load(token_session)
+        for entry in scheduler.pop_due():
+            await scheduler.refresh_one(*entry)
+
+    asyncio.run(scan())
+    asyncio.run(scan())
+
+    assert len(posted) == 1
+    assert len(scheduler) == 0 and scheduler.stats()["refreshed"] == 1
+    token_session.refresh(account)
+    assert account.access_token == "new" and account.expires_at is None
@@ -0,0 +1,152 @@
+from datetime import timedelta
+
+import pytest
+from sqlmodel import SQLModel
+
+from app.action import Action
+from app.oauth2 import create_access_token, get_password_hash
+from app.oauth_models import Area, Service, UserServiceSubscription
+from app.poll_scheduler import PollScheduler
+from app.reaction import Reaction
+from app.routers import areas as areas_module
+from app.trigger_index import IndexedArea, TriggerBucket, TriggerIndex
+from app.user import User
+from tests.conftest import engine
+
+AREA_TABLES = [Service.__table__, Action.__table__, Reaction.__table__, Area.__table__, UserServiceSubscription.__table__]
+
+
+def make_area(area_id, **params_action):
+    return IndexedArea(
+        id=area_id,
+        user_id=1,
+        name=f"area {area_id}",
+        action_id=1,
+        reaction_id=1,
+        reaction_name="GitHub - Create Issue",
+        reaction_key="create_issue",
+        reaction_service_name="github",
+        params_action=params_action,
+    )
+
+
+def candidate_ids(bucket, payload):
+    return [area.id for area in bucket.candidates(payload)]
+
+
+def test_candidates_narrowed_to_matching_value_and_wildcards():
+    bucket = TriggerBucket()
+    bucket.add(make_area(1, **{"repository.full_name": "octo/a"}))
+    bucket.add(make_area(2, **{"repository.full_name": "octo/b"}))
+    bucket.add(make_area(3, **{"repository.full_name": ""}))
+    bucket.add(make_area(4))
+
+    assert candidate_ids(bucket, {"repository.full_name": "octo/a"}) == [1, 3, 4]
+    assert candidate_ids(bucket, {"repository.full_name": "octo/c"}) == [3, 4]
+
+
+def test_missing_payload_value_keeps_every_area():
+    bucket = TriggerBucket()
+    bucket.add(make_area(1, board_id="b1"))
+    bucket.add(make_area(2, board_id="b2"))
+
+    assert candidate_ids(bucket, {"card.id": "c1"}) == [1, 2]
+    assert candidate_ids(bucket, None) == [1, 2]
+
+
+def test_most_selective_key_is_used():
+    bucket = TriggerBucket()
+    bucket.add(make_area(1, **{"repository.full_name": "octo/a", "branch": "main"}))
+    bucket.add(make_area(2, **{"repository.full_name": "octo/b", "branch": "main"}))
+    bucket.add(make_area(3, branch="dev"))
+
+    payload = {"repository.full_name": "octo/a", "branch": "main"}
+    assert candidate_ids(bucket, payload) == [1, 3]
+
+
+def test_remove_and_readd_update_the_index():
+    bucket = TriggerBucket()
+    bucket.add(make_area(1, board_id="b1"))
+    bucket.add(make_area(2, board_id="b2"))
+
+    bucket.remove(1)
+    assert candidate_ids(bucket, {"board_id": "b1"}) == []
+
+    bucket.add(make_area(2, board_id="b1"))
+    assert candidate_ids(bucket, {"board_id": "b1"}) == [2]
+    assert candidate_ids(bucket, {"board_id": "b2"}) == []
+
+
+@pytest.fixture
+def area_api(client, session, monkeypatch):
+    SQLModel.metadata.drop_all(engine, tables=AREA_TABLES)
+    SQLModel.metadata.create_all(engine, tables=AREA_TABLES)
+    index = TriggerIndex(max_age=0)
+    monkeypatch.setattr(areas_module, "trigger_index", index)
+    monkeypatch.setattr(areas_module, "poll_scheduler", PollScheduler())
+
+    user = User(email="noor@example.com", name="Noor", hashed_password=get_password_hash("Sup3rSecret!"))
+    github = Service(name="github", display_name="GitHub")
+    discord = Service(name="discord", display_name="Discord")
+    session.add_all([user, github, discord])
+    session.commit()
+    action = Action(name="GitHub - Push", service_id=github.id, parameters={}, is_polling=True)
+    reaction = Reaction(name="Discord - Send Webhook Message", service_id=discord.id)
+    session.add_all([action, reaction])
+    session.commit()
+
+    token = create_access_token(data={"sub": user.email}, expires=timedelta(minutes=5))
+    ids = {"action_service_id": github.id, "action_id": action.id, "reaction_service_id": discord.id, "reaction_id": reaction.id}
+    yield client, session, index, {"Authorization": f"Bearer {token}"}, ids
+    SQLModel.metadata.drop_all(engine, tables=AREA_TABLES)
+
+
+def create_area(client, headers, ids, repository):
+    response = client.post("/areas/", headers=headers, json={
+        **ids,
+        "action_parameters": {"repository.full_name": repository},
+        "reaction_parameters": {"content": "pushed"},
+    })
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def lookup_ids(index, session, repository):
+    return [area.id for area in index.lookup(session, "github", "push", {"repository.full_name": repository})]
+
+
+def test_lookup_follows_areas_created_toggled_and_deleted_through_the_router(area_api):
+    client, session, index, headers, ids = area_api
+    first = create_area(client, headers, ids, "octo/a")
+
+    # The first lookup builds the index from the table.
+    assert lookup_ids(index, session, "octo/a") == [first]
+    second = create_area(client, headers, ids, "octo/b")
+    assert lookup_ids(index, session, "octo/b") == [second]
+    assert lookup_ids(index, session, "octo/c") == []
+
+    assert client.patch(f"/areas/{first}/toggle", headers=headers).status_code == 200
+    assert lookup_ids(index, session, "octo/a") == []
+    assert client.patch(f"/areas/{first}/toggle", headers=headers).status_code == 200
+    assert lookup_ids(index, session, "octo/a") == [first]
+
+    assert client.delete(f"/areas/{second}", headers=headers).status_code == 204
+    assert lookup_ids(index, session, "octo/b") == []
+    assert [area.id for area in index.lookup(session, "github", "push")] == [first]
+
+
+def test_stale_index_is_rebuilt_from_the_table(area_api):
+    client, session, index, headers, ids = area_api
+    index.max_age = 300
+    first = create_area(client, headers, ids, "octo/a")
+    assert lookup_ids(index, session, "octo/a") == [first]
+
+    # A change made by another process is only seen after a rebuild.
+    session.add(Area(user_id=session.get(Area, first).user_id, action_service_id=ids["action_service_id"], action_id=ids["action_id"],
+                     reaction_service_id=ids["reaction_service_id"], reaction_id=ids["reaction_id"],
+                     params_action={"repository.full_name": "octo/a"}, params_reaction={}))
+    session.commit()
+    assert lookup_ids(index, session, "octo/a") == [first]
+
+    index._loaded_at -= 301
+    assert len(lookup_ids(index, session, "octo/a")) == 2
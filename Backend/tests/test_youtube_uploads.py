@@ -0,0 +1,86 @@
+import asyncio
+
+import httpx
+import pytest
+from sqlmodel import SQLModel
+
+from app import http_clients, conditional_requests, poll_state
+from app.action import Action
+from app.handlers import google
+from app.handlers.google import GoogleYoutubeNewUploadHandler
+from app.http_clients import ProviderClients
+from app.oauth_models import Area
+from app.poll_state import PollState, PollStateStore
+from tests.conftest import engine
+
+
+@pytest.fixture
+def state_session(session, monkeypatch):
+    SQLModel.metadata.drop_all(engine, tables=[PollState.__table__])
+    SQLModel.metadata.create_all(engine, tables=[PollState.__table__])
+    store = PollStateStore()
+    monkeypatch.setattr(poll_state, "poll_state_store", store)
+    monkeypatch.setattr(conditional_requests, "poll_state_store", store)
+    monkeypatch.setattr(google, "YOUTUBE_API_KEY", "api-key")
+    yield session
+    SQLModel.metadata.drop_all(engine, tables=[PollState.__table__])
+
+
+def upload(video_id, published):
+    return {"snippet": {"title": video_id}, "contentDetails": {"videoId": video_id, "videoPublishedAt": published}}
+
+
+def test_uploads_playlist_is_polled_once_per_channel_with_etags(state_session, monkeypatch):
+    pages = [
+        ('"e1"', [upload("v1", "2024-01-01T00:00:00Z")]),
+        ('"e2"', [upload("v3", "2024-01-03T00:00:00Z"), upload("v2", "2024-01-02T00:00:00Z"), upload("v1", "2024-01-01T00:00:00Z")]),
+    ]
+    requests = []
+
+    def respond(request):
+        requests.append(request)
+        assert request.url.path.endswith("/playlistItems")
+        assert request.url.params["playlistId"] == "UUabc" and request.url.params["key"] == "api-key"
+        if pages and request.headers.get("if-none-match") != pages[0][0]:
+            etag, items = pages.pop(0)
+            return httpx.Response(200, json={"items": items}, headers={"ETag": etag})
+        return httpx.Response(304)
+
+    monkeypatch.setattr(http_clients, "provider_clients", ProviderClients(transport=httpx.MockTransport(respond)))
+    handler = GoogleYoutubeNewUploadHandler()
+    assert handler.coalescing_key(1, {"channel_id": "UCabc"}) == handler.coalescing_key(2, {"channel_id": " UCabc "})
+
+    params = {"channel_id": "UCabc"}
+    assert asyncio.run(handler.poll(state_session, 1, params)) == []
+    results = asyncio.run(handler.poll(state_session, 2, params))
+    assert [result.payload["video.id"] for result in results] == ["v2", "v3"]
+    assert asyncio.run(handler.poll(state_session, 1, params)) == []
+    assert requests[-1].headers["if-none-match"] == '"e2"'
+
+
+def test_without_an_api_key_the_feed_borrows_another_watchers_account(service_account_session, monkeypatch):
+    session, account = service_account_session
+    SQLModel.metadata.create_all(engine, tables=[Action.__table__, Area.__table__])
+    action = Action(name="Google - YouTube - New Channel Upload", service_id=account.service_id, parameters={}, is_polling=True)
+    session.add(action)
+    session.commit()
+    session.add(Area(user_id=account.user_id, action_service_id=account.service_id, action_id=action.id,
+                     reaction_service_id=account.service_id, reaction_id=1, params_action={"channel_id": "UCabc"}))
+    session.commit()
+    monkeypatch.setattr(google, "YOUTUBE_API_KEY", None)
+    authorizations = []
+
+    def respond(request):
+        authorizations.append(request.headers.get("authorization"))
+        return httpx.Response(200, json={"items": [upload("v1", "2024-01-01T00:00:00Z")]})
+
+    monkeypatch.setattr(http_clients, "provider_clients", ProviderClients(transport=httpx.MockTransport(respond)))
+    handler = GoogleYoutubeNewUploadHandler()
+    try:
+        # The feed's own user has disconnected Google.
+        assert asyncio.run(handler.poll(session, account.user_id + 100, {"channel_id": "UCabc"})) == []
+        assert authorizations == ["Bearer token"]
+        assert asyncio.run(handler.poll(session, account.user_id + 100, {"channel_id": "UCother"})) == []
+        assert authorizations == ["Bearer token"]
+    finally:
+        SQLModel.metadata.drop_all(engine, tables=[Action.__table__, Area.__table__])